@@ -0,0 +1,401 @@
+#the benchmark suite for the code that runs on every frame: the trail's collision check, the trail's step (with its subdivision loop),
+#the grid fade and a whole TronGame.update. every workload is scripted from a fixed seed, so two runs always do exactly the same work.
+#the startup workloads time whole new python processes instead: importing the game logic, and `python game.py` until its first frame.
+#usage:
+#   python bench.py                     runs everything, prints the latency percentiles of every call and compares them with
+#                                       bench_baseline.json. exits with 1 if anything got more than --tolerance slower than there
+#   python bench.py --save-baseline     runs everything 3 times and stores the median results as the new baseline
+#   python bench.py --only collides     only runs the workloads that have "collides" in their name
+#   python bench.py --json out.json     also writes the results to out.json
+#microseconds on one machine mean nothing on another one (or on the same one while something else runs), so the baseline doesn't
+#store them: in between the calls of every workload a fixed loop of plain python (calibrate) is timed too, and the baseline
+#stores how many of those loops the workload's p50 and p90 take. a faster or slower machine makes both faster or slower, so the
+#ratio stays about the same. it is still noisy (on a busy machine with one core a single run lands up to 1.6 times above the
+#median of ten), so the default --tolerance is 2: it catches a hot path that got a lot slower, not a few percent.
+#the baseline is only re-saved on purpose, in a commit of its own that says why: a change that also re-saves it would move the bar
+#it is measured against.
+#the view workloads (grid fade and the whole frame) need ursina. they are skipped if it is not installed.
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from tron import DT, TICK_RATE, Match, Trail
+from tron.rewind import Rewind
+from tron.sim import ARENA_BOUNDS
+from tron.telemetry import Telemetry
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(ROOT, "bench_baseline.json")
+CHECKED = ("p50", "p90")    #the percentiles that are compared with the baseline (p99 and max are too noisy for that)
+CALIBRATION_CALLS = 2000    #how many times the calibration loop is timed along with every workload
+
+def random_walk(rng, steps, speed=20.0, bounds=ARENA_BOUNDS):
+    #the positions of a bike wandering around the arena for steps ticks: it goes straight or turns for a while, like the ai does,
+    #and bounces off the walls. at speed 20 every tick moves it 0.33 units, which makes one trail segment per tick (no subdivision)
+    x, z = rng.uniform(-bounds/2, bounds/2), rng.uniform(-bounds/2, bounds/2)
+    heading = rng.uniform(0, 360)
+    turning, timer = 0, 0
+    points = []
+    for _ in range(steps):
+        timer -= 1
+        if timer <= 0:
+            timer = rng.randint(10, 40)
+            turning = rng.choice((0, 0, -1, 1))
+        heading += turning * 170.0 * DT
+        h = math.radians(heading)
+        x += math.sin(h) * speed * DT
+        z += math.cos(h) * speed * DT
+        if abs(x) > bounds: x = math.copysign(bounds, x); heading = -heading
+        if abs(z) > bounds: z = math.copysign(bounds, z); heading = 180 - heading
+        points.append((x, z))
+    return points
+
+def make_trail(rng, steps):
+    trail = Trail()
+    points = random_walk(rng, steps)
+    for x, z in points: trail.step(x, z)
+    return trail, points
+
+def query_points(rng, points, n, bounds=ARENA_BOUNDS):
+    #where the bikes are when the collision checks are done: half of them right next to the trail (where the distance test has
+    #to be done) and half anywhere in the arena (which is mostly empty space)
+    queries = []
+    for i in range(n):
+        if i % 2:
+            x, z = rng.choice(points)
+            queries.append((x + rng.uniform(-0.6, 0.6), z + rng.uniform(-0.6, 0.6)))
+        else:
+            queries.append((rng.uniform(-bounds, bounds), rng.uniform(-bounds, bounds)))
+    return queries
+
+# The workloads. each one gets its own rng and returns (function, list of argument tuples), and the function is timed once per tuple
+
+def collides_short(rng):
+    trail, points = make_trail(rng, 60)
+    return trail.collides, query_points(rng, points, 20000)
+
+def collides_1000(rng):
+    trail, points = make_trail(rng, 1500)   #more steps than max_segments, so the ring buffer has already wrapped around
+    return trail.collides, query_points(rng, points[-1000:], 20000)
+
+def collides_arena_8(rng):
+    #8 bikes with full trails in the same arena: one call checks one bike against every trail (what a multi-bike tick does per bike)
+    trails = [make_trail(rng, 1200) for _ in range(8)]
+    points = [p for _, pts in trails for p in pts[-1000:]]
+    trails = [t for t, _ in trails]
+    def check(x, z):
+        for trail in trails:
+            if trail.collides(x, z): return True
+        return False
+    return check, query_points(rng, points, 5000)
+
+def step_normal(rng):
+    #normal ticks at speeds from 10 to 30 (one, sometimes two segments per tick). the trail is full after the first 1000 calls,
+    #so most of the calls also evict the oldest segment
+    trail = Trail()
+    points = []
+    for speed in (10.0, 20.0, 30.0):
+        points.extend(random_walk(rng, 10000, speed=speed))
+    return trail.step, points
+
+def step_lag(rng):
+    #lag spikes: every call jumps by what 0.1 to 0.5 seconds of driving at speed 30 covers (3 to 15 units), so every call goes
+    #through the subdivision loop and adds 18 to 90 segments
+    trail = Trail()
+    x, z, heading = 0.0, 0.0, 0.0
+    points = []
+    for _ in range(3000):
+        heading += rng.uniform(-60, 60)
+        dist = 30.0 * rng.uniform(0.1, 0.5)
+        h = math.radians(heading)
+        x = max(-ARENA_BOUNDS, min(ARENA_BOUNDS, x + math.sin(h)*dist))
+        z = max(-ARENA_BOUNDS, min(ARENA_BOUNDS, z + math.cos(h)*dist))
+        points.append((x, z))
+    return trail.step, points
+
+def match_tick(rng):
+    #a whole headless tick of an ai against ai match (both bikes move, the collision checks, the winner check). a new match is
+    #started from the next seed whenever one is over
+    state = {"match": Match(seed=rng.getrandbits(32), player_ai={})}
+    def tick():
+        match = state["match"]
+        if match.over:
+            match = state["match"] = Match(seed=rng.getrandbits(32), player_ai={})
+        match.step()
+    return tick, [()] * 20000
+
+def telemetry_tick(rng):
+    #match.step with a tron.telemetry.Telemetry recording it (into a temporary folder): what the statistics cost the game's thread.
+    #the ticks that take a sample are the p90 ones
+    telemetry = Telemetry(tempfile.mkdtemp(prefix="tron_bench_"))
+    state = {"match": None}
+    def tick():
+        match = state["match"]
+        if match is None or match.over:
+            match = state["match"] = Match(seed=rng.getrandbits(32), player_ai={})
+            match.telemetry = telemetry
+        match.step()
+    return tick, [()] * 20000
+
+def low_rate_tick(rng):
+    #the same at 20 ticks per second: every tick moves the bikes 3 times as far, and the swept collision checks (Match's ccd) make
+    #sure they still can't jump over a trail. a second of match costs 20 of these instead of 60 of the ones above
+    state = {"match": Match(seed=rng.getrandbits(32), player_ai={}, dt=1/20)}
+    def tick():
+        match = state["match"]
+        if match.over:
+            match = state["match"] = Match(seed=rng.getrandbits(32), player_ai={}, dt=1/20)
+        match.step()
+    return tick, [()] * 10000
+
+def planner_tick(rng):
+    #the same, with both bikes driven by the planner brain (tron.planner): the flood fills run on the ticks the bikes think on
+    state = {"match": Match(seed=rng.getrandbits(32), player_ai={"planner": "voronoi"}, ai={"planner": "flood"})}
+    def tick():
+        match = state["match"]
+        if match.over or match.tick >= 3600:
+            match = state["match"] = Match(seed=rng.getrandbits(32), player_ai={"planner": "voronoi"}, ai={"planner": "flood"})
+        match.step()
+    return tick, [()] * 20000
+
+def roster_tick(rng):
+    #a tick of a 32 bike match (random ai brains). the collision checks only look at the trails the broadphase finds near each bike,
+    #so this should cost about 16 times a 2 bike tick, not 256 times
+    roster = [{"name": f"bike {k}"} for k in range(32)]
+    state = {"match": Match(seed=rng.getrandbits(32), roster=roster)}
+    def tick():
+        match = state["match"]
+        if match.over:
+            match = state["match"] = Match(seed=rng.getrandbits(32), roster=roster)
+        match.step()
+    return tick, [()] * 10000
+
+def rewound_match(rng, seconds):
+    #a 4 bike match of planner brains (they live long enough for their trails to be full) played for seconds with a Rewind
+    roster = [{"name": f"bike {k}", "policy": {"planner": "flood"}} for k in range(4)]
+    while True:
+        match = Match(seed=rng.getrandbits(32), roster=roster)
+        rewind = Rewind(match, seconds=seconds)
+        while not match.over and match.tick < seconds * TICK_RATE:
+            match.step()
+            rewind.record()
+        if not match.over: return match, rewind
+
+def match_snapshot(rng):
+    #one snapshot of that match (a Rewind takes one every 6 ticks): it doesn't copy the trails, so it doesn't get slower with them
+    match, _ = rewound_match(rng, 20)
+    return match.snapshot, [()] * 20000
+
+def match_rewind(rng):
+    #going 3 seconds back in it (the R of the practice mode): the pieces of the last 3 seconds are taken out and the evicted ones
+    #are put back. every call goes another 3 seconds further back, in 4 matches of 30 seconds
+    rewinds = [rewound_match(rng, 30)[1] for _ in range(4)]
+    return (lambda rewind: rewind.back(3 * TICK_RATE)), [(rewind,) for rewind in rewinds for _ in range(9)]
+
+def import_tron(rng):
+    #a new python that only imports the game logic (what every headless tool pays before it can start: tron.replay, tron.net...)
+    command = [sys.executable, "-c", "import tron"]
+    return (lambda: subprocess.run(command, cwd=ROOT, check=True)), [()] * 20
+
+def load_view():
+    #starts ursina without a window and imports the view classes from game.py. returns None if ursina is not installed
+    try:
+        from panda3d.core import loadPrcFileData
+    except ImportError:
+        return None
+    loadPrcFileData("", "window-type none\naudio-library-name null")
+    from ursina import Ursina
+    Ursina(window_type="none")
+    import game
+    return game
+
+def grid_fade(rng, view):
+    grid = view.Grid(size=ARENA_BOUNDS)
+    positions = [view.Vec3(rng.uniform(-ARENA_BOUNDS, ARENA_BOUNDS), 0, rng.uniform(-ARENA_BOUNDS, ARENA_BOUNDS)) for _ in range(20000)]
+    return grid.update_fade, [(p,) for p in positions]
+
+def game_update(rng, view):
+    #whole frames of the game: W is held, A and D are pressed now and then, and 2% of the frames are lag spikes of 0.1 seconds
+    #(6 ticks in one frame). a new match is started (outside of the timed call) whenever one is over
+    game = view.TronGame()
+    view.held_keys["w"] = 1
+    frames = []
+    steer = 0
+    for _ in range(6000):
+        if rng.random() < 0.03: steer = rng.choice((-1, 0, 0, 1))
+        frames.append((0.1 if rng.random() < 0.02 else DT, steer))
+    def frame(dt, steer):
+        if game.over: game.restart()
+        view.time.dt = dt
+        view.held_keys["a"] = 1 if steer < 0 else 0
+        view.held_keys["d"] = 1 if steer > 0 else 0
+        game.update()
+    return frame, frames
+
+def first_frame(rng, view):
+    #`python game.py` from the start of the process until its first frame is drawn (--time-startup quits right after it), without
+    #a window so that it also runs on machines without a screen
+    command = [sys.executable, os.path.join(ROOT, "game.py"), "--time-startup", "--no-window"]
+    return (lambda: subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)), [()] * 5
+
+WORKLOADS = [
+    ("trail.collides/short", collides_short),
+    ("trail.collides/1000", collides_1000),
+    ("trail.collides/arena_8", collides_arena_8),
+    ("trail.step/normal", step_normal),
+    ("trail.step/lag_spikes", step_lag),
+    ("match.step", match_tick),
+    ("match.step/telemetry", telemetry_tick),
+    ("match.step/20hz", low_rate_tick),
+    ("match.step/planner", planner_tick),
+    ("match.step/roster_32", roster_tick),
+    ("match.snapshot", match_snapshot),
+    ("match.rewind/3s", match_rewind),
+    ("startup/import_tron", import_tron),
+]
+VIEW_WORKLOADS = [
+    ("grid.update_fade", grid_fade),
+    ("game.update", game_update),
+    ("startup/first_frame", first_frame),
+]
+
+def timed(fn, calls, calibration=0):
+    #times every single call (in nanoseconds). the garbage collector is left on, a frame in the game does not get to switch it off.
+    #with calibration, that many calls of the calibration loop are timed too, spread evenly in between the calls of fn (so that
+    #both are measured while the machine is in the same mood), and returned as a second list
+    clock = time.perf_counter_ns
+    n = len(calls)
+    out = [0] * n
+    loops = []
+    for i, args in enumerate(calls):
+        for _ in range((i+1) * calibration // n - i * calibration // n):
+            t = clock()
+            calibrate()
+            loops.append(clock() - t)
+        t = clock()
+        fn(*args)
+        out[i] = clock() - t
+    return (out, loops) if calibration else out
+
+class Dot:
+    #a made up bike for the calibration loop
+    __slots__ = ("x", "z")
+    def __init__(self, x, z):
+        self.x, self.z = x, z
+    def move(self, dx, dz):
+        self.x += dx
+        self.z += dz
+        return math.hypot(self.x, self.z)
+
+#what the calibration loop walks through: far more objects and dict entries than fit in the cpu's caches, like the trails, the
+#spatial hash and the grids of a match. (a loop that only touches a few objects runs from the cache, and its speed then changes
+#with the cpu's clock in a way the game's code doesn't follow)
+CALIBRATION_DOTS = [Dot(k * 0.001, k * -0.002) for k in range(50000)]
+CALIBRATION_CELLS = {(k % 211, k // 211): k * 0.5 for k in range(50000)}
+calibration_at = [0]
+
+def calibrate(n=100):
+    #the calibration loop: the kind of work the game's python does (objects with attributes, method calls, float math, dict
+    #lookups, all over memory), and nothing that depends on the game's code, so a change to the game can never change its time
+    dots, cells = CALIBRATION_DOTS, CALIBRATION_CELLS
+    k = calibration_at[0]
+    total = 0.0
+    for _ in range(n):
+        k = (k + 7919) % 50000     #(jumps around, so that it doesn't walk the memory in order)
+        dot = dots[k]
+        total += dot.move(0.01, -0.01) + cells.get((k % 211, k // 211), 0.0)
+        if dot.x > 10.0: dot.x = -10.0
+    calibration_at[0] = k
+    return total
+
+def percentiles(samples):
+    s = sorted(samples)
+    n = len(s)
+    pick = lambda q: s[min(n-1, int(q*n))] / 1000.0     #in microseconds
+    return {"calls": n, "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": s[-1] / 1000.0}
+
+def run_workloads(workloads, seed):
+    #runs the workloads once and prints their latencies. returns name -> percentiles(), with their "relative" ones in calibration loops
+    results = {}
+    all_loops = []
+    print(f"{'workload':<26}{'calls':>8}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'max us':>10}{'calib us':>10}")
+    for name, make, view in workloads:
+        rng = random.Random(f"{seed}/{name}")   #every workload has its own rng, so --only does not change what the others do
+        fn, calls = make(rng) if view is None else make(rng, view)
+        samples, loops = timed(fn, calls, CALIBRATION_CALLS)
+        all_loops += loops
+        r = results[name] = percentiles(samples)
+        r["calibration"] = percentiles(loops)["p50"]
+        print(f"{name:<26}{r['calls']:>8}{r['p50']:>10.2f}{r['p90']:>10.2f}{r['p99']:>10.2f}{r['max']:>10.1f}{r['calibration']:>10.2f}")
+    #the unit is the median calibration loop of the whole run: a workload of a few long calls (the startup ones) only gets a few
+    #bursts of the loop in between, and those can just catch a moment where the machine is faster or slower than during the calls
+    unit = percentiles(all_loops)["p50"] if all_loops else 1.0
+    print(f"calibration loop: {unit:.2f}us")
+    for r in results.values(): r["relative"] = {q: r[q] / unit for q in CHECKED}
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the per-frame hot paths of the game.")
+    parser.add_argument("--only", default="", help="only run the workloads with this in their name")
+    parser.add_argument("--seed", type=int, default=1234, help="seed of the scripted workloads (default 1234)")
+    parser.add_argument("--baseline", default=BASELINE, help="the baseline file (default bench_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results of this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=2.0,
+                        help="how many times slower than the baseline (relative to the calibration loop) a workload may get")
+    parser.add_argument("--runs", type=int, default=0,
+                        help="run everything this many times and compare the median (default 1, or 3 with --save-baseline)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    workloads = [(name, make, None) for name, make in WORKLOADS if args.only in name]
+    if any(args.only in name for name, _ in VIEW_WORKLOADS):
+        view = load_view()
+        if view is None:
+            print("ursina is not installed, skipping the view workloads")
+        else:
+            workloads += [(name, make, view) for name, make in VIEW_WORKLOADS if args.only in name]
+
+    runs = [run_workloads(workloads, args.seed) for _ in range(args.runs or (3 if args.save_baseline else 1))]
+    results = runs[-1]
+    if len(runs) > 1:   #(the median of the runs, so that one run that was unlucky doesn't decide)
+        for name, r in results.items():
+            r["relative"] = {q: sorted(run[name]["relative"][q] for run in runs)[len(runs) // 2] for q in CHECKED}
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+
+    #the baseline: {"workloads": {name: {"p50": ..., "p90": ...}}}, every number in calibration loops (see the top)
+    baseline = {"workloads": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f: baseline = json.load(f)
+    if "workloads" not in baseline:
+        if not args.save_baseline:
+            print(f"{args.baseline} is in the old format of absolute microseconds, run with --save-baseline to make a new one")
+        baseline = {"workloads": {}}
+    if args.save_baseline:
+        for name, r in results.items():     #(the workloads that were not run this time keep what they had)
+            baseline["workloads"][name] = {q: round(r["relative"][q], 5) for q in CHECKED}
+        with open(args.baseline, "w") as f: json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"saved the baseline to {args.baseline}")
+        return 0
+
+    if not baseline["workloads"]:
+        print(f"no baseline at {args.baseline} (run with --save-baseline to make one)")
+        return 0
+    failed = []
+    for name, r in results.items():
+        for q, was in baseline["workloads"].get(name, {}).items():
+            now = r["relative"][q]
+            if now > was * args.tolerance:
+                failed.append(f"{name} {q} {now:.4g} calibration loops ({r[q]:.2f}us) > {was:.4g} x {args.tolerance}")
+    for line in failed: print("REGRESSION:", line)
+    if not failed: print(f"all workloads are within {args.tolerance}x of the baseline")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,20 @@
+import time
+STARTED = time.perf_counter()   #when game.py started to load (main() measures the time to the first frame from here)
 from ursina import *    #ursina is a free 3D game engine for python
                         #"from ursina import *" means to import everything from the ursina library
-from ursina.shaders import unlit_shader 
-#the unlit_shader is a program in the ursina.shaders module that lets us create graphics which are not affected by lighting, i.e.
-#shadows, lights do not have any effect on these graphics. they appear the same in all lighting conditions
+import atexit
 import math
-import random
+import os
 import sys
-#importing these modules (math,random,sys) for use further down the road
+from array import array
+from panda3d.core import TransparencyAttrib     #(panda3d is the engine ursina is built on)
+#importing these modules (math,sys,array) for use further down the road
+from tron import DT, TICK_RATE, FrameProfiler, Match
+from tron.arena import SquareArena, parse_arena
+from tron.sim import SKIP_RECENT
+from tron.replay import Recorder, Replay
+from tron.rewind import Rewind
+#the headless simulation core of the game (bikes, trails, collisions, who wins). this file is only the view on top of it
 
 #what is __init__ : it is a constructor. also called a "dunder method". it starts and ends with a double underscore. 
 #another example for a dunder method is the __str__ constructor. 
@@ -19,6 +27,47 @@ BIKE_COLORS = [{"name": "Tron Colors", "player": (0, 255, 230, 255), "ai": (255,
 #A=0 : Fully Transparent. A=110(ar any value inbetween 0 and 255) : Translucent. A=255 : Fully Opaque
 #the key "player" indicates he colour for the car of the player(the user), and the key "ai" will be the colour for the ai cars
 
+#the policy of the ai bike (the arguments of tron.sim.AIBike). {"planner": "flood"} or {"planner": "voronoi"} gives it the smarter
+#brain from tron.planner that looks ahead for trails and open space instead of turning at random. {"brain": "flood"} runs that
+#search in a worker process instead (see tron.brains), with a much bigger budget and without ever holding up a frame
+AI_POLICY = {}
+PLAN_SECONDS = 0.002    #the most time the smarter ai may spend thinking in one simulation tick
+
+#the most simulation ticks one frame may catch up on. after a long hitch (loading, dragging the window...) the rest of the missed
+#time is dropped and the game just continues a little later, instead of trying to simulate all of it in one frame, which would make
+#that frame slow too and start a spiral of ever longer frames. the outcome of a match never depends on it, the ticks are always DT
+MAX_CATCH_UP = 8
+
+#practice mode: R takes the match REWIND_SECONDS back in time (a crash too), to try that bit again. it can go back as far as
+#REWIND_KEEP seconds with a few presses. (not while recording a match: the file has every tick's inputs one after the other)
+REWIND_SECONDS = 3
+REWIND_KEEP = 15.0
+
+#adaptive quality: when the frames take longer than FRAME_BUDGET for a while, the game draws less (one QUALITY_LEVELS step down),
+#and when they are back within it for a while it goes back up. every level is (the distance from the camera beyond which trail
+#chunks are drawn coarse, the distance from the player's car beyond which grid tiles are not drawn at all, None for all of them)
+FRAME_BUDGET = 1/60
+QUALITY_LEVELS = ((60.0, None), (36.0, 96.0), (20.0, 60.0))
+LOD_INTERVAL = 10   #how many frames go by between two updates of the trails' lod (the camera doesn't move far in 10 frames)
+
+#None is the normal game: you against one ai bike. a list plays a bigger match instead (see tron.sim.Match for what goes in it),
+#a human bike can also say which keys drive it as "keys": (forward, reverse, left, right). for example, you against 7 smart ai bikes:
+#ROSTER = [{"name": "player", "human": True}] + [{"name": f"ai {k}", "policy": {"planner": "flood"}} for k in range(1, 8)]
+ROSTER = None
+DEFAULT_KEYS = ('w', 's', 'a', 'd')
+#the colours of the bikes of a ROSTER that are not called "player" or "ai" (they take turns)
+ROSTER_COLORS = [(255, 60, 200, 255), (120, 255, 60, 255), (255, 240, 60, 255), (140, 110, 255, 255), (255, 255, 255, 255),
+                 (60, 140, 255, 255)]
+
+#the arena the game is played in (see tron.arena): "square:72" is the classic one, "circle:120" a round one, "square:1000" a huge
+#one... (python game.py --arena circle:120 picks one for a single run). the floor's grid is only built around the player's car, so
+#the size doesn't make the start slower or take more memory
+ARENA = "square:72"
+
+#a folder to write the statistics of every match and the frame time spikes into while playing (see tron.telemetry), None for no
+#telemetry. python game.py --telemetry FOLDER turns it on for a single run
+TELEMETRY = None
+
 GRID_COLOR = (70, 200, 255, 255)     #bright neon blue grid
 WALL_COLOR = (255, 200, 150, 110)    #peach orange colour
 
@@ -91,214 +140,405 @@ class ChaseCam: #the class for a third person camera that follows the player's c
         #basically tilts the camera based on how we use the A and D keys to move the car sideways. Now the use of the lerp() here is
         #that it makes the tilting process very smooth
 
+# The shaders of the game (small programs that run on the graphics card and work out the colour of every pixel)
+#the unlit shader draws graphics which are not affected by lighting, i.e. shadows, lights do not have any effect on them. they appear
+#the same in all lighting conditions. (ursina has one too, but `from ursina.shaders import unlit_shader` loads all 20 of ursina's
+#shaders to get it, which was about a quarter of the game's start. none of our graphics has a texture, so ours is even simpler)
+UNLIT_VERTEX = '''#version 130
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+in vec4 p3d_Vertex;
+in vec4 p3d_Color;
+out vec4 vertex_color;
+
+void main() {
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+    vertex_color = p3d_Color;
+}
+'''
+UNLIT_FRAGMENT = '''#version 140
+
+uniform vec4 p3d_ColorScale;
+in vec4 vertex_color;
+out vec4 fragColor;
+
+void main() {
+    fragColor = p3d_ColorScale * vertex_color;
+}
+'''
+#the grid fade shader fades the grid lines based on how far each line is from the player's car
+GRID_FADE_VERTEX = '''#version 130
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform vec4 p3d_ColorScale;
+uniform vec2 player_pos;
+uniform float fade;
+in vec4 p3d_Vertex;
+in vec2 p3d_MultiTexCoord0;
+out vec4 line_color;
+
+void main() {
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+    // texcoord x is 0 for a line that runs along z (it sits at a fixed x) and 1 for a line that runs along x (fixed z).
+    // texcoord y is that fixed x or z coordinate of the line.
+    float d = abs(p3d_MultiTexCoord0.y - (p3d_MultiTexCoord0.x < 0.5 ? player_pos.x : player_pos.y));
+    float f = fade > 0.0 ? max(0.0, 1.0 - (d / fade) * (d / fade)) : 1.0;
+    line_color = vec4(p3d_ColorScale.rgb, p3d_ColorScale.a * f);
+}
+'''
+GRID_FADE_FRAGMENT = '''#version 140
+
+in vec4 line_color;
+out vec4 fragColor;
+
+void main() {
+    fragColor = line_color;
+}
+'''
+SHADER_SOURCES = {
+    "unlit": (UNLIT_VERTEX, UNLIT_FRAGMENT, {}),
+    "grid_fade": (GRID_FADE_VERTEX, GRID_FADE_FRAGMENT, {'player_pos': Vec2(0, 0), 'fade': 48.0}),
+}
+SHADERS = {}    #the shaders that were already made, by name
+
+def get_shader(name):
+    #the shader called name, made the first time it is asked for and reused after that. (making a Shader is slow for what it does,
+    #ursina reads the source of every function that is running at that moment, so importing game.py doesn't make any)
+    if name not in SHADERS:
+        vertex, fragment, default_input = SHADER_SOURCES[name]
+        SHADERS[name] = Shader(name=f"{name}_shader", language=Shader.GLSL, vertex=vertex, fragment=fragment,
+                               default_input=dict(default_input))
+    return SHADERS[name]
+
+GRID_TILE = 36.0    #the grid is cut into square tiles of this size, so the engine can skip the tiles the camera can't see
+GRID_STREAM = 160.0 #the tiles up to this far from the player's car are built (in the classic arena that is all of them)
+GRID_BUILDS = 4     #the most tiles one frame builds (the nearest first), so that driving into a new part of a big arena doesn't hitch
+
+def grid_tile(arena, gap, thickness, x0, z0, x1, z1, last_x, last_z):
+    #the corners, triangles and uvs of the lines of one tile (x0..x1, z0..z1 is the square it covers): the lines at every multiple of
+    #gap that start in the tile (the last tile of a row also gets the ones on its far side, last_x / last_z say if it is that one),
+    #cut to the parts of them that are inside the arena's walls. they are only worked out when the tile is built (see Grid.stream)
+    h = thickness/2     #half the thickness of a line
+    y = 0.01            #the lines sit just above the floor
+    verts, tris, uvs = [], [], []
+    def add_line(x0, z0, x1, z1, axis, v):
+        #adds one line as a flat rectangle from (x0,z0) to (x1,z1). every corner also gets (axis, v) as its uv, which tells the
+        #shader which way the line runs and where it is, so it can work out how far the line is from the player's car
+        n = len(verts)
+        verts.extend(((x0, y, z0), (x1, y, z0), (x1, y, z1), (x0, y, z1)))
+        uvs.extend([(axis, v)]*4)
+        tris.extend((n, n+1, n+2, n, n+2, n+3))
+    #axis 0 is the vertical lines (at x=v, running along the z axis), axis 1 the horizontal ones (at z=v, running along x)
+    for axis, lo, hi, last, a0, a1 in ((0, x0, x1, last_x, z0, z1), (1, z0, z1, last_z, x0, x1)):
+        for k in range(math.ceil(lo / gap), math.floor(hi / gap) + 1):
+            v = k * gap
+            if v == hi and not last: continue   #(it is the first line of the next tile)
+            for c0, c1 in arena.chords(axis, v):
+                c0, c1 = max(c0, a0), min(c1, a1)   #the part of the line's piece inside the walls that is in this tile
+                if c0 >= c1: continue
+                if axis == 0: add_line(v-h, c0, v+h, c1, 0, v)
+                else: add_line(c0, v-h, c1, v+h, 1, v)
+    return verts, tris, uvs
+
 # Grid lines on the ground (for style and reference!)
 class Grid:
     #this class is basically used to print/display lines on the ground/floor/road and these lines will dynamically fade away as they
     #further away from the player's car. Basically the lines will smoothly disappear as they get further away from the player's car.
-    def __init__(self, size=72.0, gap=18, thickness=0.5, fade=48):
-        self.size = size                #size of the grid
+    #all the lines are put together into a few meshes (one per tile, see grid_tile), and the fading is done by the grid fade
+    #shader on the graphics card, so the python code doesn't have to touch every line on every frame any more. 
+    #the tiles are streamed: only the ones within GRID_STREAM of the player's car are built, and the ones that are left more than a
+    #tile further behind are released again, so a big arena costs no more to start or to keep in memory than the classic one.
+    #arena is the tron.arena shape the lines are cut to (the square of size if there is none)
+    def __init__(self, size=72.0, gap=18, thickness=0.5, fade=48, arena=None):
+        self.arena = arena or SquareArena(size)
+        self.size = self.arena.extent   #size of the grid (it covers -size..size on both axes)
         self.gap = gap                  #the gap/spacing between each lines in the grid
         self.thickness = thickness      #thickness of each of the lines in the grid
         self.fade = fade                #the distance from the player's car at which the lines should start to fade
-        self.lines = []                 #an empty list created to hold all line objects(all objects created inside the create_list method)
-        #self.lines is an instance variable (obviously since it is defined inside the __init__ (i.e. inside the class definition))
+        self.entity = None              #the one Entity that draws all the lines (created inside the create_lines method)
+        self.count = max(1, math.ceil(2*self.size / GRID_TILE))   #tiles per side
+        self.tiles = {}                 #(column, row) -> (x0, z0, x1, z1, mesh) of every tile that is built (mesh None: it has no lines)
+        self.streamed = None            #where the player's car was when the tiles were last streamed
+        #a small arena (like the classic one) is within GRID_STREAM of the car from anywhere in it: all its tiles are built at the
+        #start and it is never streamed
+        smallest = min(GRID_TILE, 2*self.size - (self.count - 1)*GRID_TILE)     #(the last tile of a row can be narrower)
+        self.streaming = (2*self.size - smallest) * math.sqrt(2) > GRID_STREAM
+        self.draw_distance = None       #the tiles further than this from the player's car are not drawn at all (None: all of them)
+        self.hidden = set()             #the (column, row) of the tiles that are not drawn right now
         base_color = color_tuple_to_color(GRID_COLOR, alpha=70/255.0)   #sets the colour of the lines in the grid
         self.create_lines(base_color)                                   #calls the create_lines method to create the grids
 
     def create_lines(self, base_color):
-        for l in self.lines:    #making sure to delete all the old lines so we dont create any duplicates when we create new lines 
-                                #when the car is moving forward. basically everytime the car moves the update() runs and we create new lines
-                                #so we have to delete the old lines so as to prevent the old lines (?)
-            destroy(l)          #destroy() is a built in function in the Ursina library that "destroys" an entity entirely/completely. 
-        self.lines = []         #we again initialize the self.lines list to an empty list just to make extra sure that there are no old 
-                                #lines left even after using the destroy()
-        edge = int(self.size)   #edge is the total distance from the centre(origin) to the edge of the screen
-        start = -edge - (-edge % self.gap if self.gap else 0)   #calculating the start and stop/end point for the grid to make sure the
-                                                                #grid is centred with respect to the origin. 
-        stop = edge - (edge % self.gap if self.gap else 0)      
-        #how it works :
-        #edge%eself.gap if self.gap else 0 - is basically nothing but
-        #if self.gap!=0:    in python 0 is considered False and any other integer is considered True
-        #   stop=edge-(edge%self.gap)
-        #else:
-        #   stop=edge-0
-        #note that start is at -edge and stop is at +edge. This is the only difference between them. 
-        span = 2 * edge         #the total size of the grid will be 2 times the edge by symmetry since from -ve x to origin to +ve x right
-        for v in range(start, stop+1, self.gap):    #the control variable v takes the values in the range (will include 0 because
-                                                    #start will be -ve and stop will be +ve). stop+1 so as v takes the the stop value also. 
-            l1 = Entity(model='quad', rotation_x=90, color=base_color, x=v, y=0.01, scale=(self.thickness, span, 1), shader=unlit_shader)
-            #l1 is the vertical line. 
-            #model="quad" - we are telling the game engine Ursina to basically consider a square
-            #x=v basically means that x keeps taking values of v in each iteration of the loop, while y stays the same(=0.01)
-            #scale=(X,Y,Z) - the values of X,Y,Z is how much we stretch, i.e. the width along either of these directions of the shape will be
-            #scale=(self.thickness, span,1) - so basically its thickness along the x axis(width of the line) will be equal to the thickness
-            #value given by the user(self.thickness), and it will stretch it along the y axis(since "span") and along the z axis its width=1
-            #not much importance to the z axis since these lines are basically in 2D, so we only need 2 coorindates set. 
-            #so what we did is that we took a square and stretched it to make it a very thin line. 
-            l2 = Entity(model='quad', rotation_x=90, color=base_color, z=v, y=0.01, scale=(span, self.thickness, 1), shader=unlit_shader)
-            #l2 is the horizontal line.
-            l1.texture = None
-            l2.texture = None
-            #basically makes the texture of the lines to be None,i.e. the lines are solid and dont have any patterns or anything. 
-            self.lines.append(l1)
-            self.lines.append(l2)
+        if self.entity:             #making sure to delete the old lines so we dont create any duplicates when we create new lines 
+            destroy(self.entity)    #destroy() is a built in function in the Ursina library that "destroys" an entity entirely/completely. 
+            self.entity = None
+        self.entity = Entity(shader=get_shader("grid_fade"), double_sided=True)
+        #the colour goes on the Entity itself (ursina's color= only colours an Entity's own model), and the tiles below it get it
+        #from there, like the shader and its inputs
+        self.entity.setColorScale(base_color)
+        self.entity.setTransparency(TransparencyAttrib.M_dual)
+        self.entity.set_shader_input('fade', float(self.fade))
+        self.tiles = {}
+        self.hidden = set()
+        self.streamed = None
+        self.stream(0.0, 0.0, builds=None)     #the tiles around the middle of the arena, all of them right away
+
+    def tile_square(self, i, j):
+        #the square (x0, z0, x1, z1) tile (i, j) covers
+        edge, tile = self.size, GRID_TILE
+        return -edge + i*tile, -edge + j*tile, min(edge, -edge + (i+1)*tile), min(edge, -edge + (j+1)*tile)
+
+    def stream(self, px, pz, builds=GRID_BUILDS):
+        #builds the missing tiles within GRID_STREAM of (px, pz) (at most builds of them, the nearest first, None for all) and
+        #releases the built ones that are more than GRID_STREAM + GRID_TILE away. only the tiles around (px, pz) are looked at,
+        #not the whole arena
+        edge, tile, n = self.size, GRID_TILE, self.count
+        reach = GRID_STREAM
+        distance = lambda x0, z0, x1, z1: math.hypot(max(x0 - px, 0, px - x1), max(z0 - pz, 0, pz - z1))
+        i0, i1 = max(0, math.floor((px - reach + edge) / tile)), min(n - 1, math.floor((px + reach + edge) / tile))
+        j0, j1 = max(0, math.floor((pz - reach + edge) / tile)), min(n - 1, math.floor((pz + reach + edge) / tile))
+        missing = []
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                if (i, j) in self.tiles: continue
+                square = self.tile_square(i, j)
+                d = distance(*square)
+                if d <= reach: missing.append((d, i, j, square))
+        missing.sort()
+        for d, i, j, (x0, z0, x1, z1) in missing[:builds]:
+            verts, tris, uvs = grid_tile(self.arena, self.gap, self.thickness, x0, z0, x1, z1, i == n - 1, j == n - 1)
+            mesh = None
+            if verts:
+                mesh = Mesh(vertices=verts, triangles=tris, uvs=uvs)
+                mesh.reparent_to(self.entity)
+            self.tiles[(i, j)] = (x0, z0, x1, z1, mesh)
+        far = [key for key, (x0, z0, x1, z1, mesh) in self.tiles.items() if distance(x0, z0, x1, z1) > reach + tile]
+        for key in far:
+            mesh = self.tiles.pop(key)[4]
+            if mesh: mesh.removeNode()
+            self.hidden.discard(key)
+        #(with tiles still missing it streams again on the next frame, otherwise once the car has moved a quarter of a tile)
+        self.streamed = (px, pz) if len(missing) <= (builds or len(missing)) else None
 
     def update_fade(self, player_pos):
-    #this is the functon that is responsible for making the lines fade dynamically as they get further away from the  player's car
-        for line in self.lines:
-            d = abs(line.x - player_pos.x) if abs(line.scale_x - self.thickness)<0.01 else abs(line.z - player_pos.z)
-            #basically
-            #if abs(line.scale_x - self.thickness)<0.01:    #so that the thickness of the line is equal to or similar to the self.thickness
-            #   d = abs(line.x - player_pos.x)
-            #else:
-            #   d = abs(line.z - player_pos.z)
-            fade_factor = 1.0 - (d / self.fade) ** 2 if self.fade else 1.0 
-            #d/self.fade normalizes the fade distance to between 0 and 1. 
-            #if self.fade is None or =0 (i.e. False), then set the fade_factor to 1.0 else calculate its value by normalisation. 
-            #1-d/self.fade to invert the value. if distance(d)=0(min), then fade_factor=1(max), and if d=1(max), then fade_factor=0(min)
-            c = line.color
-            line.color = Color(c.r, c.g, c.b, max(0.03, c.a if isinstance(c, Color) else 1.0) * max(0.0, fade_factor))
-            #the r,g,b values are kept the same but the alpha value is re-calculated. 
-            #alpha value is = c.a (the actual value if isinstance(c,Colour) is true. else it just sets the alpha value to 1.0
-            #max(0.03,..) so that the alpha value is atleast 3%,i.e. we set a minimum base opacity for the lines
+    #this is the functon that is responsible for making the lines fade dynamically as they get further away from the  player's car.
+    #all it has to do now is to tell the shader where the player's car is. the shader then works out the fade for every line as:
+    #fade_factor = 1 - (d/self.fade)**2 (never below 0), where d is the distance of the line from the car, and the line's alpha is
+    #its base alpha times fade_factor. (the old version also multiplied by the previous frame's alpha, which made the lines keep
+    #getting dimmer over time, the shader always starts from the base alpha)
+        self.entity.set_shader_input('player_pos', Vec2(player_pos.x, player_pos.z))
+        px, pz = player_pos.x, player_pos.z
+        streamed = self.streamed
+        if self.streaming and (streamed is None or abs(px - streamed[0]) + abs(pz - streamed[1]) > GRID_TILE / 4):
+            self.stream(px, pz)
+        if self.draw_distance is None and not self.hidden: return
+        #the tiles that are further away than draw_distance (from the car to the nearest point of the tile) are hidden
+        for key, (x0, z0, x1, z1, mesh) in self.tiles.items():
+            if mesh is None: continue
+            far = self.draw_distance is not None and math.hypot(max(x0 - px, 0, px - x1), max(z0 - pz, 0, pz - z1)) > self.draw_distance
+            if far and key not in self.hidden:
+                mesh.hide()
+                self.hidden.add(key)
+            elif not far and key in self.hidden:
+                mesh.show()
+                self.hidden.discard(key)
 
 # Set up simple boundary box walls
 class Boundary:
     #this class is basically for creating an invisible/semi visible walls to keep the cars inside the area. 
-    def __init__(self, size=72.0, height=0.5, thickness=0.2):
+    #the walls follow the arena's outline (its corners, see tron.arena): every side of it is one upright rectangle, and all of them
+    #are put into one mesh, so a round arena (96 sides) is still one Entity. (the square of size if there is no arena)
+    def __init__(self, size=72.0, height=0.5, arena=None):
         color_rgba = color_tuple_to_color(WALL_COLOR, alpha=110/255.0)
-        edge = size     #how far the boundary is from the centre(origin (0,0))
-        span = 2*edge   #the total length of the boundary from start(-ve x) to end(+ve x)
-        h = height/2.0  #half the height(so that the base is on the ground(note that we assume that the car is at the centre))
-        self.walls = [Entity(model='cube', shader=unlit_shader, color=color_rgba, position=(0, h, edge), scale=(span, height, thickness)),
-                    Entity(model='cube', shader=unlit_shader, color=color_rgba, position=(0, h, -edge), scale=(span, height, thickness)),
-                    Entity(model='cube', shader=unlit_shader, color=color_rgba, position=(edge, h, 0), scale=(thickness, height, span)),
-                    Entity(model='cube', shader=unlit_shader, color=color_rgba, position=(-edge, h, 0), scale=(thickness, height, span))]
-        
-                    #each entity is a wall line. and the list named self.walls contain these wall lines. these walls are defined in a
-                    #way similar to that in lines of code 127 and 136
-# Leaves a glowing trail behind your bike
-class Trail:
-    def __init__(self, color, width=0.28, alpha=0.58, min_segment=0.16):
+        corners = (arena or SquareArena(size)).outline()
+        verts, tris = [], []
+        for (ax, az), (bx, bz) in zip(corners, corners[1:] + corners[:1]):  #every corner and the next one (the last one and the first)
+            n = len(verts)
+            verts.extend(((ax, 0, az), (bx, 0, bz), (bx, height, bz), (ax, height, az)))
+            tris.extend((n, n+1, n+2, n, n+2, n+3))
+        self.walls = Entity(model=Mesh(vertices=verts, triangles=tris), shader=get_shader("unlit"), color=color_rgba, double_sided=True)
+# The meshes that draw every quad of a trail
+#the trail's quads are cut into chunks of TRAIL_CHUNK quads with their own mesh each, so that the engine can skip the chunks the
+#camera can't see (it compares every mesh's bounds with the camera's view, and one mesh for the whole trail is always partly in view).
+#the quads of a chunk are TRAIL_CHUNK segments (or runs) in a row, so they are all close together along the trail.
+#a chunk further than the lod distance from the camera is drawn with its coarse mesh instead: every LOD_STEP quads in a row are
+#merged into one long quad from the start of the first to the end of the last (far away nobody sees the corners that get cut)
+TRAIL_CHUNK = 32
+LOD_STEP = 4
+
+def quad_mesh(quads):
+    #a mesh with room for quads quads, all squashed to (0,0,0) for now
+    tris = []
+    for q in range(quads):      #every quad is made of 2 triangles: corners (0,1,2) and (0,2,3)
+        v = q*4
+        tris += (v, v+1, v+2, v, v+2, v+3)
+    #static=False tells the engine that we are going to keep changing the vertices of this mesh
+    return Mesh(vertices=[0.0]*(quads*12), triangles=tris, static=False)
+
+def mesh_vertices(mesh):
+    #gives us the raw float32 vertex memory of a mesh (x,y,z of every corner one after the other) so that we can change the
+    #4 corners of a single quad without rebuilding the whole mesh. (asking for it also tells the engine that the mesh changed,
+    #so it works out the mesh's bounds again before it draws it)
+    vdata = mesh.geomNode.modifyGeom(0).modifyVertexData()
+    return memoryview(vdata.modifyArray(0)).cast('B').cast('f')
+
+class TrailMesh(Entity):
+    #before, every trail segment was its own Entity(model='quad'), so two long trails meant up to 2000 separate objects for the
+    #renderer to draw one by one. now the quads are kept in a ring, exactly like the SegmentBuffer: the quad of segment id k lives in
+    #slot k % capacity, so when the oldest segment is dropped its slot is simply overwritten by the newest one. slot k is quad
+    #k % TRAIL_CHUNK of chunk k // TRAIL_CHUNK.
+    #slots that are not used yet have all 4 corners at (0,0,0), so they are squashed to nothing and are invisible.
+    #a coalesced trail (see Trail in tron.sim) is drawn from its runs instead, so a straight line is one long quad: the runs go in
+    #slots 0 to capacity-1 the same way, and the SKIP_RECENT newest pieces (which aren't in a run yet) get the slots after them,
+    #in a mesh of their own (the Entity's model, the chunks hang below it so they get its colour and shader)
+    def __init__(self, color, capacity=1000, width=0.28, y=0.06):
+        super().__init__(model=quad_mesh(SKIP_RECENT), color=color, shader=get_shader("unlit"), double_sided=True)
+        self.texture = None
+        self.capacity = capacity
+        self.slots = capacity + SKIP_RECENT
+        self.chunks = []    #the mesh of every chunk of the ring
+        for _ in range(-(-capacity // TRAIL_CHUNK)):
+            chunk = quad_mesh(TRAIL_CHUNK)
+            chunk.reparent_to(self.model)
+            self.chunks.append(chunk)
+        self.coarse = [None] * len(self.chunks)     #the coarse mesh of every chunk (made the first time the chunk is far away)
+        self.far = [False] * len(self.chunks)       #if the chunk is drawn with its coarse mesh right now
+        self.circles = [None] * len(self.chunks)    #(x, z, radius) of a circle around every chunk's quads (None for an empty chunk)
+        self.changed = set()                        #the chunks that got new quads since the last update_lod()
+        self.ends = array('f', bytes(16 * capacity))    #ax, az, bx, bz of the quad in every slot of the ring
+        self.ids = array('q', [-1]) * capacity          #the id of the segment (or run) in every slot of the ring, -1 if it is empty
         self.width = width  #how wide the trail should be
-        self.min_segment = min_segment  #self.min_segment - this stores the minimum distance the car should travel before a trail is drawn
-        #this prevents the game from drawing lots of trails even for a small movement 
-        self.last_pos = None    #self.last_pos will remember where the last trail was left off at/dropped at. 
-        #it is initialized to None because no trails have been created up until now. 
-        self.segments = []  #an empty list to hold/contain the data/info for each trail segment, like its position and direction, 
-                            #like the x,y,z coordinates etc. 
-        self.visuals = []   #an empty list that will hold/contain the actual visual objects that get drawn/displayed on the screen
-                            #like the actual 3D models that the game engine renders. 
-        self.color = color_tuple_to_color(color, alpha=alpha)   #the color of the trail. 
-
-    def add_segment(self, a: Vec3, b: Vec3):
-        #this method is called repeatedly for drawing the trails on the ground. 
-        #this method takes two arguments a- the previous position(self.last-pos) and b- the current position
-        #Vec3 is shortfrom for Vector 3. Vec3 is a data type in the Ursina library. It is basically an object that holds three numbers
-        #which are always either int or float.  basically Vec3 holds in the format (x coordinates,y coordinates, z coordinates)
-        d = Vec3(b.x-a.x, 0, b.z-a.z)   #calculates the distance between two points only on the ground plane(the rood/floor(XZ plane))
-                                        #it ignores any height difference by setting the y coordinates to 0. all this is assigned to "d"
-        length = math.hypot(d.x, d.z)   #calculates the 2D length of the trail using the Pythoagorean theorem. 
-                                        #hypnot(a,b) returns the hypotenuse say c= root of a^2+b^2
-        if length < self.min_segment: return
-        #so basically if the length of the trail is less than the min distance required to be travlled by the car to leave behind a trail
-        #then return None,i.e. to not create any trails. 
-        mid = (a + b) / 2   #mid is the midpoint of the start and end of the trail. this is where the new trail will begin at. 
-        angle = math.degrees(math.atan2(d.x, d.z))  
-        #math.atan2 calculates the angle of the vector d
-        #atan2(a,b) gives you the arctan of y/x,i.e. tan inverse(y/x). here we get tan inverse(d.x/d.z). d.x gives x component of d. 
-        #d.z gives z component of d. 
-        #math.degrees() converts the angle returned by math.atan2 which will be in radian into degrees. 
-        #we convert the angle from radian into degrees because degrees is the format which the Ursina game engine understands. 
-        seg = Entity(model='quad', shader=unlit_shader, color=self.color,
-                     position=Vec3(mid.x, 0.06, mid.z),
-                     rotation=Vec3(90, angle, 0),scale=Vec3(self.width, length, 1)) #creating the actual trail Entity visible to us
-        #basically seg is the variable that holds the visual trail which we can see in the game
-        #Entity is the name in the Ursina game library for an object which exists in the game world. 
-        seg.texture = None  #no specific texture or pattern for the trail. just plain. 
-        self.visuals.append(seg)    #adding the new visual object contained in the variable seg in our visuals list which contains all the 
-                                    #visual objects in the game we have created. 
-        self.segments.append((Vec2(a.x,a.z), Vec2(b.x,b.z)))    #appending the 2D coordinates of the starting point of the trail (a) and
-                                                                #the ending point of the trail(b). 
-        if len(self.visuals)>1000: destroy(self.visuals.pop(0)) #if the trail has more than 1000 visual pieces it destroys the 1st one. 
-        if len(self.segments)>1000: self.segments.pop(0)        #it removes the oldest segment's data to keep adding data of new segments. 
-
-    def step(self, pos3d: Vec3):    
-        #the step method is called on every frame of the game to update the trail based on the car's new position (pos3d)
-        p = Vec3(pos3d.x, 0, pos3d.z)   #creates 2D vector of the car's current position ignoring the height (y=0)
-        if self.last_pos is None:       #if there is no value for self.last_pos/no value has been set for self.last_pos
-            
-            self.last_pos = p           #then it sets the current position of the car to the last position
-            return                      #it returns nothing, i.e. exits the function because no trail can be drawn since there's only 
-                                        #one point. 
-        d = p - self.last_pos           #the 2D vector(distance and direction) the car has moved since the last frame of the game. 
-        dist = math.hypot(d.x, d.z)     #it calculates the length of that motion/movement using Pythogorean 
-        if dist >= self.min_segment*2.5:#if the car has moved a distance greater than or equal to the minimum distance required to be 
-                                        #moved by the car to leave behind a trail time 2.5. 
-                                        #WHY MULTIPLY BY 2.5?
-                                        #Threshold check: only when the movement distance is large enough do we treat it specially. Multiplying self.min_segment by 2.5 creates a tolerance margin above the basic segment length. Practically this does three things: Filters tiny jitter: prevents creating many tiny segments when movement is negligible.Detects large moves: flags cases where the car jumped or moved a lot between samples (fast motion, lag, or a sharp turn).Controls smoothing subdivision: if the movement is substantially larger than min_segment, subdivide it into multiple smaller segments for a smooth trail rather than one long segment.
-                                        #a lag spike due to car making a sharp turn or just a normal segment. 
-                                        #if it is a normal segment spike, then follow the if block, since if conditoin will be true
-                                        #otherwise follow the else block. 
-            steps = max(2, int(dist / self.min_segment))    #decides how many segments to create
-            prev = self.last_pos                            #the previous position of the player's car 
-            #the loop below repeatedly calculates small steps and calls the self.add_segment method on each step so as to create/draw a
-            #very smooth curve/line/segment which is the trail instead of creating just a long straight line. 
-            for _ in range(steps):
-                nxt = Vec3(prev.x + d.x/steps, 0, prev.z + d.z/steps)
-                self.add_segment(prev, nxt)
-                prev = nxt
-            self.last_pos = prev    #the new final positon(prev) is assigned as the last position of the car. 
-                                    #this repeatedly happens everytime the loop runs. 
-        else:   #else block if the car has moved a straught 
-            self.add_segment(self.last_pos, p)  #just basically add a new segment from the last positoin to the current position
-            self.last_pos = p                   #and then assign the current position as the last position of the player's car. 
+        self.height = y     #the height of the trail above the floor (slightly above, so it doesn't flicker with the floor)
+        self.drawn = 0      #the id of the next segment (or run) of the simulation's trail that still has to be drawn
+        self.first_run = 0  #the id of the oldest run that was drawn
+        self.drawn_piece = 0    #the id of the next piece that still has to be drawn (for a coalesced trail)
+        self.first_piece = 0    #the id of the oldest piece when the oldest run was drawn
+
+    def quad(self, vertices, q, ax, az, bx, bz):
+        #writes the quad for the segment from (ax,az) to (bx,bz) as quad number q of vertices
+        dx, dz = bx-ax, bz-az
+        length = math.hypot(dx, dz)
+        i = q * 12
+        if length < 1e-6:   #nothing to draw (and no direction to work out the sides from)
+            vertices[i:i+12] = array('f', bytes(48))
+            return
+        nx, nz = -dz/length*self.width/2, dx/length*self.width/2    #half the width, sideways (perpendicular) to the segment
+        y = self.height
+        vertices[i:i+12] = array('f', (ax+nx, y, az+nz,  ax-nx, y, az-nz,  bx-nx, y, bz-nz,  bx+nx, y, bz+nz))
+
+    def set_quad(self, slot, sid, ax, az, bx, bz):
+        #writes the quad of segment (or run) sid, from (ax,az) to (bx,bz), into slot
+        if slot >= self.capacity:
+            self.quad(mesh_vertices(self.model), slot - self.capacity, ax, az, bx, bz)
+            return
+        k = slot // TRAIL_CHUNK
+        self.quad(mesh_vertices(self.chunks[k]), slot % TRAIL_CHUNK, ax, az, bx, bz)
+        self.ends[slot*4:slot*4+4] = array('f', (ax, az, bx, bz))
+        self.ids[slot] = sid
+        self.changed.add(k)
+
+    def clear_quad(self, slot):
+        #squashes the quad in slot (a ring slot) to nothing
+        k = slot // TRAIL_CHUNK
+        i = (slot % TRAIL_CHUNK) * 12
+        mesh_vertices(self.chunks[k])[i:i+12] = array('f', bytes(48))
+        self.ids[slot] = -1
+        self.changed.add(k)
+
+    def sync(self, trail):
+        #draws what the simulation's trail got since the last call. if there are more new segments than the mesh has room for,
+        #only the newest ones are drawn (the older ones would be overwritten straight away anyway)
+        runs = trail.runs
+        if runs is None:
+            newest = trail.newest_id
+            if newest < self.drawn: return
+            start = max(self.drawn, trail.segments.first_id, newest - self.capacity + 1)
+            for sid in range(start, newest+1):
+                self.set_quad(sid % self.capacity, sid, *trail.segments.get(sid))
+            self.drawn = newest + 1
+            return
+        #a coalesced trail: the newest run keeps getting longer, so it is drawn again on top of the new runs, and so is the oldest
+        #run if pieces were evicted (it got shorter). runs that are gone are squashed (with far fewer runs than slots, nothing
+        #would overwrite them)
+        newest_piece = trail.newest_id
+        if newest_piece < self.drawn_piece: return      #(no new pieces since the last call, so nothing changed)
+        cap = self.capacity
+        first, newest = runs.first_id, runs.first_id + len(runs) - 1
+        for rid in range(self.first_run, min(first, self.drawn)):
+            self.clear_quad(rid % cap)
+        start = max(first, self.drawn - 1, newest - cap + 1)
+        for rid in range(start, newest + 1):
+            self.set_quad(rid % cap, rid, *runs.get(rid))
+        if start > first and trail.segments.first_id != self.first_piece: self.set_quad(first % cap, first, *runs.get(first))
+        self.first_run, self.drawn, self.first_piece = first, newest + 1, trail.segments.first_id
+        #the pieces too new for the runs: piece id k goes in slot cap + k % SKIP_RECENT, so when a piece goes into a run its slot
+        #is taken over by the piece that came in on the same call
+        for pid in range(max(self.drawn_piece, trail.committed, newest_piece - SKIP_RECENT + 1), newest_piece + 1):
+            self.set_quad(cap + pid % SKIP_RECENT, pid, *trail.segments.get(pid))
+        self.drawn_piece = newest_piece + 1
+
+    def update_lod(self, x, z, distance):
+        #switches every chunk between its normal and its coarse mesh, depending on how far it is from the camera at (x, z).
+        #distance None draws every chunk normally
+        for k in self.changed: self.circles[k] = self.chunk_circle(k)
+        for k, chunk in enumerate(self.chunks):
+            b = self.circles[k]
+            far = distance is not None and b is not None and math.hypot(b[0] - x, b[1] - z) - b[2] > distance
+            if far and (k in self.changed or not self.far[k]): self.build_coarse(k)
+            if far != self.far[k]:
+                self.far[k] = far
+                if far:
+                    chunk.hide()
+                    self.coarse[k].show()
+                else:
+                    chunk.show()
+                    self.coarse[k].hide()
+        self.changed.clear()
+
+    def chunk_circle(self, k):
+        xs, zs = [], []
+        for slot in range(k * TRAIL_CHUNK, min(self.capacity, (k + 1) * TRAIL_CHUNK)):
+            if self.ids[slot] < 0: continue
+            ax, az, bx, bz = self.ends[slot*4:slot*4+4]
+            xs += (ax, bx)
+            zs += (az, bz)
+        if not xs: return None
+        cx, cz = (min(xs) + max(xs)) / 2, (min(zs) + max(zs)) / 2
+        return cx, cz, math.hypot(max(xs) - cx, max(zs) - cz)
+
+    def build_coarse(self, k):
+        #the coarse mesh of chunk k: its quads in the order of their ids, and every LOD_STEP of them in a row (without a gap in the ids,
+        #at the ring's wrap around the oldest and the newest quads share a chunk) merged into one quad
+        if self.coarse[k] is None:
+            self.coarse[k] = quad_mesh(TRAIL_CHUNK // LOD_STEP + 2)    #(the +2: a gap in the ids can start a new group early)
+            self.coarse[k].reparent_to(self.model)
+            self.coarse[k].hide()
+        ids, ends = self.ids, self.ends
+        slots = sorted((ids[slot], slot) for slot in range(k * TRAIL_CHUNK, min(self.capacity, (k + 1) * TRAIL_CHUNK)) if ids[slot] >= 0)
+        vertices = mesh_vertices(self.coarse[k])
+        q = 0
+        group = []
+        for n, (sid, slot) in enumerate(slots):
+            group.append(slot)
+            last = n + 1 == len(slots) or slots[n + 1][0] != sid + 1
+            if len(group) == LOD_STEP or last:
+                self.quad(vertices, q, ends[group[0]*4], ends[group[0]*4+1], ends[group[-1]*4+2], ends[group[-1]*4+3])
+                q += 1
+                group = []
+        rest = len(vertices) - q*12     #(the quads that are left over are squashed)
+        vertices[q*12:] = array('f', bytes(rest * 4))
 
     def clear(self):
-        #this function is basically a reset button to clear all the trails when we reset the game/end the game/race and start a new game/race. 
-        for e in self.visuals:
-            destroy(e)          #destroys every element present in the self.visuals list which contains all the visual elements created
-                                #in a single run of the game/race. 
-        self.visuals.clear()    #completely clears the list
-        self.segments.clear()   #completely clears the list
-        self.last_pos = None    #resets the last position of the car to None. 
-
-    def collides(self, pos3d: Vec3, skip_recent=10, radius=0.30):
-        #the job of this function is to check if the car at pos3d has hit any of its older trails. 
-        #if it has hit any of its older trails, then the game is over. 
-        # Check if pos3d hits the trail except very recently created segments
-        if len(self.segments)<=skip_recent: #skip_recent means to skip 10 of the recent segments. 
-                                            #so that we check only if the car has hit any of the older segments. 
-            return False
-        #basically we consider the player's car as a 2D circle. and if this 2D circle touches any of the older trail segments, then
-        #the game is over. 
-        p = Vec2(pos3d.x, pos3d.z)  #we are converting the 3D position, basically the car into a 2D point on the ground/floor/road. 
-        r2 = radius*radius          #the variable r2 holds the square of the radius. calculating the square of the radius to find the 
-                                    #square root later rather than using the math.sqrt() since this is more optimized way. 
-        for a, b in self.segments[:-skip_recent]:   #creates a nested list containing all the segments other than the 10 recent
-                                                    #segments since we used skip_recent. 
-            ab = b - a      #vector ab = b-a (vector representing the trail segment from a to b)
-            ap = p - a      #vector ap = p-a
-            ab2 = ab.x*ab.x+ab.y*ab.y   #ab2 is the variable that holds the squared length of vector ab (square of magnitude of vector ab)
-            if ab2 <= 1e-6:             #basically saying that if ab2 is a point, i.e both ab2 segment has its start and end point almost
-                                        #the same. 1e-6 is a notation in programming to represent a very small +ve number. 
-                                        #we didn't use if ab2==0 since ab2 could be ==0.00000000001 and still the condition would be False
-                if ap.x*ap.x+ap.y*ap.y <= r2: return True   #if ap2 is less than the square of the radius of the player's car. 
-                continue                
-            #finding the closest point to the player's car on the line segment ab
-            t = max(0.0, min(1.0, (ap.x*ab.x+ap.y*ab.y)/ab2))   #t will always be positive and range of t is [0,1]
-            #ap.x*ab.x+ap.y*ab.y is the dot product of ab and ap
-            #(ap.x*ab.x+ap.y*ab.y)/ab2 is the projection of the point ap on the vector ab
-            #HOW DOES IT WORK(?)
-            cx, cy = a.x + ab.x*t, a.y + ab.y*t
-            #cx and cy are the actual x and y coordinates of this point of collision
-            dx, dy = p.x-cx, p.y-cy
-            #dx and dy are the distance between the points of collision(cx,cy) and the player's car. 
-            if dx*dx+dy*dy <= r2: return True
-            #if the squaer of the distance between the player's car and the point of collision on the line is less than or equal to the 
-            #radius of the circle, then there will be a collision. 
-        return False    #after the loop checks all the segments and then if no collisions are found, then the car is safe and the game
-                        #keeps on running. then the function must return False since there was no collision right. 
+        #squashes every quad back to (0,0,0)
+        mesh_vertices(self.model)[:] = array('f', bytes(SKIP_RECENT * 48))
+        for k, chunk in enumerate(self.chunks):
+            mesh_vertices(chunk)[:] = array('f', bytes(TRAIL_CHUNK * 48))
+            self.changed.add(k)
+        self.ids = array('q', [-1]) * self.capacity
+        self.drawn = 0
+        self.first_run = 0
+        self.drawn_piece = 0
+        self.first_piece = 0
 
 def bike_glow(col, scale=(1.5,1.5), y=0.02):
     #this function basically creates a glow effect under the player's car/bike. 
@@ -306,293 +546,329 @@ def bike_glow(col, scale=(1.5,1.5), y=0.02):
                                                     #colour object by using the color_tuple_to_color function we defined earlier. 
                                                     #basically the col argument will be in the form of a tuple. we will convert this tuple
                                                     #into an object having the Color class(inbuilt class in the Ursina library)
-    return Entity(model='circle', color=c, rotation_x=90, scale=scale, y=y, shader=unlit_shader, texture=None)
+    return Entity(model='circle', color=c, rotation_x=90, scale=scale, y=y, shader=get_shader("unlit"), texture=None)
     #so now we are returning the glow effect. we are creating an Entity(refer to line of code 215)
-    #shader=unlit_shader basically we are telling this Entity(the glow effect) to ignore all the lighting and shadows in the game
-    #refer to beginning of code to understand what the unlit_shader is. 
+    #shader=get_shader("unlit") basically we are telling this Entity(the glow effect) to ignore all the lighting and shadows in the game
+    #refer to the shaders at the beginning of the code to understand what the unlit shader is. 
     #rotation_x=90, so that it lies flat on the ground instead of standing upright. 
     #y=y=0.02 (default value when we defined the function). we are placing the glow slightly above the ground to prevent it from flickering
     #with the road texture. 
 
-class PlayerBike(Entity):
-    #this is the class that has everything related to the player's car/bike. 
-    #PlayerBike is a subclass of the Entity parent class. and Entity is a predefined class in the Ursina library.
-    def __init__(self, col, start=(-14,0.5,0)):
-        #super() is a built in function in the Python library. 
-        #it lets us invoke the method of the parent class. 
-        #basically if the parent class has a useful method but for some specific reason in the subclass we need to return the contents
-        #of the parent class method but also we need to add some extra things to return when we call this method, we use the super()
+# Draws one bike of the simulation (the cube, its glow and its trail)
+class BikeView(Entity):
+    #the bike itself lives in the simulation (tron.sim), this Entity only copies its position and heading on every frame
+    def __init__(self, state, col, dead_col):
         super().__init__(model='cube',
             color=color_tuple_to_color(col, alpha=1.0),
             scale=(0.8,0.8,2.3),
-            position=start,
-            shader=unlit_shader)
+            position=(state.x, 0.5, state.z),
+            shader=get_shader("unlit"))
+        self.state = state          #the simulation's bike (tron.sim.PlayerBike or tron.sim.AIBike)
         self.base_col = col
-        self.speed = 10.5                   #current speed of the bike
-        self.accel = 1.3                    #acceleration of the bike
-        self.max_speed = 30.0               #maximum speed of the bike
-        self.turn_speed = 175.0             #how fast the bike can turn
-        self.alive = True                   #a variable that tells if the bike is alive or not(i.e. if it has crashed or not)
-        self.trail = Trail(self.base_col)   #we are creating a new instance of the Trail class we have just defined with the colour of
-                                            #the trail as the base colour. and we are assinging this instance of the Trail class to the
-                                            #instance variable named as self.trail. and self.trial is a variable in the PlayerBike class. 
-                                            #so now we can call the methods of the PlayerBike class on the self.trail variable. 
+        self.dead_col = dead_col    #the colour the bike turns into when it crashes
+        self.trail = TrailMesh(color_tuple_to_color(col, alpha=0.58), state.trail.max_segments)
         self.glow = bike_glow(self.base_col)
+        self.prev = None            #(x, z, heading) of the bike before the last simulation tick, see remember()
+        self.reset()
 
-    def reset(self, pos=(-14,0.5,0), rot=0):
-        #this method is used to reset everything related to the player's bike after a crash or when we reset the game or start a new race
-        #we reset the position and the rotation of the bike(to 0)
-        self.position = pos         #default position already defined in the definiton of the reset method. 
-        self.rotation = (0,rot,0)   #rotation along all axes is 0
-        self.speed = 10.5
-        self.trail.clear()  #clears the trail when we reset everything (obviously)
-        self.alive = True   #obviously when the game restarts the player is alive
-        self.color = color_tuple_to_color(self.base_col, 1.0)
-        self.glow.position = (pos[0], 0.02, pos[2]) #resets the glow position also (obviously)
-
-    def step(self, dt):
-        #this method runs in every single frame of the game and handles all the input(from the player) and the movement of the bike. 
-        if not self.alive: return   #if not self.alive means if self.alive==False: then return None (return simply means return None)
-                                    #return statement is used means that we exit the function (obviously if the player is not alive
-                                    #the step method must not keep running right? YES)
-        self.speed = min(self.max_speed, self.speed + self.accel * dt)  #this line handles the acceleration of the player's bike
-        #how does it work?
-        #dt is the time elapsed
-        #self.accel*dt is the speed to be added to the current speed in this current frame. since acceleration is basically d(speed)/dt.
-        #so multilpying acceleration by dt we get d(speed). 
-        #self.speed+self.accel*dt - we are adding the increased speed to the current speed(self.speed)
-        #but the current speed can never be greater than the max speed(self.max_speed) right? therefore we do min(self.max_speed,..)
-        #basically we are updating the self.speed in each frame(since the step method runs in each method of the game)
-        fwd = (1 if held_keys['w'] else 0) - (1 if held_keys['s'] else 0)
-        #fwd is basically like the accelerator of the player's car/bike. 
-        #fwd=1 if held_keys["w"] - means if the w key is pressed then the value of fwd=1 else it is 0. 
-#??????        #CASE SENSITIVE NAHI KARNA HEI???? W or w must have same effect right?
-        #if fwd=1 it is like accelerate     (forward)
-        #if fwd=-1 it is like deccelerate   (reverse)
-        #if fwd=0 it is like neutral.       (neutral)
-        if held_keys['a']: self.rotation_y -= self.turn_speed * dt
-        if held_keys['d']: self.rotation_y += self.turn_speed * dt
-        self.position += self.forward * (fwd * self.speed * dt)
-        #how we are adding to the position of the player's car/bike with respect to the fwd value. 
-        #(fwd * self.speed * dt) - is basically the distance the bike should travel in each frame. 
-        #if fwd=1 then it will move the distance self.speed*dt forward
-        #if fwd=-1 then it will move the distance self.speed*dt in the reverse direction(since fwd=-1)
-        #if fwd-0 then it will stay in the same position
-        #self.speed*dt is change in position right. since speed=d(position)/dt
-        #forward is an attribute/property that is pre built in the Entity class. 
-        #basically it is a Vec3(Vector in 3D) that always points in the forward direction. 
-        #self.position += self.forward * (fwd * self.speed * dt) - calculates where the player's car/bike should be in the next frame. 
-        self.trail.step(self.position)  #we also have to call the step method on the trail object too so that it updates along with 
-                                        #player's bike/car. 
-        self.glow.position = (self.x, 0.02, self.z) #applying the position method on the glow object too so that it matches with the 
-                                                    #position of the player's car/bike. the y coordinate of the glow stays the same. 
-
-    def die(self):
-        self.alive = False  #basically if the self.alive is False means that the player's bike has crashed
-        self.color = color_tuple_to_color((255,60,60,255), alpha=1.0)
-
-class AIBike(Entity):
-    #AIBike is the subclass of the Entity parent class. 
-    #AIBike is the bike that is controlled by the computer/AI. this is the opponent to the player's car'/bike. 
-    #Basically same as the PlayerBike class but we have made a few changes for it to have its own "brain". 
-    def __init__(self, col, arena_bounds=72.0, start=(14,0.5,0)):
-        super().__init__(model='cube',
-            color=color_tuple_to_color(col, alpha=1.0),
-            scale=(0.8,0.8,2.3),
-            position=start,
-            shader=unlit_shader)
-        self.base_col = col
-        self.speed = 11.0
-        self.max_speed = 30.0
-        self.turn_speed = 170.0
-        self.arena_bounds = arena_bounds    #this is a new thing we have defined. this is not present in the PlayerBike class. 
-                                            #this is basically so that the AI knows the bounds of the arena so that it knows when to turn
-                                            #away from the walls. 
-        self.alive = True                   #just like the PlayerBike the AIBike also has this. 
-        self.trail = Trail(self.base_col)   #same as PlayerBike
-        self.timer = 0.0    #this is a simple timer and we have initialized this to 0.0 seconds.              
-        self.think_interval = random.uniform(0.18,0.42) #this is a randomized timer. the AI Bike will make a decision randomly like to make
-                            #a turn at a random interval between 0.18 and 0.42 seconds. 
-                            #random.uniform(a,b) is used to get a floating point number between a and b (both a and b included)
-        self.turning = 0    #this is a variable to store the current action of the AI
-                            #if self.turning=0 - go straight
-                            #if self.turning=1 - turn to the right
-                            #if self.turning=-1 - turn to the left
-        self.glow = bike_glow(self.base_col)        #same as PlayerBike
-
-    def reset(self, pos=(14,0.5,0), rot=180):
-        #this function(actually it is a method (obviosly)) is basically used to reset the AI after we crash or start a new race/ restart. 
-        #basically same as PlayerBike  
-        self.position = pos
-        self.rotation = (0,rot,0)
+    def reset(self):
+        #puts the view back to match a freshly reset simulation bike
         self.trail.clear()
-        self.timer = 0.0
-        self.turning = 0
-        self.speed = 11.0
-        self.alive = True
         self.color = color_tuple_to_color(self.base_col, alpha=1.0)
-        self.glow.position = (pos[0], 0.02, pos[2])
-
-    def step(self, dt):
-        #the step method runs on every frame of the game (dt)
-        if not self.alive: return   #same as PlayerBike
-        self.timer += dt            #basically an automatic timer is setup when this method runs/is called. 
-        near_wall = False           #intializing that the AIBike is near the wall is False(i.e. it is not near the wall(not about to crash))
-        ahead = self.world_position + self.forward * 7.0    #basically we are creating a sensor point at a distance 7 units from the
-                                                            #player's bike's position. 
-        #self.forward is a forward vector of 1 unit length that points in the current direction that the AI Bike is facing. 
-        #so self.foward * 7 basically now makes it a vector of magnitue(length) 7 units (mulitplying a vector with a scalar concept)
-        #so now we have a vector of length 7 unit that points in the current direction that the AI Bike is facing/pointing at. 
-        #self.world_position gives the current absolute position of the object self in the game world
-        #so self.world_position + self.forward*7.0 = ahead. so ahead is basically a 3D coordinate point that is always at a distance of 7
-        #units from the current position of the AI Bike. 
-        #ANSWER : Because self.position gives the position of the object self with respect to/relative to its parent. 
-        #If AIBike doesn't have any parent class then self.position and self.world_position will basically give the same position. 
-        if abs(ahead.x)>self.arena_bounds-5 or abs(ahead.z)>self.arena_bounds-5:    #checking if the x or y coordinate of this area is
-            #outside of the arena_bounds-5. why do we substract 5? because just to make sure that the AI Bike turns earlier. 
-            #it has to turn earlier so that it has enough time and space to make the turn. 
-            near_wall = True    #so in case the if condition i true, then near_wall = True(i.e. the AI Bike is near the walls)
-        if self.timer>=self.think_interval: #the AI only has to think to make a decision(like whether to make a turn) only when the
-            #timer runs out. 
-            self.timer = 0.0    #when the timer runs out, we reset the timer back to 0.0 seconds. 
-            self.think_interval = random.uniform(0.18,0.42) #we start the timer again. 
-            self.speed = max(8.0, min(30.0, self.speed + random.uniform(-1.1,1.1))) #it randomly chooses a speed for the AI Bike. 
-            #the minimum speed of the AI bike is 8.0 metres/second. the maximum speed of the AI Bike is 30.0 metres/second. 
-            if near_wall:   #basically means if near_wall==True:
-                self.turning = random.choice([-1,1])
-                #random.choice(sequence=list,tuple,string). it chooses any item from the sequence. each item in the sequence has an
-                #equal probability of being chosen. 
-                #if is near a wall the value of self.turning will be chosen on random, i.e. whether to turn to the left or to the right
-                #will be chosen on random. 
-                #self.turning=1 means to turn to the right
-                #self.turning=-1 means to turn to the left
-
-            else:   #if there is no wall nearbye, it can either choose to turn to either sides or to go straight. 
-                self.turning = random.choices([0,-1,1],[0.7,0.15,0.15])[0]
-                #if self.turning=0 means to go straight
-                #self.turning=1 means to turn to the right
-                #self.turning=-1 means to turn to the left
-        if self.turning:    #basically means if self.turning=True(any integer other than 0)
-                            #so it BASICALLY MEANS if self.turning!=0, i.e. if the AI Bike chooses not to go straight
-            self.rotation_y += self.turning * self.turn_speed * dt
-            #self.turning * self.turn_speed * dt - basically self.turning value = either 1 or -1 and then multiply it with the distiance
-            #to (since self.turn_speed*dt gives the distance to turn)
-            #this result is being added to the self.rotation_y, i.e. the rotation of the AI Bike.
-        self.position += self.forward * (self.speed * dt)
-        #self.speed * dt is the change in position of the bike, i.e. the distance that the bike should move in each frame(in dt time)
-        #self.forward - already described (vector in the direction in which the AI Bike is facing/moving in)
-        #basically same concept as the PlayerBike
-        #just that we don't have to worry about whether this self.speed*dt distance is to be travelled forward or in reverse unlike
-                                                                                                                    #in PlayerBike
-        self.trail.step(self.position)                  #same as PlayerBike
-        self.glow.position = (self.x, 0.02, self.z)     #same as PlayerBike
-
-    def die(self):  #same as PlayerBike
-        self.alive = False
-        self.color = color_tuple_to_color((255,120,50,255), alpha=1.0)
+        self.prev = None
+        self.sync()
+
+    def remember(self):
+        #called right before every simulation tick, so that sync() knows where the bike was one tick ago
+        s = self.state
+        self.prev = (s.x, s.z, s.heading)
+
+    def sync(self, alpha=1.0):
+        #the simulation only moves in whole ticks, but frames come at any time in between. alpha (0 to 1) is how far the frame is
+        #between the last tick and the next one, and the bike is drawn that far between where it was one tick ago and where it is
+        #now, so it moves smoothly at any frame rate (it is drawn at most one tick behind the simulation)
+        s = self.state
+        x, z, heading = s.x, s.z, s.heading
+        if self.prev and alpha < 1.0:
+            px, pz, ph = self.prev
+            x, z = px + (x - px) * alpha, pz + (z - pz) * alpha
+            heading = ph + ((heading - ph + 180) % 360 - 180) * alpha  #(the short way round, in case the heading wrapped around)
+        self.position = (x, 0.5, z)
+        self.rotation = (0, heading, 0)
+        self.glow.position = (x, 0.02, z)
+        self.trail.sync(s.trail)
+        if not s.alive:
+            self.color = color_tuple_to_color(self.dead_col, alpha=1.0)
+
+#the phases of a frame the profiler measures. "bikes" and "collisions" are measured inside Match.step, and so is "bookkeeping": what
+#is done around every tick that isn't the simulation (the views remembering where the bikes were, the recorder's writes, the rewind
+#snapshots and the telemetry samples), so that their time isn't blamed on the bikes
+PROFILE_PHASES = ("input", "bikes", "collisions", "bookkeeping", "view_sync", "entities", "camera", "grid", "lod")
+
+# Picks how much is drawn from how long the frames take
+class AdaptiveQuality:
+    #average is a running average of the frame time (every frame moves it 5% of the way to the new frame time, so one slow frame
+    #doesn't change it much but a few seconds of them do). it has to stay above budget * 1.25 for a second before the quality goes
+    #one level down, and below budget * 1.1 for 5 seconds before it goes back up (with vsync on, frames never get under the budget)
+    def __init__(self, budget=FRAME_BUDGET, levels=QUALITY_LEVELS):
+        self.budget = budget
+        self.levels = levels
+        self.level = 0          #0 is the best quality, len(levels)-1 the cheapest
+        self.average = budget
+        self.timer = 0.0        #how long the average has been on the same side of the limits
+        self.changed = True     #if the level changed since the settings were last handed out
+
+    def update(self, dt):
+        self.average += (dt - self.average) * 0.05
+        if self.average > self.budget * 1.25 and self.level < len(self.levels) - 1:
+            self.timer += dt
+            if self.timer > 1.0: self.set_level(self.level + 1)
+        elif self.average < self.budget * 1.1 and self.level > 0:
+            self.timer += dt
+            if self.timer > 5.0: self.set_level(self.level - 1)
+        else:
+            self.timer = 0.0
+
+    def set_level(self, level):
+        self.level = level
+        self.timer = 0.0
+        self.changed = True
+
+    @property
+    def settings(self):
+        #(trail lod distance, grid draw distance) of the current level
+        return self.levels[self.level]
+
+# The menu that appears when a match is over
+class MatchMenu:
+    #building the panel, its Texts and its Buttons took about 10 ms (every Text builds a mesh for its letters), which was a visible
+    #hitch at the end of every match, and restart() destroyed it all again. now it is built once, hidden, and only switched on and
+    #off. the result line ("YOU WIN", "AI WINS"...) is the only thing that changes, so every result gets its own Text the first time
+    #it comes up and that Text is reused from then on (changing the text of one Text would rebuild its mesh every time)
+    def __init__(self, on_restart, on_exit):
+        self.panel = Entity(parent=camera.ui, model='quad', color=Color(0,0,0,0.7), scale=(1.2, .6), z=0)
+        #this is basically the main background panel for the menu.
+        Text(parent=self.panel, text="Match Over", scale=2.0, y=0.22, origin=(0,0), color=color.white)
+        btn_new = Button(parent=self.panel, text="New Game", scale=(0.35, 0.18), y=-0.22, x=-0.18, on_click=on_restart)
+        #on_click=on_restart, i.e. upon click of this button we have to call the on_restart function.
+        btn_exit = Button(parent=self.panel, text="Exit", scale=(0.35, 0.18), y=-0.22, x=0.18, on_click=on_exit)
+        btn_new.text_color = color.black
+        btn_exit.text_color = color.black
+        btn_new.color = color_tuple_to_color((230,230,230,255))
+        btn_exit.color = color_tuple_to_color((230,230,230,255))
+        self.results = {}       #text of the result line -> its Text
+        self.result = None      #the Text that is showing right now
+        self.panel.enabled = False
+
+    @property
+    def shown(self):
+        return self.panel.enabled
+
+    def show(self, text, col):
+        if self.result: self.result.enabled = False
+        self.result = self.results.get(text)
+        if self.result is None:
+            self.result = self.results[text] = Text(parent=self.panel, text=text, scale=1.5, y=0.0, origin=(0,0))
+        self.result.color = col
+        self.result.enabled = True
+        self.panel.enabled = True
+
+    def hide(self):
+        self.panel.enabled = False
+
+def brain_pool():
+    #the worker processes for the ai bikes with a brain (None if there are none). a frame never waits for their answers
+    policies = [AI_POLICY] if ROSTER is None else [spec.get("policy", {}) for spec in ROSTER]
+    if not any(policy.get("brain") for policy in policies): return None
+    from tron.brains import BrainPool   #(only imported when it is needed, it isn't part of the startup otherwise)
+    return BrainPool(workers=2, processes=True)
 
 class TronGame:
-    def __init__(self):
+    #replay is the path of a recorded match to watch instead of playing (see tron.replay), record is a folder to record every
+    #match that is played into (one file per match), arena the arena to play in (text like ARENA, ARENA if it is None), telemetry a
+    #folder for tron.telemetry's files (TELEMETRY if it is None)
+    def __init__(self, replay=None, record=None, arena=None, telemetry=None):
         window.color = color.black              #we are setting the colour of the main window's background to black. 
         DirectionalLight().enabled = False      #we are turning off the default DirectionalLight (like the sun)
         AmbientLight(color=color.rgb(0,0,0))    #we are adding an ambient light. 
         #basically we are trying to bring the classic tron game theme to our game by setting these colours. 
-        self.bounds = 72.0                      #setting the size of the arena. 
-        self.grid = Grid(size=self.bounds)      #creating the Grid for the floor. Grid is a class we created. 
-        self.walls = Boundary(size=self.bounds) #Creating the boundary walls. Boundary is a class we created. 
+        self.replay = Replay(replay) if replay else None
+        #the arena of the match (a replay plays in the one it was recorded in)
+        self.arena = self.replay.match.arena if self.replay else parse_arena(arena or ARENA)
+        self.bounds = self.arena.extent         #setting the size of the arena. 
+        self.grid = Grid(arena=self.arena)      #creating the Grid for the floor. Grid is a class we created. 
+        self.walls = Boundary(arena=self.arena) #Creating the boundary walls. Boundary is a class we created. 
         col_player = BIKE_COLORS[0]["player"]   #
         col_ai = BIKE_COLORS[0]["ai"]
-        self.player = PlayerBike(col=col_player)    #creating the object for player's bike using the PlayerBike class. 
-        self.ai = AIBike(col=col_ai, arena_bounds=self.bounds)  #similary with the AIBike class. 
-        #self.player is now a PlayerBike class object that is an instance variable of the TronGame class.  
-        #self.ai is now an AIBike class object that is an instance variable of the TronGame class. 
-        self.player.reset() #bringing the self.player to start position. 
-        self.ai.reset()     #bringing the self.ai to start position.
+        self.record = record
+        self.recorder = None
+        if self.replay:
+            self.match = self.replay.match  #the replay sets up the recorded match itself
+            self.human_keys = {}            #and nobody drives, the recorded inputs do
+        else:
+            #(a recorded match can't have a wall clock limit for the ai's thinking, it wouldn't play out the same way again)
+            self.match = Match(arena=self.arena, ai=AI_POLICY, plan_seconds=None if record else PLAN_SECONDS, roster=ROSTER,
+                               pool=brain_pool())
+            #the simulation of the match. everything below only draws what happens in it
+            #the keys of every human bike (bike name -> (forward, reverse, left, right))
+            self.human_keys = {spec["name"]: spec.get("keys", DEFAULT_KEYS) for spec in (ROSTER or []) if spec.get("human")}
+            if ROSTER is None: self.human_keys = {"player": DEFAULT_KEYS}
+        self.rewind = Rewind(self.match, seconds=REWIND_KEEP) if not (self.replay or record) else None
+        #the match statistics (not of a replay, that match was already played). the writer thread finishes its files when python exits
+        self.telemetry = None
+        folder = telemetry or TELEMETRY
+        if folder and not self.replay:
+            from tron.telemetry import Telemetry    #(only imported when it is used, it starts a thread)
+            self.telemetry = self.match.telemetry = Telemetry(folder)
+            atexit.register(self.telemetry.close)
+        self.views = []         #one BikeView (the Entity that shows a bike) for every bike of the match, in the same order
+        for k, bike in enumerate(self.match.bikes):
+            if bike.name == "player": col, dead = col_player, (255,60,60,255)
+            elif bike.name == "ai": col, dead = col_ai, (255,120,50,255)
+            else: col, dead = ROSTER_COLORS[k % len(ROSTER_COLORS)], (90,90,90,255)
+            self.views.append(BikeView(bike, col, dead))
+        self.view_of = {view.state.name: view for view in self.views}
+        self.player = self.view_of.get("player", self.views[0])    #the bike the camera follows (the first one if nobody is "player")
+        self.ai = self.view_of.get("ai")
+        self.accumulator = 0.0  #the frame time that has not been simulated yet (the simulation always moves in steps of DT)
         self.cam = ChaseCam(self.player)    #creates an object of class ChaseCam to chase the player's bike. 
         self.over = False                   #self.over = False since the game is running. If/when the game is over, it will be = True. 
         #below are basically code for menu ui
-        self.menu_panel = None             
+        self.menu = MatchMenu(on_restart=self.restart, on_exit=lambda: sys.exit(0))
         self.status = Text("", origin=(0,0), scale=1.5, y=0.42, color=color.white)  
-        self.hint = Text("W/S move • A left • D right • Q reset", origin=(0, -0.5), x=0, y=-0.47, scale=0.85, color=color.rgba(255,255,255,150))
+        hint = "REPLAY • LEFT/RIGHT jump 5s • Q from the start • F3 stats" if self.replay else "W/S move • A left • D right • Q reset • F3 stats"
+        if self.rewind: hint = hint.replace(" • F3", f" • R rewind {REWIND_SECONDS}s • F3")
+        self.hint = Text(hint, origin=(0, -0.5), x=0, y=-0.47, scale=0.85, color=color.rgba(255,255,255,150))
         self.win_color = color_tuple_to_color(col_player, alpha=1.0)
         self.lose_color = color_tuple_to_color(col_ai, alpha=1.0)
-
-    def clamp(self, thing):
-        #this is a method that "clamps" the value of "thing" to be inside the boundary/to be smaller than b and larger than +b. 
-        #the clamp method takes an argument "thing" and makes sure it does not go out of the boundaries, i.e. makes sure its x and z stay
-        #inside the arena's boundaries. 
-        b = self.bounds
-        #thing.x returns the x coordinates of the point "thing"
-        thing.x = max(-b, min(b, thing.x))  #thing.x will always be between -b and +b
-        #thing.z returns the y coordinates of the point "thing"
-        thing.z = max(-b, min(b, thing.z))  #thing.z will always be between -b and +b
-
-    def check_collisions(self):
-        # Player runs into their own trail's or the AI Bike's trail, then the player dies. 
-        skip = 10   #this tells method when it checks for if collision with the trail has occured, to skip the recent 10 trails
-        rad = 0.30  #this is the radius of the player's bike when it is considered as a 2D circle. 
-        if self.player.alive and (self.player.trail.collides(self.player.position, skip, rad) or self.ai.trail.collides(self.player.position, skip, rad)):
-            #if self.player.alive means if self.player.alive==True, i.e. if the player's bike is alive.
-            #and if either the player's bike has collided with its own trail OR if the player's bike has collided with the trail of the AI bike
-            self.player.die()   #then the player must die
-            self.end_game()     #and the game must end. i.e. GAME OVER. 
-        if self.ai.alive and (self.ai.trail.collides(self.ai.position, skip, rad) or self.player.trail.collides(self.ai.position, skip, rad)):
-            #if self.ai.alive means if self.ai.alive==True, i.e. if the ai player is still alive. 
-            #and if either the ai bike has collided with its own trail OR if the ai bike has collided with the player's bike's trail. 
-            self.ai.die()   #then the ai player must die
-            self.end_game() #and the game must end. i.e. GAME OVER. 
+        #the frame profiler (F3 shows/hides the overlay and turns the measuring on/off, F4 writes the measured frames to a csv file).
+        #while it is off self.match.profiler is None and update() skips all the measuring, so it costs (almost) nothing
+        self.frame_profiler = FrameProfiler(PROFILE_PHASES, counters=("frame_dt", "entity_count", "segment_count"))
+        #the overlay's Text (made once and only shown while the profiler is on)
+        self.profile_text = Text("", origin=(-0.5, 0.5), x=-0.86, y=0.48, scale=0.75, color=color.rgba(255,255,255,220), enabled=False)
+        self.startup = {}           #how long the start of the game took, see main()
+        self.quality = AdaptiveQuality()
+        self.lod_countdown = 0      #the frames until the trails' lod is updated again
+        self.keys_down = set()      #the keys that were held on the last frame (so that holding F3 doesn't toggle it on every frame)
+        self.start_recording()
 
     def restart(self):
         #this function is basically to reset the game menu and all that stuff when the game ends/race ends. 
-        if self.menu_panel:             #if self.menu_panel still exists on the screen
-            destroy(self.menu_panel)    #we destroy it
-            self.menu_panel = None      #and we reset the self.menu_panel variable to None. 
+        self.menu.hide()                #hides the menu (it is kept for the next time a match ends)
         self.over = False               #if the game is not over, i.e. if the game is still going on
-        self.player.reset()             #it resets everything related to the player. 
-        self.ai.reset()                 #it resets everything related to the ai. 
+        if self.replay:
+            self.replay.seek(0)         #a replay goes back to its first tick
+        else:
+            self.match.reset()          #it resets everything related to the player and the ai (and their trails) in the simulation. 
+            self.start_recording()
+            if self.rewind:
+                self.rewind.clear()     #(the snapshots of the last match can't be used in the new one)
+                self.rewind.record()
+        for view in self.views: view.reset()    #and puts the bike views back to match it
+        self.accumulator = 0.0
         self.status.text = ""           #it clears the "You win" or "You lose" status on the screen to nothing (hence an empty string). 
-        self.player.trail.clear()       #it clears the trail of the player
-        self.ai.trail.clear()           #it clears the trail of the ai
+
+    def start_recording(self):
+        #starts a new file in the record folder for the match that is about to be played (if recording is on)
+        if not self.record: return
+        if self.recorder: self.recorder.close()
+        os.makedirs(self.record, exist_ok=True)
+        path = os.path.join(self.record, time.strftime("match_%Y%m%d_%H%M%S.trnr"))
+        self.recorder = Recorder(path, self.match)
+
+    def seek(self, tick):
+        #jumps the replay to tick (it only has to simulate from the keyframe before it) and redraws the bikes and their trails
+        self.replay.seek(tick)
+        self.jumped()
+
+    def go_back(self):
+        #practice mode: the match goes REWIND_SECONDS back (see tron.rewind, it is much quicker than a seek) and carries on from there
+        if self.rewind.back(REWIND_SECONDS * TICK_RATE): self.jumped()
+
+    def jumped(self):
+        #the match jumped to another tick: the menu and the status go away (it may have been over) and the views are redrawn
+        self.menu.hide()
+        self.over = False
+        self.status.text = ""
+        for view in self.views: view.reset()
+        self.accumulator = 0.0
 
     def end_game(self):
         #this method/function is called everytime a crash occurs. the job of this function is to basically figure out who won the current
         #game, the player or the ai. 
         if self.over: return    #if self.over==True, then return to exit the function. 
         self.over = True        #else we end the game. and this now stops the update() from running anymore. 
-        if not self.player.alive and not self.ai.alive: #if self.player.alive==False and self.ai.alive==False:
+        if self.recorder: self.recorder.close()     #(this writes the number of ticks and the winner into the file)
+        self.show_status()
+        self.show_menu()        #now we show the menu after the game is over so as to exit or start a new game/race
+
+    def show_status(self):
+        #shows who won the match (self.match.winner is "draw", "ai", "player" or the name of another bike of the ROSTER)
+        winner = self.match.winner
+        if winner == "draw":            #if both the player and the ai are not alive
             self.status.text = "DRAW"   #then self.status.text, i.e. the status to be shown on the screen is "DRAW"
                                         #(since both the player and the ai died)
             self.status.color = color.yellow    #basically the color in which the status is to be shown on the screen. 
-        elif not self.player.alive:                 #if onlt the player is not alive, then the ai wins. 
+        elif winner == "ai":                        #if onlt the player is not alive, then the ai wins. 
             self.status.text = "AI WINS"
             self.status.color = self.lose_color     #if only the ai is not alive, then the player wins. 
-        elif not self.ai.alive:
+        elif winner == "player":
             self.status.text = "YOU WIN"
             self.status.color = self.win_color
-        self.show_menu()                            #now we show the menu after the game is over so as to exit or start a new game/race
+        elif winner is not None:
+            self.status.text = f"{winner.upper()} WINS"
+            self.status.color = color_tuple_to_color(self.view_of[winner].base_col, alpha=1.0)
 
     def show_menu(self):
-        #this is the menu that appears on the screen after the game is over. 
-        panel = Entity(parent=camera.ui, model='quad', color=Color(0,0,0,0.7), scale=(1.2, .6), z=0)    
-        Text(parent=panel, text="Match Over", scale=2.0, y=0.22, origin=(0,0), color=color.white)
-        Text(parent=panel, text=self.status.text, scale=1.5, y=0.0, origin=(0,0), color=self.status.color)
-        #this is basically the main background panel for the menu. 
-        def do_restart(): self.restart()    #these are wrapper functions. they are created so as to pass these to the buttons.
-        def do_exit(): sys.exit(0)          #these are wrapper functions. they are created so as to pass these to the buttons.
-
-        btn_new = Button(parent=panel, text="New Game", scale=(0.35, 0.18), y=-0.22, x=-0.18, on_click=do_restart)
-        #on_clock= do_start, i,e uppon click of this button we have to call the do_restart functon. 
-        btn_exit = Button(parent=panel, text="Exit", scale=(0.35, 0.18), y=-0.22, x=0.18, on_click=do_exit)
-        btn_new.text_color = color.black
-        btn_exit.text_color = color.black
-        btn_new.color = color_tuple_to_color((230,230,230,255))
-        btn_exit.color = color_tuple_to_color((230,230,230,255))
-        self.menu_panel = panel
+        #this is the menu that appears on the screen after the game is over (see MatchMenu, it is only switched on here)
+        self.menu.show(self.status.text, self.status.color)
+
+    def key_pressed(self, key):
+        #True only on the frame the key goes down (the same thing the _q_held trick below does for Q)
+        if not held_keys[key]:
+            self.keys_down.discard(key)
+            return False
+        if key in self.keys_down: return False
+        self.keys_down.add(key)
+        return True
+
+    def toggle_profiler(self):
+        if self.match.profiler:
+            self.match.profiler = None
+            self.profile_text.enabled = False
+        else:
+            self.frame_profiler.reset()     #starts from an empty window, the frames from before were not measured
+            self.match.profiler = self.frame_profiler
+            self.profile_text.text = ""
+            self.profile_text.enabled = True
+
+    def update_profile_text(self):
+        #rewrites the overlay. (changing a Text rebuilds its whole mesh, so this is only done every 15 frames, not on every frame)
+        prof = self.frame_profiler
+        lines = [f"frame {prof.latest('frame_dt')*1e3:6.2f} ms   entities {int(prof.latest('entity_count'))}   "
+                 f"segments {int(prof.latest('segment_count'))}   quality {self.quality.level}", "phase        mean    p95    max (ms)"]
+        for phase, s in prof.summary().items():
+            lines.append(f"{phase:<11}{s['mean']:6.3f} {s['p95']:6.3f} {s['max']:6.2f}")
+        self.profile_text.text = "\n".join(lines)
+
+    def end_profile_frame(self, prof, dt):
+        segments = sum(len(bike.trail.segments) for bike in self.match.bikes)
+        prof.end_frame(dt, len(scene.entities), segments)
+        if prof.frames % 15 == 0: self.update_profile_text()
 
     def update(self):
         #the update function is a special pre built function in the Ursina library that is called automatically on every single frame. 
         #this function is basically responsible for running all the other parts of the game in the correct order. 
         dt = time.dt    #stores the time since the last frame in a variable named as "dt" (time.dt is the "time since the last frame")
+        if self.telemetry: self.telemetry.frame(dt)
+        if self.key_pressed('f3'): self.toggle_profiler()
+        if self.key_pressed('f4'): print("frame times written to", self.frame_profiler.dump("frame_times.csv"))
+        prof = self.match.profiler  #None while the profiler is off, then every `if prof:` below is skipped
+        if self.replay:
+            if self.key_pressed('left arrow'): self.seek(self.match.tick - 5*60)
+            if self.key_pressed('right arrow'): self.seek(self.match.tick + 5*60)
+        elif self.rewind and self.key_pressed('r'): self.go_back()
+        if prof: prof.begin_frame()
         if held_keys['q']:  #if the "q" is pressed is True:
             if not hasattr(self, "_q_held") or not self._q_held:
                 #hasattr basically checks if a variable has a certain attribute. 
@@ -605,29 +881,99 @@ class TronGame:
         else:
             self._q_held = False  
 
-        if self.over: return
+        if self.over:
+            if prof:
+                prof.mark("input")  #(the keys, Q above, are all a frame does while the menu is up)
+                self.end_profile_frame(prof, dt)
+            return
         #if the game is over, i.e. self.over==True, then exit the function. 
         #if the game is not over
-        self.player.step(dt)    #so if the game keeps running then update the player
-        self.ai.step(dt)        #so if the game keeps running then update the ai
-        self.clamp(self.player) 
-        self.clamp(self.ai)
-        self.check_collisions()
-
-        if not self.player.alive and not self.ai.alive:
-            self.status.text = "DRAW"
-            self.status.color = color.yellow
-        elif not self.player.alive:
-            self.status.text = "AI WINS"
-            self.status.color = self.lose_color
-        elif not self.ai.alive:
-            self.status.text = "YOU WIN"
-            self.status.color = self.win_color
+        #W accelerates forward and S reverses, A turns left and D turns right (or the keys the ROSTER gave a human bike)
+        inputs = {name: ((1 if held_keys[fwd] else 0) - (1 if held_keys[rev] else 0),
+                         (1 if held_keys[right] else 0) - (1 if held_keys[left] else 0))
+                  for name, (fwd, rev, left, right) in self.human_keys.items()}
+        #the simulation always moves in fixed steps of DT seconds, no matter how long this frame took. the frame time is collected in
+        #self.accumulator and as many whole steps as fit into it are simulated (the rest waits for the next frame), but never more
+        #than MAX_CATCH_UP of them: the time beyond that is dropped
+        self.accumulator = min(self.accumulator + dt, MAX_CATCH_UP * DT)
+        if prof: prof.mark("input")
+        while self.accumulator >= DT and not self.match.over:
+            #(the match itself marks the "bikes" and "collisions" phases)
+            for view in self.views: view.remember()
+            if self.replay:
+                if not self.replay.step(): break    #the recording is over (it may have been stopped before anybody crashed)
+            elif self.recorder: self.recorder.step(inputs=inputs)   #the recorder steps the match and writes the inputs down
+            else: self.match.step(inputs=inputs)
+            if self.rewind: self.rewind.record()
+            self.accumulator -= DT
+        if prof: prof.mark("bookkeeping")   #(the rewind snapshot of the last tick, the ones before went in at the next Match.step)
+        alpha = 1.0 if self.match.over else self.accumulator / DT  #how far this frame is on the way to the next tick
+        for view in self.views: view.sync(alpha)    #copies the simulation's bikes onto their Entities
+        if prof: prof.mark("view_sync")
+        if self.match.over: self.end_game()
+        if prof: prof.mark("entities")  #end_game() shows the menu
 
         self.cam.update()
+        if prof: prof.mark("camera")
         self.grid.update_fade(self.player.position)
-
-app = Ursina()      #initialises the entire Ursina game engine and creates the game's application window
-game = TronGame()   #game is an instance object of TronGame class
-def update():game.update() 
-app.run()                   
\ No newline at end of file
+        if prof: prof.mark("grid")
+        self.update_lod(dt)
+        if prof:
+            prof.mark("lod")
+            self.end_profile_frame(prof, dt)
+
+    def update_lod(self, dt):
+        #hands the quality level's settings to the trails and the grid. the engine itself already skips every trail chunk and grid
+        #tile that is outside of what the camera sees, this only picks the coarse meshes of the far ones
+        quality = self.quality
+        quality.update(dt)
+        self.lod_countdown -= 1
+        if self.lod_countdown > 0 and not quality.changed: return
+        self.lod_countdown = LOD_INTERVAL
+        lod_distance, self.grid.draw_distance = quality.settings
+        quality.changed = False
+        x, z = camera.world_position.x, camera.world_position.z
+        for view in self.views: view.trail.update_lod(x, z, lod_distance)
+
+def main(argv=None):
+    #python game.py                   plays the game
+    #python game.py --record replays  plays the game and records every match into the replays folder
+    #python game.py --replay FILE     watches a recorded match
+    #python game.py --arena circle:120  plays in another arena than ARENA (see tron.arena for how to write one)
+    #python game.py --telemetry stats   writes the statistics of every match into the stats folder (see tron.telemetry)
+    #python game.py --time-startup    prints how long the start took and quits after the first frame (bench.py keeps track of it
+    #                                 like that). --no-window starts ursina without a window, for machines that have no screen
+    args = sys.argv[1:] if argv is None else argv
+    option = lambda name: args[args.index(name) + 1] if name in args[:-1] else None
+    #how long each part of the start took (in seconds): importing everything, starting the engine, setting up the game, and from
+    #STARTED until the first frame was drawn
+    startup = {"imports": time.perf_counter() - STARTED}
+    t = time.perf_counter()
+    if "--no-window" in args:
+        from panda3d.core import loadPrcFileData
+        loadPrcFileData("", "audio-library-name null")
+        app = Ursina(window_type="none")
+    else:
+        app = Ursina()  #initialises the entire Ursina game engine and creates the game's application window
+    startup["engine"] = time.perf_counter() - t
+    t = time.perf_counter()
+    game = TronGame(replay=option("--replay"), record=option("--record"), arena=option("--arena"),
+                    telemetry=option("--telemetry"))  #game is an instance object of TronGame class
+    startup["game"] = time.perf_counter() - t
+    game.startup = startup
+    frames = 0
+    def update():
+        nonlocal frames
+        frames += 1
+        if frames == 2:     #(the engine draws a frame after every update, so by the second update the first frame is on the screen)
+            startup["first_frame"] = time.perf_counter() - STARTED
+            if "--time-startup" in args:
+                print("startup: " + ", ".join(f"{name} {seconds*1000:.0f} ms" for name, seconds in startup.items()))
+                application.quit()
+                return
+        game.update()
+    Entity(name="game loop", update=update)     #ursina calls the update() of every Entity on every frame
+    app.run()
+
+if __name__ == "__main__":  #only when game.py is run itself (so that bench.py can import the classes without starting the game)
+    main()
@@ -0,0 +1,59 @@
+#Match.snapshot()/restore(): a match that went on and was put back has to be the same as a match simulated straight to that tick,
+#down to the trails' runs and spatial hashes and the shared grids (the broadphase and the occupancy grid), and go on the same way
+from tron.sim import AIBike, Match
+
+ROSTER = [{"name": "a", "policy": {"planner": "flood"}}, {"name": "b"}, {"name": "c", "policy": {"planner": "flood"}}]
+SEED = 2    #(a match that lasts over 2000 ticks, so the trails get past their 1000 pieces and start evicting)
+
+def run_to(match, tick):
+    while not match.over and match.tick < tick: match.step()
+    assert match.tick == tick
+
+def trail_state(trail):
+    #everything a trail keeps. the cells of the run hash hold [run, count] lists, made into tuples to compare them
+    state = [trail.last_pos, list(trail.segments), {key: [tuple(e) for e in bucket] for key, bucket in trail.index.cells.items()}]
+    if trail.runs is not None:
+        live = range(trail.runs.first_id, trail.runs.first_id + len(trail.runs))
+        state += [list(trail.runs), [trail.run_pieces[rid % trail.max_segments] for rid in live], trail.committed, trail.wedge]
+    return state
+
+def match_state(match):
+    #(not tron.replay's pack_state: that has the whole rings of the trails, and the slots no live piece or run is in keep whatever
+    #was last written there, which a restore doesn't clean up)
+    bikes = [(bike.x, bike.z, bike.heading, bike.speed, bike.alive, bike.cause,
+              (bike.timer, bike.think_interval, bike.turning) if isinstance(bike, AIBike) else None) for bike in match.bikes]
+    return (match.tick, match.over, match.winner, match.rng.getstate(), bikes, [trail_state(bike.trail) for bike in match.bikes],
+            match.broadphase.cells, list(match.occupancy.counts))
+
+def test_restore_is_the_same_as_simulating_to_the_snapshot():
+    match = Match(seed=SEED, roster=ROSTER)
+    match.keep_history()
+    run_to(match, 1400)
+    assert max(bike.trail.segments.first_id for bike in match.bikes) > 0     #(pieces were evicted already)
+    snapshot = match.snapshot()
+    run_to(match, 1650)
+    match.restore(snapshot)
+    fresh = Match(seed=SEED, roster=ROSTER)
+    run_to(fresh, 1400)
+    assert match_state(match) == match_state(fresh)
+    #and from there both go on the same way to the end of the match
+    for m in (match, fresh):
+        while not m.over: m.step()
+    assert (match.tick, match.winner) == (fresh.tick, fresh.winner)
+    assert match_state(match) == match_state(fresh)
+
+def test_restore_back_and_forth():
+    #a few snapshots restored out of order (the newest first, like tron.rewind), each time against the states seen on the way
+    match = Match(seed=SEED, roster=ROSTER)
+    match.keep_history()
+    seen = {}
+    snapshots = {}
+    for tick in range(900, 1600, 100):
+        run_to(match, tick)
+        seen[tick] = match_state(match)
+        snapshots[tick] = match.snapshot()
+    for tick in (1500, 1300, 1200, 900):
+        match.restore(snapshots[tick])
+        assert match_state(match) == seen[tick]
+    run_to(match, 1500)
+    assert match_state(match) == seen[1500]
@@ -0,0 +1,98 @@
+#the spatial hashes of the trails (tron.geometry) against brute force: every segment within a circle has to be found by a query of
+#that circle, through inserts, evictions from the oldest end and take backs from the newest end (what restore() does)
+import math
+import random
+
+from tron.geometry import RunHash, SegmentBuffer, SpatialHash
+from tron.sim import BIKE_RADIUS, SKIP_RECENT, Trail
+
+def distance(px, py, ax, ay, bx, by):
+    #the distance from (px, py) to the segment from a to b, worked out the slow and obvious way
+    abx, aby = bx - ax, by - ay
+    ab2 = abx*abx + aby*aby
+    t = 0.0 if ab2 == 0 else max(0.0, min(1.0, ((px - ax)*abx + (py - ay)*aby) / ab2))
+    return math.hypot(px - ax - abx*t, py - ay - aby*t)
+
+def walk(rng, n, step=0.6):
+    #n segments of a bike wandering around (it turns now and then, like the ai)
+    x, y, heading = 0.0, 0.0, 0.0
+    segments = []
+    for _ in range(n):
+        heading += rng.choice((0, 0, 0, 25, -25))
+        nx, ny = x + math.sin(math.radians(heading)) * step, y + math.cos(math.radians(heading)) * step
+        segments.append((x, y, nx, ny))
+        x, y = nx, ny
+    return segments
+
+def test_spatial_hash_finds_every_segment_near_a_point():
+    rng = random.Random(1)
+    buffer = SegmentBuffer(200)
+    index = SpatialHash()
+    for segment in walk(rng, 700):
+        evicted = buffer.append(*segment)
+        if evicted is not None: index.remove_oldest(*evicted)
+        sid = buffer.first_id + len(buffer) - 1
+        index.insert(sid, *buffer.get(sid))
+    live = {sid: buffer.get(sid) for sid in range(buffer.first_id, buffer.first_id + len(buffer))}
+    xs = [p for s in live.values() for p in (s[0], s[2])]
+    ys = [p for s in live.values() for p in (s[1], s[3])]
+    for _ in range(3000):
+        px, py = rng.uniform(min(xs) - 2, max(xs) + 2), rng.uniform(min(ys) - 2, max(ys) + 2)
+        radius = rng.choice((0.3, 0.5, 1.5, 4.0))
+        found = index.query(px, py, radius)
+        near = {sid for sid, s in live.items() if distance(px, py, *s) <= radius}
+        assert near <= found
+        assert found <= set(live)   #(nothing that was evicted is still in there)
+        limit = buffer.first_id + len(buffer)
+        assert buffer.hits_circle(found, limit, px, py, radius*radius) == bool(near)
+
+def test_spatial_hash_is_empty_again_after_taking_everything_out():
+    #oldest first and newest first, with float32 end points (like the trails hand it) so that insert and remove see the same cells
+    rng = random.Random(2)
+    buffer = SegmentBuffer(400)
+    index = SpatialHash()
+    for segment in walk(rng, 300):
+        buffer.append(*segment)
+        sid = buffer.first_id + len(buffer) - 1
+        index.insert(sid, *buffer.get(sid))
+    ids = list(range(buffer.first_id, buffer.first_id + len(buffer)))
+    for sid in ids[:150]: index.remove_oldest(*buffer.get(sid))
+    for sid in reversed(ids[150:]): index.remove_newest(*buffer.get(sid))
+    assert index.cells == {}
+
+def test_run_hash_finds_every_run_with_a_piece_near_a_point():
+    #pieces are added to runs of random length and taken out oldest first, a query has to find the run of every piece near it
+    rng = random.Random(3)
+    index = RunHash()
+    pieces = []     #(run, segment) of every piece in the hash, oldest first
+    run = 0
+    for segment in walk(rng, 600, step=0.3):
+        if rng.random() < 0.1: run += 1
+        index.add_piece(run, *segment)
+        pieces.append((run, segment))
+        if len(pieces) > 250: index.remove_piece(*pieces.pop(0)[1])
+    for _ in range(3000):
+        run, (ax, ay, bx, by) = rng.choice(pieces)
+        px, py = ax + rng.uniform(-1.5, 1.5), ay + rng.uniform(-1.5, 1.5)
+        radius = rng.choice((0.3, 1.0))
+        found = index.query(px, py, radius)
+        assert {r for r, s in pieces if distance(px, py, *s) <= radius} <= found
+        assert found <= {r for r, _ in pieces}
+
+def test_trail_collides_like_brute_force():
+    #Trail(coalesce=False) against every old enough piece one by one
+    rng = random.Random(4)
+    trail = Trail(max_segments=300, coalesce=False)
+    x, z, heading = 0.0, 0.0, 0.0
+    for _ in range(600):
+        heading += rng.choice((0, 0, 6, -6))
+        x += math.sin(math.radians(heading)) * 0.35
+        z += math.cos(math.radians(heading)) * 0.35
+        trail.step(x, z)
+    segments = trail.segments
+    checked = [segments.get(sid) for sid in range(segments.first_id, segments.first_id + len(segments) - SKIP_RECENT)]
+    for _ in range(3000):
+        ax, az, _, _ = rng.choice(checked)
+        px, pz = ax + rng.uniform(-1, 1), az + rng.uniform(-1, 1)
+        expected = any(distance(px, pz, *s) <= BIKE_RADIUS for s in checked)
+        assert trail.collides(px, pz) == expected
@@ -0,0 +1,77 @@
+#the swept collision checks (tron.geometry.swept_circle_hit, Trail.sweep) against the discrete test done at many points along the
+#move: the sweep has to find the first time the bike's circle touches a segment, and it can't be jumped over by a fast bike
+import math
+import random
+
+from tron.geometry import swept_circle_hit
+from tron.sim import BIKE_RADIUS, SKIP_RECENT, Trail
+
+SAMPLES = 2000      #how many points along a move the discrete test is done at
+
+def distance(px, py, ax, ay, bx, by):
+    abx, aby = bx - ax, by - ay
+    ab2 = abx*abx + aby*aby
+    t = 0.0 if ab2 == 0 else max(0.0, min(1.0, ((px - ax)*abx + (py - ay)*aby) / ab2))
+    return math.hypot(px - ax - abx*t, py - ay - aby*t)
+
+def first_sample_hit(touches, x0, z0, dx, dz):
+    #the first of the sampled times at which touches(x, z) is true, or None
+    for k in range(SAMPLES + 1):
+        t = k / SAMPLES
+        if touches(x0 + dx*t, z0 + dz*t): return t
+    return None
+
+def check(t, sampled, touches_at):
+    #the sweep's time t against the sampled one: the same hit, no later than the sample that found it and no earlier than the
+    #sample before. a hit the samples missed can only be a graze between two of them
+    if sampled is not None:
+        assert t is not None
+        assert sampled - 1.0 / SAMPLES - 1e-9 <= t <= sampled + 1e-9
+    elif t is not None:
+        assert touches_at(t, 1e-6)
+
+def test_swept_circle_hit_matches_the_sampled_test():
+    rng = random.Random(7)
+    r = BIKE_RADIUS
+    for _ in range(2000):
+        ax, ay = rng.uniform(-3, 3), rng.uniform(-3, 3)
+        angle, length = rng.uniform(0, 2*math.pi), rng.choice((0.0, 0.2, 2.0))
+        bx, by = ax + math.cos(angle) * length, ay + math.sin(angle) * length
+        px, py = rng.uniform(-4, 4), rng.uniform(-4, 4)
+        dx, dy = rng.uniform(-5, 5), rng.uniform(-5, 5)
+        t = swept_circle_hit(ax, ay, bx, by, px, py, dx, dy, r)
+        sampled = first_sample_hit(lambda x, y: distance(x, y, ax, ay, bx, by) <= r, px, py, dx, dy)
+        check(t, sampled, lambda t, eps: distance(px + dx*t, py + dy*t, ax, ay, bx, by) <= r + eps)
+
+def test_fast_bike_cannot_jump_over_a_trail():
+    #a wall of trail along x, and a bike that crosses it in one tick (3 units, 20 ticks per second at 60 units per second): neither
+    #end of the move touches the trail, so the test of the end position alone misses it
+    trail = Trail(coalesce=False)
+    for k in range(60): trail.step(-10.0 + k * 0.33, 0.0)
+    assert not trail.collides(0.0, -1.5) and not trail.collides(0.0, 1.5)
+    t = trail.sweep(0.0, -1.5, 0.0, 1.5)
+    assert t is not None
+    assert abs(t - (1.5 - BIKE_RADIUS) / 3.0) < 1e-3
+
+def test_trail_sweep_matches_sampled_collides():
+    #random fast moves near a wandering trail: Trail.sweep against collides() at every sampled point of the move
+    rng = random.Random(8)
+    trail = Trail(max_segments=400, coalesce=False)
+    x, z, heading = 0.0, 0.0, 0.0
+    for _ in range(600):
+        heading += rng.choice((0, 0, 8, -8))
+        x += math.sin(math.radians(heading)) * 0.35
+        z += math.cos(math.radians(heading)) * 0.35
+        trail.step(x, z)
+    segments = trail.segments
+    checked = [segments.get(sid) for sid in range(segments.first_id, segments.first_id + len(segments) - SKIP_RECENT)]
+    hits = 0
+    for _ in range(300):
+        ax, az, _, _ = rng.choice(checked)
+        x0, z0 = ax + rng.uniform(-3, 3), az + rng.uniform(-3, 3)
+        dx, dz = rng.uniform(-4, 4), rng.uniform(-4, 4)
+        t = trail.sweep(x0, z0, x0 + dx, z0 + dz)
+        sampled = first_sample_hit(trail.collides, x0, z0, dx, dz)
+        check(t, sampled, lambda t, eps: min(distance(x0 + dx*t, z0 + dz*t, *s) for s in checked) <= BIKE_RADIUS + eps)
+        hits += t is not None
+    assert 50 < hits < 300     #(both kinds of moves were tried)
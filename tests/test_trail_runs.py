@@ -0,0 +1,64 @@
+#the coalesced trails (the runs of tron.sim.Trail) against the raw pieces: a run may be up to 2*tolerance away from the pieces it
+#was made of, so collides() may only disagree with the raw pieces for a bike that is that close to the edge of the bike's circle
+import math
+import random
+
+from tron.sim import BIKE_RADIUS, SKIP_RECENT, Trail
+
+def distance(px, py, ax, ay, bx, by):
+    abx, aby = bx - ax, by - ay
+    ab2 = abx*abx + aby*aby
+    t = 0.0 if ab2 == 0 else max(0.0, min(1.0, ((px - ax)*abx + (py - ay)*aby) / ab2))
+    return math.hypot(px - ax - abx*t, py - ay - aby*t)
+
+def drive(trails, rng, ticks, speed=0.33):
+    #drives every trail along the same path: straight lines, slow curves and sharp turns, and now and then a lag jump that the
+    #trail cuts into pieces
+    x, z, heading, turning = 0.0, 0.0, 0.0, 0.0
+    for tick in range(ticks):
+        if tick % 40 == 0: turning = rng.choice((0.0, 0.0, 0.4, -0.4, 3.0, -3.0))
+        heading += turning
+        step = speed * (6 if rng.random() < 0.01 else 1)
+        x += math.sin(math.radians(heading)) * step
+        z += math.cos(math.radians(heading)) * step
+        for trail in trails: trail.step(x, z)
+
+def test_coalesced_collides_like_the_raw_pieces():
+    rng = random.Random(5)
+    coalesced, raw = Trail(max_segments=600), Trail(max_segments=600, coalesce=False)
+    drive((coalesced, raw), rng, 2000)     #(more pieces than max_segments: the oldest runs were shortened by evictions)
+    segments = raw.segments
+    assert list(coalesced.segments) == list(segments)
+    assert len(coalesced.runs) < len(segments) / 2
+    checked = [segments.get(sid) for sid in range(segments.first_id, segments.first_id + len(segments) - SKIP_RECENT)]
+    tolerance = 2 * coalesced.tolerance
+    mismatches = 0
+    for _ in range(5000):
+        ax, az, _, _ = rng.choice(checked)
+        px, pz = ax + rng.uniform(-0.6, 0.6), az + rng.uniform(-0.6, 0.6)
+        if coalesced.collides(px, pz) == raw.collides(px, pz): continue
+        mismatches += 1
+        nearest = min(distance(px, pz, *s) for s in checked)
+        assert abs(nearest - BIKE_RADIUS) <= tolerance
+    assert mismatches < 250
+
+def test_straight_line_is_one_run():
+    trail = Trail()
+    for k in range(300): trail.step(0.0, k * 0.33)
+    assert len(trail.segments) == 299
+    assert len(trail.runs) == 1
+
+def test_every_piece_is_close_to_its_run():
+    rng = random.Random(6)
+    trail = Trail(max_segments=500)
+    drive((trail,), rng, 1500)
+    runs, segments = trail.runs, trail.segments
+    pid = segments.first_id
+    for rid in range(runs.first_id, runs.first_id + len(runs)):
+        run = runs.get(rid)
+        for _ in range(trail.run_pieces[rid % trail.max_segments]):
+            ax, az, bx, bz = segments.get(pid)
+            assert distance(ax, az, *run) <= 2 * trail.tolerance + 1e-4
+            assert distance(bx, bz, *run) <= 2 * trail.tolerance + 1e-4
+            pid += 1
+    assert pid == trail.committed
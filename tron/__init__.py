@@ -0,0 +1,9 @@
+#tron is the part of the game that doesn't need a window: the simulation core and the helpers it is built from.
+#the ursina view of the game lives in game.py. the modules that are only needed by some tools (tron.replay, tron.rewind, tron.net,
+#tron.brains for the ai brains in worker threads or processes, tron.telemetry, tron.host for many matches in one process...) are
+#imported by them.
+from .geometry import SegmentBuffer, SpatialHash
+from .profiler import FrameProfiler
+from .sim import DT, TICK_RATE, AIBike, Bike, Match, PlayerBike, Trail
+#tron.batch (the numpy batch simulator) and tron.env (the reinforcement learning environments) are not imported here, so that the
+#rest of the package works without numpy
@@ -0,0 +1,141 @@
+#the shape of the arena: where its walls are. a bike can never leave it (Match.clamp puts it back on the nearest point inside), the
+#ai's wall sensor asks it if a point is too close to a wall, the OccupancyGrid of the planners blocks the cells outside of it, and
+#game.py draws its walls and the floor's grid lines from it. every shape fits in the square from -extent to +extent on both axes
+#(the shared grids cover that square) and has the middle of the arena (0, 0) inside it.
+#   SquareArena(72)                               the classic arena, -72 to +72 on x and z
+#   CircleArena(100)                              a round arena with radius 100
+#   PolygonArena([(x, z), (x, z), ...])           any polygon (the corners in order, it doesn't have to be convex)
+#an arena can also be written as text (for the command lines: "square:72", "circle:100", "polygon:0,90;80,-60;-80,-60") and as a
+#dict (its spec, what tron.replay and tron.net store in their json)
+import math
+
+# The classic square arena
+class SquareArena:
+    def __init__(self, bounds=72.0):
+        self.bounds = bounds
+        self.extent = bounds    #the arena fits in -extent..extent on both axes
+        self.inner = bounds     #the radius of the biggest circle around the middle that is inside the arena (for the starts)
+        self.fills_extent = True    #(nothing of the square around it is outside, so the grids don't need to block anything)
+        self.spec = {"shape": "square", "bounds": bounds}
+
+    def inside(self, x, z, margin=0.0):
+        #is (x, z) inside the arena and at least margin away from its walls?
+        limit = self.bounds - margin
+        return abs(x) <= limit and abs(z) <= limit
+
+    def clamp(self, x, z):
+        #the nearest point inside the arena ((x, z) itself if it is inside)
+        b = self.bounds
+        return max(-b, min(b, x)), max(-b, min(b, z))
+
+    def outline(self):
+        #the corners of the walls, in order (the last one connects back to the first)
+        b = self.bounds
+        return [(-b, -b), (b, -b), (b, b), (-b, b)]
+
+    def chords(self, axis, v):
+        #the parts of the straight line x = v (axis 0) or z = v (axis 1) that are inside the arena, as (start, end) pairs
+        return [(-self.bounds, self.bounds)] if abs(v) <= self.bounds else []
+
+# A round arena
+class CircleArena:
+    def __init__(self, radius=72.0, sides=96):
+        self.radius = radius
+        self.sides = sides      #how many straight pieces the drawn wall is made of
+        self.extent = radius
+        self.inner = radius
+        self.fills_extent = False
+        self.masks = {}         #cell size -> the OccupancyGrid picture of the walls (see tron.geometry), made once per arena
+        self.spec = {"shape": "circle", "radius": radius}
+
+    def inside(self, x, z, margin=0.0):
+        return x*x + z*z <= (self.radius - margin) ** 2
+
+    def clamp(self, x, z):
+        d = math.hypot(x, z)
+        if d <= self.radius: return x, z
+        return x * self.radius / d, z * self.radius / d
+
+    def outline(self):
+        r, n = self.radius, self.sides
+        return [(r * math.sin(2*math.pi*k/n), r * math.cos(2*math.pi*k/n)) for k in range(n)]
+
+    def chords(self, axis, v):
+        if abs(v) > self.radius: return []
+        w = math.sqrt(self.radius**2 - v*v)
+        return [(-w, w)]
+
+# An arena of any polygon shape
+class PolygonArena:
+    #points are the corners (x, z) in order. (0, 0) has to be inside it
+    def __init__(self, points):
+        self.points = [(float(x), float(z)) for x, z in points]
+        if len(self.points) < 3: raise ValueError("a polygon arena needs at least 3 corners")
+        self.edges = [(ax, az, bx, bz) for (ax, az), (bx, bz) in zip(self.points, self.points[1:] + self.points[:1])]
+        if not self.contains(0.0, 0.0): raise ValueError("the middle of the arena (0, 0) has to be inside the polygon")
+        self.extent = max(max(abs(x), abs(z)) for x, z in self.points)
+        self.inner = min(self.wall_distance(0.0, 0.0), self.extent)
+        self.fills_extent = False
+        self.masks = {}
+        self.spec = {"shape": "polygon", "points": [list(p) for p in self.points]}
+
+    def contains(self, x, z):
+        #the even-odd rule: a ray from (x, z) towards +x crosses the walls an odd number of times when the point is inside
+        inside = False
+        for ax, az, bx, bz in self.edges:
+            if (az > z) != (bz > z) and x < ax + (z - az) * (bx - ax) / (bz - az): inside = not inside
+        return inside
+
+    def nearest_on_wall(self, x, z):
+        #the nearest point on the walls to (x, z) and its distance
+        best = None
+        for ax, az, bx, bz in self.edges:
+            dx, dz = bx - ax, bz - az
+            length2 = dx*dx + dz*dz
+            t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((x - ax)*dx + (z - az)*dz) / length2))
+            px, pz = ax + dx*t, az + dz*t
+            d = math.hypot(x - px, z - pz)
+            if best is None or d < best[2]: best = (px, pz, d)
+        return best
+
+    def wall_distance(self, x, z):
+        return self.nearest_on_wall(x, z)[2]
+
+    def inside(self, x, z, margin=0.0):
+        if not self.contains(x, z): return False
+        return margin <= 0 or self.wall_distance(x, z) >= margin
+
+    def clamp(self, x, z):
+        if self.contains(x, z): return x, z
+        px, pz, _ = self.nearest_on_wall(x, z)
+        return px, pz
+
+    def outline(self):
+        return list(self.points)
+
+    def chords(self, axis, v):
+        #where the line crosses the walls, sorted, taken in pairs (even-odd again)
+        crossings = []
+        for ax, az, bx, bz in self.edges:
+            if axis == 1: ax, az, bx, bz = az, ax, bz, bx     #(z = v is the same problem with x and z swapped)
+            if (ax > v) != (bx > v): crossings.append(az + (v - ax) * (bz - az) / (bx - ax))
+        crossings.sort()
+        return list(zip(crossings[::2], crossings[1::2]))
+
+def make_arena(spec):
+    #the arena of a spec dict (or the arena itself, if it already is one)
+    if not isinstance(spec, dict): return spec
+    shape = spec.get("shape", "square")
+    if shape == "square": return SquareArena(spec["bounds"])
+    if shape == "circle": return CircleArena(spec["radius"])
+    if shape == "polygon": return PolygonArena(spec["points"])
+    raise ValueError(f"unknown arena shape {shape!r}")
+
+def parse_arena(text):
+    #"square:72", "circle:100" or "polygon:x,z;x,z;..." (a number on its own is a square of that size)
+    shape, _, value = text.partition(":")
+    if not value: return SquareArena(float(shape))
+    if shape == "square": return SquareArena(float(value))
+    if shape == "circle": return CircleArena(float(value))
+    if shape == "polygon": return PolygonArena([tuple(float(c) for c in p.split(",")) for p in value.split(";")])
+    raise ValueError(f"unknown arena shape {shape!r} (square, circle or polygon)")
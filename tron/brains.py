@@ -0,0 +1,161 @@
+#ai brains that think somewhere else than the simulation: in a worker thread or a worker process, so that a brain can take as long
+#as it likes without the game's frames waiting for it. a bike gets one with the "brain" policy argument:
+#   {"name": "red", "policy": {"brain": "flood"}}      (a name from BRAINS, or any brain object)
+#a brain is anything that can be called with a StateView and returns the bike's turning (0 straight, -1 left, 1 right). with a
+#process pool it has to be picklable too (a class defined at the top of a module, like PlannerBrain).
+#when the bike thinks (AIBike.step), the StateView of that moment is handed to the match's BrainPool and the bike carries on with
+#what it was doing. the match looks at the answer at the start of every tick (AsyncBrain.apply): a finished one is used on that tick,
+#and one that isn't there deadline seconds (of match time) after the question is given up on, and the bike's fallback (a tron.planner
+#Planner with a tiny budget, thinking right there on the match's grid) decides instead.
+#that makes the outcome depend on how fast the workers are, so a BrainPool with wait=True (default_pool(), what a Match uses when it
+#isn't handed one) waits for the answer on the deadline tick instead and uses it exactly then: slower, but the same seed gives the
+#same match.
+import os
+import random
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from .geometry import OccupancyGrid
+from .planner import Planner, ThinkBudget
+
+#what a brain gets to see: the match's tick, the arena's bounds, how long the decision is for (seconds), a seed for its random
+#choices (drawn from the match's rng, so a waiting pool stays reproducible), the number of the thinking bike in bikes, every bike as
+#(x, z, heading, speed, turn_speed, alive), and a copy of the match's OccupancyGrid (cell size and the raw bytes of its counts).
+#it is a copy of all of it, so the match can go on while the brain thinks
+StateView = namedtuple("StateView", "tick bounds turn_time seed me bikes cell counts")
+
+def state_view(match, bike, turn_time):
+    #the StateView of bike in match right now
+    grid = match.occupancy
+    bikes = tuple((b.x, b.z, b.heading, b.speed, b.turn_speed, b.alive) for b in match.bikes)
+    return StateView(match.tick, match.bounds, turn_time, bike.rng.getrandbits(32), match.bikes.index(bike), bikes, grid.cell,
+                     grid.counts.tobytes())
+
+def view_grid(view):
+    #the OccupancyGrid of a StateView (a new one, the brain may do what it likes with it)
+    grid = OccupancyGrid(view.bounds, view.cell)
+    grid.counts = array('H')
+    grid.counts.frombytes(view.counts)
+    return grid
+
+class ViewBike:
+    #a bike of a StateView, with what a tron.planner.Planner reads from a bike
+    def __init__(self, x, z, heading, speed, turn_speed, alive, rng=None):
+        self.x, self.z, self.heading, self.speed, self.turn_speed, self.alive = x, z, heading, speed, turn_speed, alive
+        self.rng = rng
+
+# The planner brain of tron.planner, as a brain
+class PlannerBrain:
+    #the same search AIBike(planner=mode) does, but on the StateView. nodes is the flood fill cells of one decision: in a worker
+    #it doesn't have to share a tick's budget with the simulation, so it can afford a lot more of them than the inline planner
+    def __init__(self, mode="flood", nodes=900, straight_ahead=0.5):
+        self.mode = mode
+        self.nodes = nodes
+        self.straight_ahead = straight_ahead
+
+    def __call__(self, view):
+        grid = view_grid(view)
+        bikes = [ViewBike(*b) for b in view.bikes]
+        me = bikes[view.me]
+        me.rng = random.Random(view.seed)
+        budget = ThinkBudget(self.nodes)
+        budget.start_tick()
+        planner = Planner(grid, me, [b for b in bikes if b is not me], budget, self.mode, self.nodes, self.straight_ahead)
+        return planner.decide(view.turn_time)
+
+#the brains a roster can ask for by name (so that the rosters stay plain json, like tron.replay stores them)
+BRAINS = {
+    "flood": PlannerBrain("flood", nodes=4000),
+    "voronoi": PlannerBrain("voronoi", nodes=4000),
+}
+
+# The workers the brains of a match think in
+class BrainPool:
+    #workers threads (or processes, with processes=True) that answer the questions. deadline is how long (seconds of match time) a
+    #bike waits for an answer before its fallback decides, wait=True waits for every answer on its deadline tick instead (see the top).
+    #threads are cheap to start but share python's GIL with the game, so a brain that is pure python still takes some time away from
+    #the frames; processes don't (they cost a copy of the view per question and a second or so to start). either way a worker needs
+    #a cpu core of its own to really be out of the frames' way
+    def __init__(self, workers=1, processes=False, deadline=0.1, wait=False):
+        self.deadline = deadline
+        self.wait = wait
+        if processes:
+            self.executor = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))   #(spawn: a fork of the game's window is no good)
+        else:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="brain")
+        self.asked = 0      #how many questions were asked
+        self.missed = 0     #how many of them missed their deadline (and were decided by the fallback)
+
+    def ask(self, brain, view):
+        #hands the question to a worker and returns its concurrent.futures Future
+        self.asked += 1
+        return self.executor.submit(brain, view)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+shared_pool = None      #default_pool()'s pool, and the process it was made in: (pid, BrainPool)
+
+def default_pool():
+    #the BrainPool(wait=True) of every match that isn't handed a pool. there is one per process, made the first time a match needs
+    #it, so that a match doesn't start a worker thread of its own that nobody ever stops. (a process forked from one that already
+    #had it gets a new one: the threads of the old one didn't come along)
+    global shared_pool
+    if shared_pool is None or shared_pool[0] != os.getpid():
+        shared_pool = (os.getpid(), BrainPool(wait=True))
+    return shared_pool[1]
+
+# What an AIBike with a brain thinks with (its self.brain, in place of a Planner)
+class AsyncBrain:
+    #brain is the brain (or its name in BRAINS), match and bike the bike's match and itself. the fallback is a Planner with a small
+    #budget on the match's grid, it also does the danger() check of every tick
+    def __init__(self, brain, match, bike, pool, fallback_nodes=150):
+        self.brain = BRAINS[brain] if isinstance(brain, str) else brain
+        self.match = match
+        self.bike = bike
+        self.pool = pool
+        rivals = [other for other in match.bikes if other is not bike]
+        self.fallback = Planner(match.occupancy, bike, rivals, match.think_budget, nodes=fallback_nodes)
+        self.ticks = max(1, round(pool.deadline / match.dt))    #the deadline in ticks
+        self.pending = None     #the Future of the question that wasn't answered yet
+        self.due = 0            #the tick its answer is due on
+        self.turn_time = 0.0
+
+    def danger(self):
+        return self.fallback.danger()
+
+    def decide(self, turn_time):
+        #asks the brain (its answer comes on a later tick, see apply) and keeps the bike's turning until then, unless there is
+        #something right ahead: then the fallback decides right away too
+        self.cancel()
+        self.pending = self.pool.ask(self.brain, state_view(self.match, self.bike, turn_time))
+        self.due = self.match.tick + self.ticks
+        self.turn_time = turn_time
+        return self.fallback.decide(turn_time) if self.fallback.danger() else self.bike.turning
+
+    def apply(self, tick):
+        #called by the match at the start of every tick: puts the brain's answer into the bike's turning once there is one
+        pending = self.pending
+        if pending is None: return
+        if not self.bike.alive:
+            self.cancel()
+            return
+        if self.pool.wait:
+            if tick < self.due: return
+            self.bike.turning = pending.result()    #(waits for it if it isn't there yet)
+        elif pending.done():
+            self.bike.turning = pending.result()
+        elif tick >= self.due:
+            pending.cancel()
+            self.pool.missed += 1
+            self.bike.turning = self.fallback.decide(self.turn_time)
+        else:
+            return
+        self.pending = None
+
+    def cancel(self):
+        #forgets the question that is still open (the match was reset or went back to a snapshot, or a newer one is asked)
+        if self.pending is not None: self.pending.cancel()
+        self.pending = None
@@ -0,0 +1,175 @@
+#a reinforcement learning environment for training a bike to replace the ai's policy, in the style of gymnasium (the same reset() and
+#step() and the same return values, but without needing gymnasium itself). it runs a tron.sim.Match without a window: the bike being
+#trained is a human bike called "agent", the others are normal ai bikes.
+#   env = TronEnv(opponents=({"planner": "flood"},))
+#   obs, info = env.reset(seed=1)
+#   obs, reward, terminated, truncated, info = env.step(2)      #action 0 steers left, 1 goes straight, 2 steers right
+#the observation is what the bike "sees" around itself, turned with it (straight ahead is always the same direction):
+#   obs="rays"   rays distances, from straight ahead clockwise all the way round, to the first blocked cell of the arena's
+#                OccupancyGrid (a trail or outside the walls, whatever the arena's shape), divided by ray_length (1.0 when nothing
+#                is in reach)
+#   obs="grid"   a view x view picture of the OccupancyGrid around the bike, 1.0 where it is blocked, row 0 is the row in front
+#both are worked out with a handful of numpy operations on the grid's counts (numpy looks at the same memory, nothing is copied)
+#and written into one array that every step() reuses: the obs handed back is always that same array, copy it to keep it.
+#TronVectorEnv steps many of them at once and keeps all their observations in one (num_envs, ...) array.
+#this module needs numpy (the rest of the tron package does not).
+import math
+
+import numpy as np
+
+from .geometry import OccupancyGrid
+from .sim import ARENA_BOUNDS, DT, TICK_RATE, Match
+
+ACTIONS = (-1, 0, 1)    #the steer of every action
+
+class TronEnv:
+    #opponents has the AIBike policy arguments of every other bike ({} is the default random policy). frame_skip repeats every action
+    #for that many ticks, max_ticks ends (truncates) a match that went on too long. throttle is what the agent's bike always gets.
+    #the rewards: alive every step the agent survives, win / lose when the match ends (nothing for a draw).
+    #out is an array of the observation's shape to write the observations into (TronVectorEnv hands every env its own row).
+    #arena is a tron.arena shape (or its spec dict) to train in, instead of the square of bounds
+    def __init__(self, opponents=({},), obs="rays", rays=16, ray_length=32.0, view=15, bounds=ARENA_BOUNDS, dt=DT, frame_skip=1,
+                 max_ticks=TICK_RATE*120, throttle=1, alive=0.001, win=1.0, lose=-1.0, seed=None, out=None, arena=None):
+        if obs not in ("rays", "grid"): raise ValueError(f"obs has to be 'rays' or 'grid', not {obs!r}")
+        roster = [{"name": "agent", "human": True}] + [{"name": f"ai {k+1}", "policy": dict(p)} for k, p in enumerate(opponents)]
+        self.match = Match(seed=seed, bounds=bounds, dt=dt, roster=roster, arena=arena)
+        self.bike = self.match.by_name["agent"]
+        self.frame_skip, self.max_ticks, self.throttle = frame_skip, max_ticks, throttle
+        self.rewards = (alive, win, lose)
+        #the observations are read from the match's OccupancyGrid. it only has one when a bike plans with it, so otherwise the env
+        #gives it one (kept up to date by the trails like the planner's, and emptied by Match.reset())
+        match = self.match
+        if match.occupancy is None:
+            match.occupancy = OccupancyGrid(match.bounds, arena=match.arena)
+            for bike in match.bikes: bike.trail.watchers.append(match.occupancy)
+        self.grid = match.occupancy
+        self.counts = np.frombuffer(self.grid.counts, dtype=np.uint16)     #(OccupancyGrid.clear() empties counts in place)
+        #the points that are looked at, in the bike's own frame: f ahead of it and r to its right
+        cell = self.grid.cell
+        if obs == "rays":
+            #every ray is sampled every half cell, from 1.5 cells out (the cell under the bike always has its newest piece in it)
+            steps = np.arange(1.5 * cell, ray_length, cell / 2)
+            angles = np.arange(rays) * (2 * math.pi / rays)
+            f = np.outer(np.cos(angles), steps)
+            r = np.outer(np.sin(angles), steps)
+            self.shape = (rays,)
+            #the distance of every sample divided by ray_length, plus a last one of 1.0 for a ray that doesn't hit anything
+            self.reach = np.append(steps / ray_length, 1.0).astype(np.float32)
+        else:
+            offsets = (np.arange(view) - view // 2) * cell
+            f, r = np.meshgrid(-offsets, offsets, indexing="ij")     #(row 0 is the furthest ahead, column 0 the furthest left)
+            self.shape = (view, view)
+        self.mode = obs
+        self.ahead, self.right = f.ravel(), r.ravel()
+        points = self.ahead.size
+        #the buffers of the steps, made once: the world position of every point, its cell, and if it is blocked
+        self.wx, self.wz, self.tmp = np.empty(points), np.empty(points), np.empty(points)
+        self.cells = np.empty(points, dtype=np.intp)
+        self.inside = np.empty(points, dtype=bool)
+        self.values = np.empty(points, dtype=np.uint16)
+        self.blocked = np.empty(points, dtype=bool)
+        if obs == "rays":
+            self.ray_blocked = np.ones((rays, steps.size + 1), dtype=bool)  #(the last column is the "nothing hit" sample, always True)
+            self.first = np.empty(rays, dtype=np.intp)
+        self.obs = np.zeros(self.shape, dtype=np.float32) if out is None else out
+        self.observation_shape = self.shape
+        self.action_count = len(ACTIONS)
+
+    def observe(self):
+        #writes what the bike sees into self.obs and returns it
+        bike, grid = self.bike, self.grid
+        h = math.radians(bike.heading)
+        s, c = math.sin(h), math.cos(h)
+        b, cell, n = grid.bounds, grid.cell, grid.size
+        wx, wz, tmp, cells, inside = self.wx, self.wz, self.tmp, self.cells, self.inside
+        #world position of every point: the bike's position + ahead * forward + right * (the bike's right), turned into cell numbers
+        np.multiply(self.ahead, s, out=wx)
+        np.multiply(self.right, c, out=tmp)
+        wx += tmp
+        wx += bike.x + b
+        np.multiply(self.ahead, c, out=wz)
+        np.multiply(self.right, -s, out=tmp)
+        wz += tmp
+        wz += bike.z + b
+        wx /= cell
+        wz /= cell
+        np.floor(wx, out=wx)
+        np.floor(wz, out=wz)
+        #the points outside the arena are blocked (the walls). the others look up their cell's count
+        np.greater_equal(wx, 0, out=inside)
+        inside &= wx < n
+        inside &= wz >= 0
+        inside &= wz < n
+        np.clip(wx, 0, n - 1, out=wx)
+        np.clip(wz, 0, n - 1, out=wz)
+        wx *= n
+        wx += wz
+        cells[:] = wx
+        np.take(self.counts, cells, out=self.values)
+        np.greater(self.values, 0, out=self.blocked)
+        np.logical_not(inside, out=inside)
+        self.blocked |= inside
+        if self.mode == "rays":
+            ray_blocked = self.ray_blocked
+            ray_blocked[:, :-1] = self.blocked.reshape(ray_blocked.shape[0], -1)
+            np.argmax(ray_blocked, axis=1, out=self.first)      #the first blocked sample of every ray
+            np.take(self.reach, self.first, out=self.obs)
+        else:
+            self.obs[...] = self.blocked.reshape(self.shape)
+        return self.obs
+
+    def reset(self, seed=None, options=None):
+        self.match.reset(seed)
+        return self.observe(), {}
+
+    def step(self, action):
+        match, bike = self.match, self.bike
+        steer = ACTIONS[action]
+        for _ in range(self.frame_skip):
+            match.step(self.throttle, steer)
+            if match.over: break
+        alive, win, lose = self.rewards
+        reward = alive if bike.alive else lose
+        terminated = match.over or not bike.alive
+        if match.over and match.winner == "agent": reward = win
+        elif match.over and match.winner == "draw": reward = 0.0
+        truncated = not terminated and match.tick >= self.max_ticks
+        info = {"winner": match.winner} if terminated else {}
+        return self.observe(), reward, terminated, truncated, info
+
+class TronVectorEnv:
+    #num_envs TronEnvs (with the same arguments, and seeds seed, seed+1, ...) stepped together. reset() and step() hand back numpy
+    #arrays with one row per env: the observations (num_envs, *observation_shape), rewards, terminated and truncated, and every one
+    #of them is the same array on every call (written over in place). an env whose match ended is reset by the step() after that
+    #one (its action is ignored and its reward is 0 on that step), the same as gymnasium's default "next step" autoreset
+    def __init__(self, num_envs, seed=None, **kwargs):
+        first = TronEnv(**kwargs)
+        self.num_envs = num_envs
+        self.observation_shape = first.observation_shape
+        self.action_count = first.action_count
+        self.obs = np.zeros((num_envs,) + first.observation_shape, dtype=np.float32)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.terminated = np.zeros(num_envs, dtype=bool)
+        self.truncated = np.zeros(num_envs, dtype=bool)
+        first.obs = self.obs[0]     #(the first env was only made to find out the shape, it writes into row 0 from now on)
+        self.envs = [first] + [TronEnv(out=self.obs[k], **kwargs) for k in range(1, num_envs)]
+        self.needs_reset = np.zeros(num_envs, dtype=bool)
+        self.seed = seed
+
+    def reset(self, seed=None, options=None):
+        seed = self.seed if seed is None else seed
+        for k, env in enumerate(self.envs):
+            env.reset(None if seed is None else seed + k)
+        self.needs_reset[:] = False
+        return self.obs, {}
+
+    def step(self, actions):
+        rewards, terminated, truncated = self.rewards, self.terminated, self.truncated
+        for k, env in enumerate(self.envs):
+            if self.needs_reset[k]:
+                env.reset()
+                rewards[k], terminated[k], truncated[k] = 0.0, False, False
+            else:
+                _, rewards[k], terminated[k], truncated[k], _ = env.step(actions[k])
+        np.logical_or(terminated, truncated, out=self.needs_reset)
+        return self.obs, rewards, terminated, truncated, {}
@@ -0,0 +1,431 @@
+#the geometry helpers used by the trails: a spatial hash to find the segments near a point quickly, and a ring buffer that stores
+#the segments' end points as float32 numbers. nothing in here needs ursina, so it can be used by the headless simulation too. 
+import math
+from array import array
+from collections import deque
+
+# Uniform grid ("spatial hash") that remembers which trail segments pass through which square cell of the floor
+class SpatialHash:
+    #instead of testing the bike against every single trail segment, we chop the floor into square cells of size cell x cell.
+    #every segment is written into each cell its bounding box touches, so a collision query only has to look at the few cells
+    #around the bike's circle instead of the whole trail.
+    def __init__(self, cell=2.0):
+        self.cell = cell    #the side length of one square cell of the grid
+        self.cells = {}     #dictionary: key = (column, row) of a cell, value = deque of segment ids inside that cell (oldest first)
+
+    def _cell_range(self, x0, y0, x1, y1):
+        #returns the range of columns and rows covered by the box from (x0,y0) to (x1,y1)
+        c = self.cell
+        return (range(math.floor(min(x0, x1)/c), math.floor(max(x0, x1)/c)+1),
+                range(math.floor(min(y0, y1)/c), math.floor(max(y0, y1)/c)+1))
+
+    def insert(self, sid, ax, ay, bx, by):
+        #sid is the id of the segment, (ax,ay) and (bx,by) are its two end points on the floor
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells.get((i, j))
+                if bucket is None:
+                    bucket = self.cells[(i, j)] = deque()
+                bucket.append(sid)
+
+    def remove_oldest(self, ax, ay, bx, by):
+        #segments always get evicted oldest first, so the segment being removed is always at the front of every deque it is in.
+        #that means popleft() is enough and we never have to search through a bucket.
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells[(i, j)]
+                bucket.popleft()
+                if not bucket: del self.cells[(i, j)]  #drop empty cells so the dictionary doesn't keep growing as the bike moves
+
+    def remove_newest(self, ax, ay, bx, by):
+        #the other end: takes out the newest segment (a Trail going back to a snapshot, see Trail.restore), it is at the back
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells[(i, j)]
+                bucket.pop()
+                if not bucket: del self.cells[(i, j)]
+
+    def insert_oldest(self, sid, ax, ay, bx, by):
+        #puts back a segment that is older than every one in the hash (at the front of its deques)
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells.get((i, j))
+                if bucket is None:
+                    bucket = self.cells[(i, j)] = deque()
+                bucket.appendleft(sid)
+
+    def query(self, x, y, radius):
+        #returns the ids of every segment stored in the cells touched by the square around the circle (x, y, radius)
+        #a tiny bit of padding is added so that float rounding can never make us miss a segment lying right on a cell border
+        r = radius + 1e-3
+        cols, rows = self._cell_range(x-r, y-r, x+r, y+r)
+        found = set()   #a set, because a long segment may be stored in more than one of the cells we look at
+        for i in cols:
+            for j in rows:
+                bucket = self.cells.get((i, j))
+                if bucket: found.update(bucket)
+        return found
+
+    def clear(self):
+        self.cells.clear()
+
+# A spatial hash of the "runs" of a coalesced trail (see Trail in tron.sim)
+class RunHash(SpatialHash):
+    #a run is many short trail pieces merged into one long segment. the pieces are still what goes into the cells (so a long run
+    #is only stored in the cells the bike really drove through, not in every cell of its bounding box), but a cell keeps one
+    #[run id, number of pieces] entry per run instead of one entry per piece: a straight line through a cell is a single entry.
+    #the pieces are added in order and removed oldest first, so the entry to update is always the last (add) or the first (remove).
+    #add_piece and remove_piece run for every piece of every trail, so they first check if the piece is inside a single cell (nearly
+    #every one is, a piece is about 0.33 long and a cell is 2): then there is only one bucket and no ranges to loop over
+    def add_piece(self, run, ax, ay, bx, by):
+        c = self.cell
+        i, j = math.floor(ax/c), math.floor(ay/c)
+        if i == math.floor(bx/c) and j == math.floor(by/c):
+            bucket = self.cells.get((i, j))
+            if bucket is None:
+                self.cells[(i, j)] = deque([[run, 1]])
+            elif bucket[-1][0] == run: bucket[-1][1] += 1
+            else: bucket.append([run, 1])
+            return
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells.get((i, j))
+                if bucket is None:
+                    bucket = self.cells[(i, j)] = deque()
+                if bucket and bucket[-1][0] == run: bucket[-1][1] += 1
+                else: bucket.append([run, 1])
+
+    def remove_piece(self, ax, ay, bx, by):
+        #takes out the oldest piece (whose end points are given)
+        c = self.cell
+        i, j = math.floor(ax/c), math.floor(ay/c)
+        if i == math.floor(bx/c) and j == math.floor(by/c):
+            bucket = self.cells[(i, j)]
+            head = bucket[0]
+            head[1] -= 1
+            if not head[1]:
+                bucket.popleft()
+                if not bucket: del self.cells[(i, j)]
+            return
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells[(i, j)]
+                head = bucket[0]
+                head[1] -= 1
+                if not head[1]:
+                    bucket.popleft()
+                    if not bucket: del self.cells[(i, j)]
+
+    def remove_newest_piece(self, ax, ay, bx, by):
+        #takes out the newest piece (like SpatialHash.remove_newest)
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells[(i, j)]
+                tail = bucket[-1]
+                tail[1] -= 1
+                if not tail[1]:
+                    bucket.pop()
+                    if not bucket: del self.cells[(i, j)]
+
+    def add_oldest_piece(self, run, ax, ay, bx, by):
+        #puts back a piece that is older than every one in the hash
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                bucket = self.cells.get((i, j))
+                if bucket is None:
+                    bucket = self.cells[(i, j)] = deque()
+                if bucket and bucket[0][0] == run: bucket[0][1] += 1
+                else: bucket.appendleft([run, 1])
+
+    def query(self, x, y, radius):
+        #returns the ids of the runs stored in the cells touched by the square around the circle (x, y, radius)
+        r = radius + 1e-3
+        cols, rows = self._cell_range(x-r, y-r, x+r, y+r)
+        found = set()
+        for i in cols:
+            for j in rows:
+                bucket = self.cells.get((i, j))
+                if bucket: found.update(run for run, _ in bucket)
+        return found
+
+# Fixed size ring buffer that stores the end points of the trail segments
+class SegmentBuffer:
+    #every segment is stored as 4 float32 numbers (ax, az, bx, bz) one after the other in a single flat array, instead of a tuple
+    #of two Vec2 objects. that is 16 bytes per segment instead of a few hundred bytes of python objects.
+    #the buffer is a "ring": when it is full, the newest segment simply overwrites the slot of the oldest one, so throwing away the
+    #oldest segment costs the same no matter how big the buffer is (no more list.pop(0) that has to shift every item).
+    def __init__(self, capacity=1000):
+        self.capacity = capacity                        #the maximum number of segments we keep
+        self.data = array('f', bytes(16 * capacity))    #'f' means float32. 4 floats * 4 bytes each = 16 bytes per segment, all 0.0
+        self.first_id = 0   #every segment gets an id that keeps counting up. first_id is the id of the oldest segment we still have
+        self.count = 0      #how many segments are stored right now
+
+    def __len__(self):
+        return self.count
+
+    def get(self, sid):
+        #returns the end points (ax, az, bx, bz) of the segment with id sid. its slot in the ring is sid % capacity
+        i = (sid % self.capacity) * 4
+        d = self.data
+        return d[i], d[i+1], d[i+2], d[i+3]
+
+    def __iter__(self):
+        #goes through the segments from the oldest to the newest
+        for sid in range(self.first_id, self.first_id + self.count):
+            yield self.get(sid)
+
+    def append(self, ax, az, bx, bz):
+        #stores a new segment. if the buffer was already full, the oldest segment is overwritten and returned (so that the caller can
+        #also remove it from other places like the spatial hash), otherwise None is returned
+        evicted = None
+        if self.count == self.capacity:
+            evicted = self.get(self.first_id)
+            self.first_id += 1
+            self.count -= 1
+        i = ((self.first_id + self.count) % self.capacity) * 4
+        d = self.data
+        d[i], d[i+1], d[i+2], d[i+3] = ax, az, bx, bz   #(4 stores are about twice as quick as a slice of a new array)
+        self.count += 1
+        return evicted
+
+    def pop_oldest(self):
+        #throws away the oldest segment
+        self.first_id += 1
+        self.count -= 1
+
+    def clear(self):
+        #no need to zero the array, the old values are simply never read again
+        self.first_id = 0
+        self.count = 0
+
+    def hits_circle(self, ids, limit, px, py, r2):
+        #the point-to-segment distance test for a whole batch of segment ids at once.
+        #returns True as soon as one of the segments (with an id smaller than limit) is within the circle at (px, py) with radius
+        #squared r2, otherwise False. it reads the floats straight out of the flat array so no Vec2 objects are created.
+        d = self.data
+        cap = self.capacity
+        for sid in ids:
+            if sid >= limit: continue       #too recent, the caller doesn't want these checked
+            i = (sid % cap) * 4
+            ax, ay = d[i], d[i+1]
+            abx, aby = d[i+2] - ax, d[i+3] - ay    #vector ab = b-a (vector representing the trail segment from a to b)
+            apx, apy = px - ax, py - ay             #vector ap = p-a
+            ab2 = abx*abx + aby*aby     #ab2 is the variable that holds the squared length of vector ab (square of magnitude of vector ab)
+            if ab2 <= 1e-6:             #basically saying that if ab2 is a point, i.e both ab2 segment has its start and end point almost
+                                        #the same. 1e-6 is a notation in programming to represent a very small +ve number. 
+                                        #we didn't use if ab2==0 since ab2 could be ==0.00000000001 and still the condition would be False
+                if apx*apx + apy*apy <= r2: return True     #if ap2 is less than the square of the radius of the player's car. 
+                continue
+            #finding the closest point to the player's car on the line segment ab
+            t = max(0.0, min(1.0, (apx*abx + apy*aby)/ab2))     #t will always be positive and range of t is [0,1]
+            #apx*abx+apy*aby is the dot product of ab and ap
+            #(apx*abx+apy*aby)/ab2 is the projection of the point ap on the vector ab
+            dx, dy = px - (ax + abx*t), py - (ay + aby*t)
+            #(ax+abx*t, ay+aby*t) is the closest point on the segment. dx and dy are the distance between it and the player's car. 
+            if dx*dx + dy*dy <= r2: return True
+            #if the squaer of the distance between the player's car and the closest point on the line is less than or equal to the 
+            #radius of the circle, then there will be a collision. 
+        return False
+
+    def nearest(self, ids, limit, px, py, r2):
+        #the distance version of hits_circle(): the smallest squared distance from (px, py) to one of the segments (with an id
+        #smaller than limit), or None if none of them is within r2 (squared) of it
+        d = self.data
+        cap = self.capacity
+        best = r2
+        found = False
+        for sid in ids:
+            if sid >= limit: continue
+            i = (sid % cap) * 4
+            ax, ay = d[i], d[i+1]
+            abx, aby = d[i+2] - ax, d[i+3] - ay
+            apx, apy = px - ax, py - ay
+            ab2 = abx*abx + aby*aby
+            t = max(0.0, min(1.0, (apx*abx + apy*aby)/ab2)) if ab2 > 1e-6 else 0.0
+            dx, dy = apx - abx*t, apy - aby*t
+            d2 = dx*dx + dy*dy
+            if d2 <= best:
+                best = d2
+                found = True
+        return best if found else None
+
+    def first_hit(self, ids, limit, px, py, dx, dy, r):
+        #the swept version of hits_circle(): the circle of radius r moves from (px, py) to (px+dx, py+dy) and this returns the
+        #earliest time t (0 at the start, 1 at the end of the move) at which it touches one of the segments with an id smaller
+        #than limit, or None if it gets through without touching any
+        d = self.data
+        cap = self.capacity
+        best = None
+        for sid in ids:
+            if sid >= limit: continue
+            i = (sid % cap) * 4
+            t = swept_circle_hit(d[i], d[i+1], d[i+2], d[i+3], px, py, dx, dy, r)
+            if t is not None and (best is None or t < best):
+                best = t
+                if t == 0.0: break      #(it can't get any earlier than touching at the start)
+        return best
+
+def swept_circle_hit(ax, ay, bx, by, px, py, dx, dy, r):
+    #when does a circle of radius r moving from p to p+d (t from 0 to 1) first touch the segment from a to b? it is the same as
+    #asking when the point p+t*d first enters the "capsule" around the segment (every point within r of it): the capsule is
+    #a rectangle along the segment (its two long sides are r away from it) with a half circle on each end, so the point enters
+    #it either through one of the long sides or through one of the end circles, and the earliest of those is the answer.
+    #returns the time (0 if it already touches at the start), or None if it doesn't touch the segment at all during the move
+    abx, aby = bx - ax, by - ay
+    apx, apy = px - ax, py - ay
+    ab2 = abx*abx + aby*aby
+    r2 = r*r
+    #already touching at the start? (the same test as hits_circle)
+    u = max(0.0, min(1.0, (apx*abx + apy*aby)/ab2)) if ab2 > 1e-12 else 0.0
+    cx, cy = apx - abx*u, apy - aby*u
+    if cx*cx + cy*cy <= r2: return 0.0
+    best = None
+    if ab2 > 1e-12:
+        #the long sides: s is the signed distance from the segment's line (along its normal), and the point is on a side when |s| = r
+        length = math.sqrt(ab2)
+        nx, ny = -aby/length, abx/length
+        s0 = apx*nx + apy*ny
+        ds = dx*nx + dy*ny
+        if abs(s0) > r and ds != 0.0:
+            t = (math.copysign(r, s0) - s0) / ds    #(the side facing the start)
+            if 0.0 <= t <= 1.0:
+                u = ((apx + dx*t)*abx + (apy + dy*t)*aby) / ab2
+                if 0.0 <= u <= 1.0: best = t        #only if it enters next to the segment, not beyond one of its ends
+    #the end circles: the smaller root of |p + t*d - end|^2 = r^2
+    dd = dx*dx + dy*dy
+    if dd > 0.0:
+        for ex, ey in ((apx, apy), (px - bx, py - by)):
+            half_b = ex*dx + ey*dy
+            disc = half_b*half_b - dd*(ex*ex + ey*ey - r2)
+            if disc >= 0.0:
+                t = (-half_b - math.sqrt(disc)) / dd
+                if 0.0 <= t <= 1.0 and (best is None or t < best): best = t
+    return best
+
+# A coarse picture ("raster") of the arena that counts how many trail segments touch each square cell
+class OccupancyGrid:
+    #the arena from -bounds to +bounds is cut into size x size cells of side cell. every trail segment adds 1 to each cell its bounding
+    #box touches and takes it away again when it is evicted, so the grid is always up to date without ever being rebuilt.
+    #a cell is "blocked" when its count is above 0, and everything outside the arena counts as blocked too (the walls).
+    #the ai's planner (tron.planner) searches this grid instead of the trails themselves: one lookup per cell, no distance tests.
+    #arena is the match's tron.arena shape. when it isn't a square (a circle, a polygon) the cells whose middle is outside its walls
+    #start with a count of 1 that never goes away, so they are blocked like the outside of the grid. (that picture of the walls is
+    #kept in the arena, every grid of the same arena and cell size shares it)
+    def __init__(self, bounds, cell=1.0, arena=None):
+        self.bounds = bounds
+        self.cell = cell
+        self.size = int(math.ceil(2 * bounds / cell))   #the number of columns (and rows)
+        self.walls = None   #the counts of the empty arena (None when that is all zeros)
+        if arena is not None and not arena.fills_extent:
+            self.walls = arena.masks.get(cell)
+            if self.walls is None:
+                n, inside = self.size, arena.inside
+                self.walls = arena.masks[cell] = array('H', [0 if inside(-bounds + (i + 0.5) * cell, -bounds + (j + 0.5) * cell) else 1
+                                                             for i in range(n) for j in range(n)])
+        self.counts = array('H', bytes(2 * self.size * self.size))  #'H' is uint16. cell (i, j) is counts[i*size + j]
+        self.clear()
+
+    def cell_of(self, x, z):
+        #returns the index of the cell at (x, z) in counts, or -1 if (x, z) is outside the arena
+        i = math.floor((x + self.bounds) / self.cell)
+        j = math.floor((z + self.bounds) / self.cell)
+        if 0 <= i < self.size and 0 <= j < self.size: return i * self.size + j
+        return -1
+
+    def blocked(self, x, z):
+        k = self.cell_of(x, z)
+        return k < 0 or self.counts[k] > 0
+
+    def _update(self, ax, az, bx, bz, delta):
+        b, c, n = self.bounds, self.cell, self.size
+        i0 = max(0, math.floor((min(ax, bx) + b) / c))
+        i1 = min(n - 1, math.floor((max(ax, bx) + b) / c))
+        j0 = max(0, math.floor((min(az, bz) + b) / c))
+        j1 = min(n - 1, math.floor((max(az, bz) + b) / c))
+        counts = self.counts
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                counts[i*n + j] += delta
+
+    def add(self, ax, az, bx, bz):
+        self._update(ax, az, bx, bz, 1)
+
+    def remove(self, ax, az, bx, bz):
+        #has to be called with exactly the same end points add() was called with (the trails hand it the float32 values they stored)
+        self._update(ax, az, bx, bz, -1)
+
+    def clear(self):
+        #(emptied in place, so that anything looking at the same memory, like tron.env's numpy view of it, stays up to date)
+        self.counts[:] = self.walls if self.walls is not None else array('H', bytes(2 * self.size * self.size))
+
+# A coarse grid that remembers which trails pass through which part of the arena (the "broadphase" of the collision checks)
+class TrailBroadphase:
+    #with many bikes, testing every bike against every trail would cost bikes x bikes trail lookups per tick. this grid has big
+    #cells (4x4 units) and every cell counts how many segments of each trail (owner) are in it, so a bike only has to be tested
+    #against the few trails that actually come near it and the cost grows with the number of bikes, not with its square.
+    def __init__(self, cell=4.0):
+        self.cell = cell
+        self.cells = {}     #dictionary: key = (column, row) of a cell, value = dictionary of owner -> number of its segments in the cell
+
+    def _cell_range(self, x0, y0, x1, y1):
+        c = self.cell
+        return (range(math.floor(min(x0, x1)/c), math.floor(max(x0, x1)/c)+1),
+                range(math.floor(min(y0, y1)/c), math.floor(max(y0, y1)/c)+1))
+
+    def add(self, owner, ax, ay, bx, by):
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                owners = self.cells.get((i, j))
+                if owners is None: owners = self.cells[(i, j)] = {}
+                owners[owner] = owners.get(owner, 0) + 1
+
+    def remove(self, owner, ax, ay, bx, by):
+        #(like OccupancyGrid.remove, it needs exactly the end points the segment was added with)
+        cols, rows = self._cell_range(ax, ay, bx, by)
+        for i in cols:
+            for j in rows:
+                owners = self.cells[(i, j)]
+                left = owners[owner] - 1
+                if left: owners[owner] = left
+                else:
+                    del owners[owner]
+                    if not owners: del self.cells[(i, j)]
+
+    def query(self, x, y, radius):
+        #returns the set of owners with a segment in the cells touched by the square around the circle (x, y, radius)
+        r = radius + 1e-3
+        cols, rows = self._cell_range(x-r, y-r, x+r, y+r)
+        found = set()
+        for i in cols:
+            for j in rows:
+                owners = self.cells.get((i, j))
+                if owners: found.update(owners)
+        return found
+
+    def watcher(self, owner):
+        #something a Trail can keep up to date like an OccupancyGrid (it has add() and remove() for the trail's segments)
+        return _OwnerWatcher(self, owner)
+
+    def clear(self):
+        self.cells.clear()
+
+class _OwnerWatcher:
+    #the TrailBroadphase seen from one trail: add/remove with the owner filled in
+    def __init__(self, broadphase, owner):
+        self.broadphase = broadphase
+        self.owner = owner
+
+    def add(self, ax, ay, bx, by):
+        self.broadphase.add(self.owner, ax, ay, bx, by)
+
+    def remove(self, ax, ay, bx, by):
+        self.broadphase.remove(self.owner, ax, ay, bx, by)
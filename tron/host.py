@@ -0,0 +1,288 @@
+#one process hosting many headless matches at the same time (for bot ladders and load tests), with asyncio.
+#a MatchHost runs every match it has at the fixed tick rate of the matches: one asyncio task goes through all of them once per tick
+#(a "pass") and steps each one, and every batch matches it lets the event loop run whatever else is waiting (a tron.net server,
+#the code that hands it new matches...). that is the whole scheduler: the matches don't have tasks or threads of their own.
+#   host = MatchHost()
+#   job = host.submit({"seed": 1, "roster": [{"name": "a", "policy": {"planner": "flood"}}, {"name": "b"}]})
+#   asyncio.run(host.run())         #until every submitted match is over (run(forever=True) keeps waiting for new ones)
+#   job.winner, job.ticks
+#a tick's latency is how late it is done: from the moment the tick was due (pass number * dt after the start) until the match has
+#been stepped. admission control keeps its p95 under target (the latency 95 of 100 passes stay under, of the last gate passes):
+#the submitted matches wait in a queue and are only started while
+#   - the pass still fits in budget (a share of dt, or of target if that is shorter: a pass that takes longer than target is late
+#     by its last match): the measured cost of a match's step times the matches fits in HEADROOM of it, and
+#   - the recent p95 is under HEADROOM times target
+#so when the load grows the matches that are running stay on time, and the new ones wait (or are turned away once max_waiting
+#are waiting). the steps of a match get slower as its trails grow, so the running matches can outgrow the budget by themselves:
+#then (when the recent p95 is over target too) the newest ones beyond the capacity are paused, they go back to the front of the
+#queue as they are and carry on from there once there is room again (a match with inputs from outside, a player, is never paused).
+#the gap between where starting stops (HEADROOM) and where pausing starts (the whole capacity and target) is what keeps the same
+#matches from being paused and started again over and over, and after a pause nothing more is paused until the gate passes were all
+#measured with the matches that are left.
+#if the passes fall more than MAX_BEHIND ticks behind anyway, the schedule is moved up (the matches go on a little later, like
+#game.py's MAX_CATCH_UP) instead of trying to catch up with passes that would be late too.
+#nothing is built twice: the arenas (and the pictures of their walls) are shared by every match with the same spec, and a match
+#that is over keeps its trails, grids and bikes in a pool and is reset() for the next match of the same settings (a reset match
+#plays exactly like a new one with that seed).
+#usage:
+#   python -m tron.host --matches 300 --bikes 4 --seconds 30        a load test: prints the latency and admission numbers
+import argparse
+import asyncio
+import json
+import time
+from array import array
+from collections import deque
+
+from .arena import make_arena
+from .sim import ARENA_BOUNDS, DT, TICK_RATE, Match
+
+MAX_BEHIND = 8      #how many ticks the passes may fall behind before the schedule is moved up
+HEADROOM = 0.8      #new matches are only started while the recent p95 latency is under this share of target (see the top)
+
+# A match handed to the host, from waiting in the queue until it is over
+class Job:
+    #settings are like tron.replay's match settings (only "roster" is needed: seed, bounds, arena, dt, plan_nodes and ccd have
+    #their Match defaults). inputs is a function that gets the Match before every tick and returns the inputs of its human bikes
+    #(the inputs argument of Match.step), done is called with the Job when the match is over. max_ticks ends a match (with no winner)
+    #that goes on too long
+    def __init__(self, settings, inputs=None, done=None, max_ticks=None):
+        self.settings = settings
+        self.inputs = inputs
+        self.done = done
+        self.max_ticks = max_ticks
+        self.state = "waiting"      #"waiting", "running", "over" or "rejected"
+        self.match = None           #the Match while it is running (or paused, waiting again)
+        self.winner = None
+        self.ticks = 0
+        self.submitted = 0.0        #the host's clock when it was submitted
+        self.waited = 0.0           #the seconds it waited in the queue before it was started
+
+def pool_key(settings):
+    #the settings two matches need to share to be the same Match with another seed
+    return json.dumps({k: v for k, v in settings.items() if k != "seed"}, sort_keys=True)
+
+# The host
+class MatchHost:
+    #dt is the tick of every match (they all have to have the same one), target the tick latency admission control keeps under
+    #(seconds), budget the share of dt (or target) the passes may take (the rest is left for the matches' steps getting slower as
+    #their trails grow, and for the event loop), batch how many matches are stepped between two turns of the event loop.
+    #ramp is how many matches may be started in one pass (a new match costs more than a step, and the cost of the new ones is only
+    #known after they ran a little), max_matches and max_waiting are hard limits. pool_size is how many finished matches of every
+    #settings are kept for reuse. telemetry is a tron.telemetry.Telemetry that gets the ticks of every match (it can take many at
+    #once), brains a tron.brains.BrainPool for the bikes with a brain. gate is how many of the last passes the p95 of admission
+    #control is taken over, window how many are kept for stats()
+    def __init__(self, dt=DT, target=0.010, budget=0.7, batch=32, ramp=4, max_matches=1000, max_waiting=10000, pool_size=16,
+                 telemetry=None, brains=None, clock=time.perf_counter, gate=120, window=600):
+        self.dt = dt
+        self.target = target
+        self.budget = budget
+        self.batch = batch
+        self.ramp = ramp
+        self.max_matches = max_matches
+        self.max_waiting = max_waiting
+        self.pool_size = pool_size
+        self.telemetry = telemetry
+        self.brains = brains
+        self.clock = clock
+        self.waiting = deque()      #the Jobs waiting to be started, oldest first
+        self.running = []           #the Jobs whose matches are being stepped, in the order they were started
+        self.pool = {}              #pool_key -> the finished Matches of those settings, ready to be reset()
+        self.arenas = {}            #the json of an arena's spec -> the arena (shared by every match with that spec)
+        self.step_cost = None       #the measured seconds one match's step takes (a running average, None before the first pass)
+        self.gate = min(gate, window)
+        self.latencies = array('d', bytes(8 * window))     #the latency of the last window passes, in a ring (the percentiles)
+        self.passes = 0
+        self.quiet = 0              #the first pass after the host last had nothing to run (the p95 doesn't look further back)
+        self.p95 = 0.0              #the p95 latency of the last gate passes (since quiet)
+        self.skipped = 0            #how many ticks of schedule were dropped because the passes were too far behind
+        self.started = self.finished = self.rejected = self.reused = self.paused = 0
+        self.settled = 0            #the pass from which matches may be paused again
+        self.stopping = False
+
+    def submit(self, settings, inputs=None, done=None, max_ticks=None):
+        #queues a match (see Job) and returns its Job. its state is "rejected" right away if max_waiting jobs are already waiting
+        job = Job(settings, inputs, done, max_ticks)
+        job.submitted = self.clock()
+        if len(self.waiting) >= self.max_waiting:
+            job.state = "rejected"
+            self.rejected += 1
+        else:
+            self.waiting.append(job)
+        return job
+
+    def capacity(self):
+        #how many matches fit in a pass right now (by the measured cost of a step)
+        if self.step_cost is None: return self.ramp
+        return min(self.max_matches, int(self.budget * min(self.dt, self.target) / max(self.step_cost, 1e-9)))
+
+    def admit(self):
+        #starts waiting jobs while there is room for them (see the top)
+        if not self.waiting or self.p95 > HEADROOM * self.target: return
+        room = min(self.ramp, int(HEADROOM * self.capacity()) - len(self.running), len(self.waiting))
+        for _ in range(max(0, room)):
+            job = self.waiting.popleft()
+            job.state = "running"
+            self.running.append(job)
+            if job.match: continue      #(a paused match carries on)
+            job.match = self.new_match(job.settings)
+            job.match.telemetry = self.telemetry
+            job.waited = self.clock() - job.submitted
+            self.started += 1
+
+    def shed(self):
+        #pauses the newest running matches beyond the capacity while the passes are late (see the top)
+        if self.p95 <= self.target or self.passes < self.settled: return
+        extra = len(self.running) - self.capacity()
+        if extra <= 0: return
+        for job in reversed(self.running[1:]):     #(one match always keeps running)
+            if extra <= 0: break
+            if job.inputs: continue
+            self.running.remove(job)
+            job.state = "waiting"
+            self.waiting.appendleft(job)
+            self.paused += 1
+            extra -= 1
+        self.settled = self.passes + self.gate
+
+    def new_match(self, settings):
+        #a reset() match from the pool if there is one of the same settings, otherwise a new one
+        seed = settings.get("seed")
+        matches = self.pool.get(pool_key(settings))
+        if matches:
+            match = matches.pop()
+            match.reset(seed)
+            self.reused += 1
+            return match
+        arena = settings.get("arena")
+        if arena is not None:
+            key = json.dumps(arena, sort_keys=True)
+            if key not in self.arenas: self.arenas[key] = make_arena(arena)
+            arena = self.arenas[key]
+        return Match(seed=seed, bounds=settings.get("bounds", ARENA_BOUNDS), dt=self.dt, plan_nodes=settings.get("plan_nodes", 2400),
+                     roster=settings["roster"], ccd=settings.get("ccd", True), pool=self.brains, arena=arena)
+
+    def finish(self, job):
+        match = job.match
+        job.state = "over"
+        job.winner, job.ticks = match.winner, match.tick
+        job.match = None
+        if match.telemetry:     #(a match stopped by max_ticks isn't over, so its summary isn't written yet)
+            match.telemetry.end(match)
+            match.telemetry = None
+        matches = self.pool.setdefault(pool_key(job.settings), [])
+        if len(matches) < self.pool_size: matches.append(match)
+        self.finished += 1
+        if job.done: job.done(job)
+
+    async def step_all(self, due):
+        #one pass: steps every running match once, lets the event loop run after every batch of them, and takes the finished ones
+        #out. returns the pass's latency (how long after due it was done)
+        running = self.running
+        start = self.clock()
+        over = False
+        for k, job in enumerate(running):
+            match = job.match
+            match.step(inputs=job.inputs(match) if job.inputs else None)
+            if match.over or (job.max_ticks and match.tick >= job.max_ticks): over = True
+            if (k + 1) % self.batch == 0: await asyncio.sleep(0)
+        end = self.clock()
+        if running:
+            cost = (end - start) / len(running)
+            self.step_cost = cost if self.step_cost is None else self.step_cost + (cost - self.step_cost) * 0.1
+        if over:
+            for job in [job for job in running if job.match.over or (job.max_ticks and job.match.tick >= job.max_ticks)]:
+                running.remove(job)
+                self.finish(job)
+        latency = max(0.0, end - due)
+        self.latencies[self.passes % len(self.latencies)] = latency
+        self.passes += 1
+        self.p95 = self.recent_p95()
+        return latency
+
+    def recent_p95(self):
+        #the p95 latency of the last gate passes (in the ring, the newest one is at passes - 1)
+        n = min(self.gate, self.passes - self.quiet)
+        if n <= 0: return 0.0
+        size = len(self.latencies)
+        recent = sorted(self.latencies[(self.passes - 1 - k) % size] for k in range(n))
+        return recent[min(n - 1, int(0.95 * n))]
+
+    async def run(self, forever=False):
+        #the tick loop: a pass every dt (the next one right away when a pass was late). it ends when nothing is running or waiting
+        #anymore (with forever=True only when stop() is called)
+        next_due = self.clock()
+        while not self.stopping:
+            if not self.running:    #(no load, no latency: the old passes mustn't keep the queue shut)
+                self.quiet, self.p95 = self.passes, 0.0
+            self.admit()
+            if not self.running:
+                if not self.waiting and not forever: break
+                await asyncio.sleep(self.dt)    #(nothing to step, but maybe something to admit soon)
+                next_due = self.clock()
+                continue
+            wait = next_due - self.clock()
+            if wait > 0: await asyncio.sleep(wait)
+            if self.clock() - next_due > MAX_BEHIND * self.dt:
+                behind = int((self.clock() - next_due) / self.dt)
+                self.skipped += behind
+                next_due += behind * self.dt
+            await self.step_all(next_due)
+            self.shed()
+            next_due += self.dt
+        self.stopping = False
+
+    def stop(self):
+        #ends run() after the pass it is in (the running matches stay as they are, run() again carries on with them)
+        self.stopping = True
+
+    def stats(self):
+        #the numbers of the host: its matches, the measured step cost, and the latency of the last passes (in milliseconds)
+        n = min(self.passes, len(self.latencies))
+        recent = sorted(self.latencies[:n]) if n else [0.0]
+        pick = lambda q: recent[min(len(recent) - 1, int(q * len(recent)))] * 1e3
+        return {"running": len(self.running), "waiting": len(self.waiting), "started": self.started, "finished": self.finished,
+                "rejected": self.rejected, "reused": self.reused, "paused": self.paused, "capacity": self.capacity(),
+                "step_us": (self.step_cost or 0.0) * 1e6, "latency_p50_ms": pick(0.5), "latency_p95_ms": pick(0.95),
+                "recent_p95_ms": self.p95 * 1e3,
+                "latency_max_ms": recent[-1] * 1e3, "passes": self.passes, "skipped_ticks": self.skipped}
+
+async def load_test(args):
+    host = MatchHost(target=args.target_ms / 1000)
+    roster = [{"name": f"ai {k+1}", "policy": {"planner": "flood"} if k < args.planners else {}} for k in range(args.bikes)]
+    settings = {"roster": roster}
+    if args.arena:
+        from .arena import parse_arena
+        settings["arena"] = parse_arena(args.arena).spec
+    #every match that ends is replaced by a new one (with the next seed), so that matches keep waiting for admission
+    seeds = iter(range(10**9))
+    def replace(job):
+        host.submit(dict(settings, seed=next(seeds)), done=replace, max_ticks=args.max_ticks)
+    for _ in range(args.matches): replace(None)
+    async def report():
+        while True:
+            await asyncio.sleep(args.every)
+            s = host.stats()
+            print(f"running {s['running']:4d}  waiting {s['waiting']:4d}  finished {s['finished']:5d}  capacity {s['capacity']:4d}  "
+                  f"step {s['step_us']:6.1f} us  latency p50 {s['latency_p50_ms']:5.2f} p95 {s['latency_p95_ms']:5.2f} ms  "
+                  f"skipped {s['skipped_ticks']}")
+    reporter = asyncio.ensure_future(report())
+    asyncio.get_running_loop().call_later(args.seconds, host.stop)
+    await host.run(forever=True)
+    reporter.cancel()
+    print(json.dumps(host.stats(), indent=1))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tron.host", description="Host many headless Tron matches in one process.")
+    parser.add_argument("--matches", type=int, default=200, help="how many matches are kept waiting or running (default 200)")
+    parser.add_argument("--bikes", type=int, default=2, help="bikes per match (default 2)")
+    parser.add_argument("--planners", type=int, default=0, help="how many of them plan with tron.planner (default 0)")
+    parser.add_argument("--arena", help="the arena of every match (square:SIZE, circle:RADIUS or polygon:X,Z;X,Z;...)")
+    parser.add_argument("--target-ms", type=float, default=10.0, help="the tick latency to keep under (default 10 ms)")
+    parser.add_argument("--max-ticks", type=int, default=TICK_RATE * 120, help="a match ends after this many ticks (default 2 minutes)")
+    parser.add_argument("--seconds", type=float, default=30.0, help="how long the test runs (default 30)")
+    parser.add_argument("--every", type=float, default=2.0, help="seconds between the progress lines (default 2)")
+    args = parser.parse_args(argv)
+    asyncio.run(load_test(args))
+
+if __name__ == "__main__":
+    main()
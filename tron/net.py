@@ -0,0 +1,356 @@
+#networked matches between machines, with asyncio (no extra packages needed).
+#the server is "authoritative": it runs the only real Match (the bikes, the collisions, who wins) at a fixed tick, the clients only
+#send their inputs and get the match state back. so that the player doesn't feel the round trip on every key press, a client also
+#"predicts" its own bike: it moves a copy of it (the ghost) with its inputs right away, and whenever a snapshot from the server comes
+#in it puts the ghost back onto the server's bike and plays the inputs the server hasn't used yet on top of it again (reconciliation).
+#
+#every message is a 4 byte length and then the message. the first byte of a message is its type:
+#   HELLO     client -> server   json: {"name": the human bike it wants (or null for the first free one)}
+#   WELCOME   server -> client   json: the match settings (like tron.replay stores them), the bike it got, dt and the tick
+#   INPUT     client -> server   the input's number (seq), throttle and steer. the server uses one input per tick, in order
+#   SNAPSHOT  server -> client   after every tick: the tick, the seq of the client's last input used in it, the winner, and then
+#             only what changed for this client since the last snapshot: per bike a mask of the fields that changed (position,
+#             heading, speed, alive/cause, new trail pieces, the trail's last_pos) and those fields. the trail pieces are only
+#             the new ones (1 or 2 per bike and tick), so a snapshot doesn't get bigger when the trails get longer.
+#             the connection is tcp (nothing gets lost or comes out of order), so "what the client has" is simply what was sent
+#usage:
+#   python -m tron.net serve --humans 2 --ai 1          waits for 2 clients, then plays them against 1 ai bike
+#   python -m tron.net bot --host 127.0.0.1             a client driven by a simple random policy (for testing)
+import argparse
+import asyncio
+import json
+import random
+import struct
+
+from .arena import parse_arena
+from .replay import CAUSES, match_settings, new_match
+from .sim import ARENA_BOUNDS, Match, PlayerBike, Trail
+
+HELLO, WELCOME, INPUT, SNAPSHOT = 1, 2, 3, 4
+LENGTH = struct.Struct("<I")
+INPUT_MSG = struct.Struct("<BIbb")          #type, seq, throttle, steer
+SNAP_HEAD = struct.Struct("<BqIbH")         #type, tick, seq of the last input used, winner (bike number, -1 none, -2 draw), records
+BIKE_HEAD = struct.Struct("<HB")            #bike number, mask of the fields that follow
+#the fields of a bike record, in this order (a field is only there if its bit is in the mask)
+POSITION, HEADING, SPEED, STATE, PIECES, LAST = 1, 2, 4, 8, 16, 32
+XZ = struct.Struct("<2d")
+ONE = struct.Struct("<d")
+ALIVE = struct.Struct("<BB")                #alive, cause
+PIECE_HEAD = struct.Struct("<qH")           #id of the first piece, how many follow (4 float32 each)
+PIECE = struct.Struct("<4f")
+MAX_QUEUED = 8  #a client's inputs that wait for their tick on the server. beyond this the oldest ones are dropped (it is too far ahead)
+
+async def read_message(reader):
+    (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(length)
+
+def write_message(writer, payload):
+    writer.write(LENGTH.pack(len(payload)) + payload)
+    return LENGTH.size + len(payload)
+
+def winner_code(match):
+    names = [bike.name for bike in match.bikes]
+    return -2 if match.winner == "draw" else names.index(match.winner) if match.winner in names else -1
+
+# What the server knows about one connected client
+class Seat:
+    def __init__(self, name, writer, bikes):
+        self.name = name            #the human bike this client drives
+        self.writer = writer
+        self.inputs = []            #(seq, throttle, steer) that came in and wait for their tick, oldest first
+        self.last = (0, 0)          #the input used when none is waiting (the client's last one)
+        self.ack = 0                #the seq of the last input that was used
+        #what this client has been sent so far, per bike: the last values of the fields, and the id of the next trail piece
+        self.fields = [None] * bikes
+        self.next_piece = [None] * bikes
+        self.sent = 0               #bytes sent to it (for the bandwidth numbers)
+        self.snapshots = 0
+
+class Server:
+    #match is the Match to play (its human bikes are the seats for the clients). port 0 picks a free port (see self.port).
+    #tick_rate is how many ticks per second are played (the match's own dt by default)
+    def __init__(self, match, host="127.0.0.1", port=0, tick_rate=None):
+        self.match = match
+        self.host, self.port = host, port
+        self.tick_rate = tick_rate or 1.0 / match.dt
+        self.free = [bike.name for bike in match.bikes if isinstance(bike, PlayerBike)]     #the human bikes nobody has taken yet
+        self.seats = {}             #bike name -> Seat
+        self.idle = {}              #bike name -> the last input of a client that went away (its bike keeps driving with it)
+        self.full = asyncio.Event() #set once every human bike has a client
+        if not self.free: self.full.set()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        for seat in self.seats.values(): seat.writer.close()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        #one of these runs for every client: the handshake, and then it collects the client's inputs until it goes away
+        seat = None
+        try:
+            message = await read_message(reader)
+            wish = json.loads(message[1:]).get("name") if message[0] == HELLO else None
+            name = wish if wish in self.free else self.free[0] if self.free and wish is None else None
+            match = self.match
+            welcome = {"settings": match_settings(match), "name": name, "tick": match.tick}
+            write_message(writer, bytes([WELCOME]) + json.dumps(welcome).encode())
+            if name is None:    #(no free bike, or the one it asked for is taken: the json tells it so and it is sent away)
+                writer.close()
+                return
+            self.free.remove(name)
+            seat = self.seats[name] = Seat(name, writer, len(match.bikes))
+            seat.last = self.idle.pop(name, seat.last)  #(a bike that is taken again goes on from what it was doing)
+            if not self.free: self.full.set()
+            while True:
+                message = await read_message(reader)
+                if message[0] != INPUT: continue
+                _, seq, throttle, steer = INPUT_MSG.unpack(message)
+                seat.inputs.append((seq, throttle, steer))
+                if len(seat.inputs) > MAX_QUEUED: del seat.inputs[0]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass    #the client went away
+        finally:
+            #its seat is freed (another client can take the bike) and its bike keeps its last input (and most likely crashes soon)
+            if seat is not None and self.seats.get(seat.name) is seat:
+                del self.seats[seat.name]
+                self.idle[seat.name] = seat.last
+                self.free.append(seat.name)
+                self.full.clear()
+            writer.close()
+
+    def snapshot(self, seat):
+        #what changed for this client since its last snapshot, as one SNAPSHOT message
+        match = self.match
+        records = []
+        for k, bike in enumerate(match.bikes):
+            trail = bike.trail
+            fields = ((bike.x, bike.z), bike.heading, bike.speed, (bike.alive, CAUSES.index(bike.cause)), None, trail.last_pos)
+            old = seat.fields[k]
+            mask = 0
+            parts = []
+            for bit, value, pack in ((POSITION, fields[0], XZ), (HEADING, fields[1], ONE), (SPEED, fields[2], ONE),
+                                     (STATE, fields[3], ALIVE)):
+                if old is None or old[bit.bit_length() - 1] != value:
+                    mask |= bit
+                    parts.append(pack.pack(*value) if isinstance(value, tuple) else pack.pack(value))
+            #the trail pieces the client doesn't have yet (from the oldest one the trail still has, for a client that just came in)
+            start = trail.segments.first_id if seat.next_piece[k] is None else max(seat.next_piece[k], trail.segments.first_id)
+            end = trail.newest_id + 1
+            if end > start:
+                mask |= PIECES
+                parts.append(PIECE_HEAD.pack(start, end - start))
+                parts += [PIECE.pack(*trail.segments.get(pid)) for pid in range(start, end)]
+            seat.next_piece[k] = end
+            if trail.last_pos is not None and (old is None or old[5] != trail.last_pos):
+                mask |= LAST
+                parts.append(XZ.pack(*trail.last_pos))
+            seat.fields[k] = fields
+            if mask: records.append(BIKE_HEAD.pack(k, mask) + b"".join(parts))
+        return SNAP_HEAD.pack(SNAPSHOT, match.tick, seat.ack, winner_code(match), len(records)) + b"".join(records)
+
+    async def run(self, wait=True):
+        #plays the match at tick_rate until it is over and returns the winner. with wait it first waits for every human bike to have
+        #a client (without, the bikes nobody drives just keep their last input)
+        if wait: await self.full.wait()
+        loop = asyncio.get_running_loop()
+        match = self.match
+        period = 1.0 / self.tick_rate
+        next_tick = loop.time()
+        while not match.over:
+            inputs = dict(self.idle)
+            for name, seat in self.seats.items():
+                if seat.inputs:
+                    seat.ack, throttle, steer = seat.inputs.pop(0)
+                    seat.last = (throttle, steer)
+                inputs[name] = seat.last
+            match.step(inputs=inputs)
+            seats = [seat for seat in self.seats.values() if not seat.writer.is_closing()]  #(not the ones that are going away)
+            for seat in seats:
+                seat.sent += write_message(seat.writer, self.snapshot(seat))
+                seat.snapshots += 1
+            #(a client that can't keep up slows the sending down instead of making the server buffer more and more for it)
+            await asyncio.gather(*(seat.writer.drain() for seat in seats), return_exceptions=True)
+            next_tick += period
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        return match.winner
+
+class Client:
+    #a player's end of the connection. self.match is a copy of the server's match that only ever gets the server's state (it is
+    #never stepped here), self.bike is this client's bike in it, and self.ghost is the predicted bike: the server's bike plus the
+    #inputs the server hasn't used yet. draw self.ghost (and its trail, the part the server hasn't confirmed) for the player's own
+    #bike, and self.match's bikes for everything else
+    def __init__(self):
+        self.match = None
+        self.name = None
+        self.bike = None
+        self.ghost = None
+        self.pending = []           #(seq, throttle, steer) sent but not used by the server yet, oldest first
+        self.seq = 0
+        self.received = 0           #bytes received (for the bandwidth numbers)
+        self.snapshots = 0
+        self.reader = self.writer = None
+        self.task = None
+        self.closed = asyncio.Event()
+
+    async def connect(self, host="127.0.0.1", port=7777, name=None):
+        #joins the server's match as the human bike called name (or the first free one). raises ConnectionError if there is none
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        write_message(self.writer, bytes([HELLO]) + json.dumps({"name": name}).encode())
+        message = await read_message(self.reader)
+        welcome = json.loads(message[1:])
+        if welcome["name"] is None: raise ConnectionError("the server has no free bike (or not the one asked for)")
+        self.match = new_match(welcome["settings"])
+        self.match.tick = welcome["tick"]
+        self.name = welcome["name"]
+        self.bike = self.match.by_name[self.name]
+        self.ghost = PlayerBike(self.bike.start)
+        self.ghost.trail = Trail(coalesce=False, max_segments=256)  #only the few predicted pieces at the head of the trail
+        self.task = asyncio.create_task(self.listen())
+        return self
+
+    async def close(self):
+        if self.writer: self.writer.close()
+        if self.task: await asyncio.gather(self.task, return_exceptions=True)
+
+    async def listen(self):
+        try:
+            while True:
+                message = await read_message(self.reader)
+                self.received += LENGTH.size + len(message)
+                if message[0] == SNAPSHOT: self.apply(message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.closed.set()
+
+    def send_input(self, throttle, steer):
+        #sends this tick's input and moves the ghost with it straight away (the server will do the same when it gets it)
+        if self.match.over or self.writer.is_closing(): return
+        self.seq += 1
+        write_message(self.writer, INPUT_MSG.pack(INPUT, self.seq, throttle, steer))
+        self.pending.append((self.seq, throttle, steer))
+        self.predict(throttle, steer)
+
+    def predict(self, throttle, steer):
+        ghost = self.ghost
+        ghost.step(self.match.dt, throttle, steer)
+        self.match.clamp(ghost)
+
+    def apply(self, message):
+        #puts a snapshot into self.match and reconciles the ghost
+        match = self.match
+        _, match.tick, ack, winner, records = SNAP_HEAD.unpack_from(message, 0)
+        offset = SNAP_HEAD.size
+        for _ in range(records):
+            k, mask = BIKE_HEAD.unpack_from(message, offset)
+            offset += BIKE_HEAD.size
+            bike = match.bikes[k]
+            if mask & POSITION:
+                bike.x, bike.z = XZ.unpack_from(message, offset)
+                offset += XZ.size
+            if mask & HEADING:
+                (bike.heading,) = ONE.unpack_from(message, offset)
+                offset += ONE.size
+            if mask & SPEED:
+                (bike.speed,) = ONE.unpack_from(message, offset)
+                offset += ONE.size
+            if mask & STATE:
+                alive, cause = ALIVE.unpack_from(message, offset)
+                bike.alive, bike.cause = bool(alive), CAUSES[cause]
+                offset += ALIVE.size
+            if mask & PIECES:
+                start, count = PIECE_HEAD.unpack_from(message, offset)
+                offset += PIECE_HEAD.size
+                trail = bike.trail
+                if not len(trail.segments): trail.start_at(start)
+                for _ in range(count):
+                    trail.append_piece(*PIECE.unpack_from(message, offset))
+                    offset += PIECE.size
+            if mask & LAST:
+                bike.trail.last_pos = XZ.unpack_from(message, offset)
+                offset += XZ.size
+        names = [bike.name for bike in match.bikes]
+        match.winner = "draw" if winner == -2 else names[winner] if winner >= 0 else None
+        match.over = match.winner is not None
+        self.snapshots += 1
+        #reconciliation: the ghost goes back to where the server says the bike is after input ack, and the inputs after that are
+        #played on top again. (with the same inputs from the same state this gives exactly what the server will get)
+        self.pending = [p for p in self.pending if p[0] > ack]
+        ghost, bike = self.ghost, self.bike
+        ghost.x, ghost.z, ghost.heading, ghost.speed, ghost.alive = bike.x, bike.z, bike.heading, bike.speed, bike.alive
+        ghost.trail.clear()
+        ghost.trail.last_pos = bike.trail.last_pos
+        for _, throttle, steer in self.pending: self.predict(throttle, steer)
+
+    async def play(self, policy, lead=2, tick_rate=None):
+        #sends an input every tick until the match is over (or the server goes away). policy(client) returns (throttle, steer).
+        #the first lead inputs are sent right away, so that the server has a few waiting: when one comes in late (the network or
+        #the sleep() being a bit slow), the server uses the next one instead of repeating the last, and the ghost stays exact.
+        #tick_rate has to be the server's (the match's own dt by default)
+        loop = asyncio.get_running_loop()
+        period = 1.0 / tick_rate if tick_rate else self.match.dt
+        for _ in range(lead): self.send_input(*policy(self))
+        next_tick = loop.time()
+        while not self.match.over and not self.closed.is_set():
+            self.send_input(*policy(self))
+            next_tick += period
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        return self.match.winner
+
+def random_policy(seed=None):
+    #full throttle and a new random steer every now and then (for the bot command and for testing)
+    rng = random.Random(seed)
+    state = {"steer": 0}
+    def policy(client):
+        if rng.random() < 0.04: state["steer"] = rng.choice((-1, 0, 0, 1))
+        return 1, state["steer"]
+    return policy
+
+async def serve(args):
+    roster = [{"name": f"human {k+1}", "human": True} for k in range(args.humans)]
+    roster += [{"name": f"ai {k+1}", "policy": {}} for k in range(args.ai)]
+    arena = parse_arena(args.arena) if args.arena else None
+    server = await Server(Match(seed=args.seed, roster=roster, bounds=args.bounds, arena=arena), args.host, args.port).start()
+    print(f"serving on {args.host}:{server.port}, waiting for {args.humans} clients")
+    winner = await server.run()
+    print(f"winner {winner} after {server.match.tick} ticks")
+    for seat in server.seats.values():
+        print(f"  {seat.name}: {seat.sent / max(1, seat.snapshots):.0f} bytes per snapshot")
+    await server.close()
+
+async def bot(args):
+    client = await Client().connect(args.host, args.port, args.name)
+    print(f"playing as {client.name}")
+    winner = await client.play(random_policy(args.seed))
+    print(f"winner {winner}, {client.received / max(1, client.snapshots):.0f} bytes per snapshot")
+    await client.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tron.net", description="Networked Tron matches.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("serve", help="run an authoritative server")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=7777)
+    s.add_argument("--humans", type=int, default=2, help="how many clients play (default 2)")
+    s.add_argument("--ai", type=int, default=0, help="how many ai bikes join them (default 0)")
+    s.add_argument("--seed", type=int)
+    s.add_argument("--bounds", type=float, default=ARENA_BOUNDS)
+    s.add_argument("--arena", help="the arena's shape instead of the square of --bounds: square:SIZE, circle:RADIUS or "
+                                   "polygon:X,Z;X,Z;... (the clients get it from the server)")
+    b = sub.add_parser("bot", help="join a server with a random policy")
+    b.add_argument("--host", default="127.0.0.1")
+    b.add_argument("--port", type=int, default=7777)
+    b.add_argument("--name", help="the human bike to take (default: the first free one)")
+    b.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args) if args.command == "serve" else bot(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#the "planner" brain of the ai bike. instead of turning at random, every time the bike thinks it tries its three choices (straight,
+#left, right): it drives each one ahead along an arc on the arena's OccupancyGrid and, if the arc is free, measures how much room
+#there is at its end with a flood fill ("flood" mode) or how much of the arena it would get to first ("voronoi" mode, a flood fill
+#that starts from the rivals too and counts only the cells this bike reaches before them). the choice with the most room wins.
+#every search has a cost bound: a ThinkBudget shared by all the planners of a match hands out a fixed number of flood fill cells
+#per tick, so several planner bikes thinking on the same tick share it instead of each taking a full search. the budget can also
+#get a wall clock limit (seconds) for the game window, but that makes the result depend on the speed of the computer, so the
+#headless matches leave it off to stay reproducible from their seed.
+import math
+import time
+from array import array
+from collections import deque
+
+# The search budget of one tick, shared by all the planners in a match
+class ThinkBudget:
+    def __init__(self, nodes=2400, seconds=None, clock=time.perf_counter):
+        self.nodes = nodes          #how many flood fill cells all the planners together may visit in one tick
+        self.seconds = seconds      #the wall clock limit for one tick (None - no limit)
+        self.clock = clock
+        self.left = nodes
+        self.deadline = None
+
+    def start_tick(self):
+        self.left = self.nodes
+        if self.seconds is not None: self.deadline = self.clock() + self.seconds
+
+    def take(self, nodes):
+        #hands out up to nodes cells of this tick's budget
+        granted = min(nodes, self.left)
+        self.left -= granted
+        return granted
+
+    def give_back(self, nodes):
+        self.left += nodes
+
+    def expired(self):
+        return self.deadline is not None and self.clock() > self.deadline
+
+class Planner:
+    #grid is the match's OccupancyGrid, bike is the AIBike this planner drives, rivals are the other bikes and budget the ThinkBudget.
+    #nodes is the most flood fill cells one decision may use (split between the three choices), straight_ahead is how long (seconds)
+    #each arc goes on straight after its turn, probe is how far ahead (units) danger() looks on every tick
+    def __init__(self, grid, bike, rivals, budget, mode="flood", nodes=900, straight_ahead=0.5, probe=(1.5, 3.0, 4.5)):
+        if mode not in ("flood", "voronoi"): raise ValueError(f"unknown planner mode {mode!r}")
+        self.grid = grid
+        self.bike = bike
+        self.rivals = rivals
+        self.budget = budget
+        self.mode = mode
+        self.nodes = nodes
+        self.straight_ahead = straight_ahead
+        self.probe = probe
+        #instead of clearing a visited set for every flood fill, every fill gets a new stamp and a cell counts as visited when it
+        #holds the current stamp
+        self.stamps = array('I', bytes(4 * grid.size * grid.size))
+        self.stamp = 0
+
+    def danger(self):
+        #a cheap check done on every tick: is there a blocked cell on the probe points straight ahead? (then the bike thinks right away)
+        b = self.bike
+        fx, fz = b.forward()
+        return any(self.grid.blocked(b.x + fx*d, b.z + fz*d) for d in self.probe)
+
+    def arc(self, turning, turn_time):
+        #drives the bike's current state ahead: turning for turn_time seconds, then straight for straight_ahead seconds, and
+        #returns the points along the way (about every 0.5 units, leaving out the first unit where the bike's own fresh trail is)
+        b = self.bike
+        x, z, heading = b.x, b.z, b.heading
+        points = []
+        travelled = 0.0
+        for duration, turn in ((turn_time, turning), (self.straight_ahead, 0)):
+            steps = max(1, math.ceil(b.speed * duration / 0.5))
+            dt = duration / steps
+            for _ in range(steps):
+                heading += turn * b.turn_speed * dt
+                h = math.radians(heading)
+                x += math.sin(h) * b.speed * dt
+                z += math.cos(h) * b.speed * dt
+                travelled += b.speed * dt
+                if travelled > 1.0: points.append((x, z))
+        return points
+
+    def flood(self, start, limit):
+        #counts the free cells reachable from the cell start, visiting at most limit cells. in voronoi mode the rivals' cells are
+        #flooded at the same time (breadth first, so every cell is taken by whoever gets there first) and only this bike's cells count
+        grid, n, counts = self.grid, self.grid.size, self.grid.counts
+        self.stamp += 1
+        stamp, stamps = self.stamp, self.stamps
+        queue = deque([(start, True)])
+        stamps[start] = stamp
+        if self.mode == "voronoi":
+            for rival in self.rivals:
+                if not rival.alive: continue
+                k = grid.cell_of(rival.x, rival.z)
+                if k >= 0 and stamps[k] != stamp:
+                    stamps[k] = stamp
+                    queue.append((k, False))
+        mine = 0
+        visited = 0
+        budget = self.budget
+        while queue and visited < limit:
+            k, own = queue.popleft()
+            visited += 1
+            if own: mine += 1
+            if visited % 64 == 0 and budget.expired(): break
+            i, j = divmod(k, n)
+            for nk, ok in ((k - n, i > 0), (k + n, i < n - 1), (k - 1, j > 0), (k + 1, j < n - 1)):
+                if ok and stamps[nk] != stamp and counts[nk] == 0:
+                    stamps[nk] = stamp
+                    queue.append((nk, own))
+        return mine, visited
+
+    def decide(self, turn_time):
+        #picks the bike's turning (0 straight, -1 left, 1 right) for the next turn_time seconds
+        b = self.bike
+        granted = self.budget.take(self.nodes)
+        side = (-1, 1) if b.rng.random() < 0.5 else (1, -1)     #so that a tie between left and right doesn't always go the same way
+        best, best_score = 0, None
+        for n, turning in enumerate((0,) + side):
+            score = None
+            points = self.arc(turning, turn_time)
+            for p, (x, z) in enumerate(points):
+                if self.grid.blocked(x, z):
+                    score = -len(points) + p    #this arc crashes: all crashing arcs score below 0, the later the crash the better
+                    break
+            if score is None:
+                limit = granted // (3 - n)      #the budget that is left is split between the choices that are left
+                mine, used = (0, 0) if limit <= 0 else self.flood(self.grid.cell_of(*points[-1]), limit)
+                granted -= used
+                score = mine
+            if best_score is None or score > best_score:
+                best, best_score = turning, score
+        self.budget.give_back(granted)  #whatever this decision didn't use is left for the other planners of this tick
+        return best
@@ -0,0 +1,143 @@
+#a small per-frame profiler: it measures how long each phase of a frame took (stepping the bikes, the collision checks, the camera,
+#the grid fade and so on) and keeps the last `window` frames of them, plus a rolling histogram of every phase.
+#usage:
+#   profiler = FrameProfiler(("bikes", "collisions", "camera"), counters=("entities",))
+#   profiler.begin_frame()
+#   ...step the bikes...            then profiler.mark("bikes")        (the time since the last mark goes to "bikes")
+#   ...collision checks...          then profiler.mark("collisions")
+#   profiler.end_frame(entity_count)
+#a phase can be marked more than once in a frame (e.g. once per simulation tick), its times are added up.
+#there is no "enabled" switch in here on purpose: whoever uses it keeps a reference that is None while profiling is off and
+#checks `if profiler:` before marking, so a disabled profiler costs one attribute check per phase and nothing else.
+#nothing in here needs ursina (game.py draws the overlay).
+import math
+import time
+from array import array
+
+BUCKETS_PER_DECADE = 8          #the histogram buckets are spaced logarithmically: 8 buckets between 1us and 10us, 8 more up to 100us...
+SMALLEST = 1e-6                 #bucket 0 holds everything below 1 microsecond
+BUCKETS = 2 + 6 * BUCKETS_PER_DECADE    #1us to 1s in between, and the last bucket holds everything of 1 second or more
+
+def bucket_of(seconds):
+    #the histogram bucket a duration (in seconds) falls into
+    if seconds < SMALLEST: return 0
+    return min(BUCKETS - 1, 1 + int(math.log10(seconds / SMALLEST) * BUCKETS_PER_DECADE))
+
+def bucket_top(bucket):
+    #the upper edge (in seconds) of a histogram bucket
+    return SMALLEST * 10 ** (bucket / BUCKETS_PER_DECADE)
+
+# Per-phase frame timings of the last `window` frames
+class FrameProfiler:
+    def __init__(self, phases, counters=(), window=600, clock=time.perf_counter):
+        self.phases = tuple(phases)         #the names of the timed phases
+        self.counters = tuple(counters)     #the names of other numbers stored with every frame (entity count, segment count, ...)
+        self.columns = self.phases + self.counters
+        if len(set(self.columns)) != len(self.columns): raise ValueError(f"the phase and counter names must all differ: {self.columns}")
+        self.window = window                #how many of the newest frames are kept
+        self.clock = clock
+        self.index = {name: i for i, name in enumerate(self.phases)}
+        #the frames are stored in a ring like the trail segments: frame number f sits in row f % window of one flat array of doubles
+        self.rows = array('d', bytes(8 * len(self.columns) * window))
+        self.buckets = array('B', bytes(len(self.phases) * window))    #the histogram bucket of every stored phase time
+        self.histograms = [[0] * BUCKETS for _ in self.phases]         #how many of the stored frames fall in each bucket
+        self.sums = [0.0] * len(self.phases)   #running sums of the stored phase times (for the means)
+        self.frames = 0                         #how many frames have been recorded in total
+        self.current = [0.0] * len(self.phases) #the phase times of the frame being measured right now
+        self.last = 0.0                         #the clock reading of the last begin_frame() or mark()
+
+    def stored(self):
+        #how many frames are stored right now. (not __len__, an empty profiler has to stay "true" for the `if profiler:` checks)
+        return min(self.frames, self.window)
+
+    def begin_frame(self):
+        self.last = self.clock()
+
+    def mark(self, phase):
+        #adds the time since the last mark (or begin_frame) to phase
+        now = self.clock()
+        self.current[self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self, *counts):
+        #stores the frame (and the values of the counters, in the same order as they were named) and starts the next one
+        p = len(self.phases)
+        slot = self.frames % self.window
+        base = slot * len(self.columns)
+        full = self.frames >= self.window   #the oldest frame is overwritten, so it leaves the histograms and sums first
+        rows, buckets, current = self.rows, self.buckets, self.current
+        for i in range(p):
+            if full:
+                self.histograms[i][buckets[slot*p + i]] -= 1
+                self.sums[i] -= rows[base + i]
+            t = current[i]
+            b = bucket_of(t)
+            buckets[slot*p + i] = b
+            self.histograms[i][b] += 1
+            self.sums[i] += t
+            rows[base + i] = t
+            current[i] = 0.0
+        for j, value in enumerate(counts):
+            rows[base + p + j] = value
+        self.frames += 1
+
+    def reset(self):
+        self.rows = array('d', bytes(8 * len(self.columns) * self.window))
+        self.histograms = [[0] * BUCKETS for _ in self.phases]
+        self.sums = [0.0] * len(self.phases)
+        self.frames = 0
+        self.current = [0.0] * len(self.phases)
+
+    def recent(self):
+        #goes through the stored frames from the oldest to the newest, as (frame number, tuple of all the columns)
+        n = len(self.columns)
+        for f in range(self.frames - self.stored(), self.frames):
+            base = (f % self.window) * n
+            yield f, tuple(self.rows[base:base + n])
+
+    def latest(self, column):
+        #the value of a phase or counter in the newest frame (0 before the first frame)
+        if not self.frames: return 0.0
+        return self.rows[((self.frames - 1) % self.window) * len(self.columns) + self.columns.index(column)]
+
+    def mean(self, phase):
+        return self.sums[self.index[phase]] / max(1, self.stored())
+
+    def percentile(self, phase, q):
+        #an estimate of the q-th percentile (q from 0 to 1) of a phase, read off its histogram: the top edge of the bucket it is in
+        hist = self.histograms[self.index[phase]]
+        need = q * self.stored()
+        seen = 0
+        for b, count in enumerate(hist):
+            seen += count
+            if count and seen >= need: return bucket_top(b)
+        return 0.0
+
+    def max(self, phase):
+        i, n = self.index[phase], len(self.columns)
+        return max((self.rows[(f % self.window) * n + i] for f in range(self.frames - self.stored(), self.frames)), default=0.0)
+
+    def summary(self):
+        #mean, p50, p95 and max of every phase in milliseconds
+        return {phase: {"mean": self.mean(phase) * 1e3, "p50": self.percentile(phase, 0.5) * 1e3,
+                        "p95": self.percentile(phase, 0.95) * 1e3, "max": self.max(phase) * 1e3} for phase in self.phases}
+
+    def dump(self, path):
+        #writes every stored frame to path for looking at it later: a .json file gets a list of objects, anything else gets a csv.
+        #the phase times are written in milliseconds
+        import csv      #(only imported here, `import tron` shouldn't pay for them when nothing is ever dumped)
+        import json
+        p = len(self.phases)
+        def record(row):
+            return [round(v * 1e3, 4) for v in row[:p]] + list(row[p:])
+        if path.endswith(".json"):
+            frames = [dict(zip(("frame",) + self.columns, [f] + record(row))) for f, row in self.recent()]
+            with open(path, "w") as out:
+                json.dump({"units": "ms", "summary": self.summary(), "frames": frames}, out)
+        else:
+            with open(path, "w", newline="") as out:
+                writer = csv.writer(out)
+                writer.writerow(("frame",) + tuple(f"{c}_ms" for c in self.phases) + self.counters)
+                for f, row in self.recent():
+                    writer.writerow([f] + record(row))
+        return path
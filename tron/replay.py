@@ -0,0 +1,200 @@
+#recording matches to a small binary file and playing them back (headless here, or in the ursina view with `python game.py --replay FILE`).
+#a match is completely decided by its random state and the humans' inputs, so a recording doesn't store any positions per tick:
+#only 2 bytes (throttle, steer) per human bike per tick, plus a "keyframe" of the whole match state every keyframe_every ticks.
+#
+#the file layout, everything little endian:
+#   header:  PREFIX (magic b"TRNR", version, keyframe_every, ticks, winner, length of the json) and then the json: the roster and
+#            the other Match arguments, so the replay can set up the same match again
+#   blocks:  block j = the keyframe of tick j*keyframe_every (the state right before that tick is simulated), followed by the
+#            inputs of the keyframe_every ticks from there on: (throttle, steer) as 2 int8 per human bike, in roster order
+#every block has the same size, so the block of any tick is found with one multiplication. a Replay memory maps the file and
+#jumps to a tick by restoring the keyframe right before it and simulating at most keyframe_every-1 ticks from there.
+#a keyframe has a fixed size too: the match's tick, the random state, and for every bike its BIKE record and its trail's Trail.pack()
+#(mostly the raw float32 rings of its pieces and runs, the same bytes as their SegmentBuffer.data).
+#matches where a planner has a wall clock budget (plan_seconds) can't be recorded: their ai decisions depend on the computer's speed.
+#neither can matches with brains in workers (tron.brains): a keyframe can't hold a question that is still waiting for its answer.
+#usage (headless): python -m tron.replay FILE [--tick N]
+import argparse
+import json
+import mmap
+import struct
+
+from .sim import AIBike, Match, PlayerBike
+
+MAGIC = b"TRNR"
+VERSION = 2
+PREFIX = struct.Struct("<4sHIqhI")     #magic, version, keyframe_every, ticks recorded, winner (bike number, -1 none, -2 draw), json length
+MATCH = struct.Struct("<q")             #the match's tick
+RNG = struct.Struct("<625IdB")          #random.Random's state: 625 numbers of the mersenne twister, gauss_next and if it is set
+#a bike: x, z, heading, speed, the ai's timer and think_interval, alive, cause and turning
+BIKE = struct.Struct("<4d2dBBb")
+CAUSES = (None, "own_trail", "rival_trail")
+INPUT = struct.Struct("<bb")
+
+def keyframe_size(match):
+    return MATCH.size + RNG.size + sum(BIKE.size + bike.trail.packed_size() for bike in match.bikes)
+
+def pack_state(match):
+    #the whole state of a match (everything that the next ticks depend on) as one bytes object of keyframe_size(match) bytes
+    parts = [MATCH.pack(match.tick)]
+    version, internal, gauss = match.rng.getstate()
+    parts.append(RNG.pack(*internal, gauss or 0.0, gauss is not None))
+    for bike in match.bikes:
+        ai = isinstance(bike, AIBike)
+        parts.append(BIKE.pack(bike.x, bike.z, bike.heading, bike.speed, bike.timer if ai else 0.0,
+                               bike.think_interval if ai else 0.0, bike.alive, CAUSES.index(bike.cause), bike.turning if ai else 0))
+        parts.append(bike.trail.pack())
+    return b"".join(parts)
+
+def unpack_state(match, buffer, offset=0):
+    #puts a state made by pack_state() back into match (which has to be set up with the same roster). buffer can be anything that
+    #supports the buffer protocol (bytes, a memoryview of a memory mapped file...)
+    (match.tick,) = MATCH.unpack_from(buffer, offset)
+    offset += MATCH.size
+    values = RNG.unpack_from(buffer, offset)
+    offset += RNG.size
+    match.rng.setstate((3, values[:625], values[625] if values[626] else None))
+    for brain in match.remote: brain.cancel()
+    #the shared grids are rebuilt from the restored trails
+    match.broadphase.clear()
+    if match.occupancy: match.occupancy.clear()
+    for bike in match.bikes:
+        (bike.x, bike.z, bike.heading, bike.speed, timer, think_interval, alive, cause,
+         turning) = BIKE.unpack_from(buffer, offset)
+        offset += BIKE.size
+        if isinstance(bike, AIBike):
+            bike.timer, bike.think_interval, bike.turning = timer, think_interval, turning
+        bike.alive, bike.cause = bool(alive), CAUSES[cause]
+        offset = bike.trail.unpack(buffer, offset)
+    match.over = False
+    match.winner = None
+    match.end_game()    #(in case the state was taken on the tick the match ended)
+    return offset
+
+def match_settings(match):
+    #the json part of the header: what is needed to make the same Match again
+    return {"seed": match.seed, "bounds": match.bounds, "dt": match.dt, "plan_nodes": match.plan_nodes, "roster": match.roster,
+            "ccd": match.ccd, "arena": match.arena.spec}
+
+def new_match(settings):
+    #(files from before arenas had shapes have no "arena", their arena is the square of their bounds)
+    return Match(seed=settings["seed"], bounds=settings["bounds"], dt=settings["dt"], plan_nodes=settings["plan_nodes"],
+                 roster=settings["roster"], ccd=settings["ccd"], arena=settings.get("arena"))
+
+# Writes a match to a file while it is being played
+class Recorder:
+    #use step() instead of match.step() for every tick, and close() at the end (it writes the number of ticks and the winner).
+    #match has to be new (or just reset). keyframe_every trades the size of the file against how far a seek has to simulate:
+    #a keyframe of a normal match is about 75 KB, the inputs of the same 600 ticks are 1.2 KB
+    def __init__(self, path, match, keyframe_every=600):
+        if match.tick: raise ValueError("the recording has to start on tick 0 of the match")
+        if match.plan_seconds is not None and match.think_budget:
+            raise ValueError("a match whose planners have a wall clock budget (plan_seconds) can't be replayed")
+        if match.remote: raise ValueError("a match with brains that think in workers (tron.brains) can't be replayed")
+        self.match = match
+        self.keyframe_every = keyframe_every
+        self.humans = [bike.name for bike in match.bikes if isinstance(bike, PlayerBike)]   #the bikes driven by inputs
+        self.ticks = 0
+        self.file = open(path, "wb")
+        header = json.dumps(dict(match_settings(match), humans=self.humans)).encode()
+        self.header_length = len(header)
+        self.file.write(PREFIX.pack(MAGIC, VERSION, keyframe_every, 0, -1, self.header_length))
+        self.file.write(header)
+
+    def step(self, throttle=0, steer=0, inputs=None):
+        #records the tick's inputs (in the same form as Match.step takes them) and simulates it
+        match = self.match
+        if match.over: return
+        if self.ticks % self.keyframe_every == 0: self.file.write(pack_state(match))
+        record = bytearray()
+        for name in self.humans:
+            t, s = inputs[name] if inputs and name in inputs else (throttle, steer)
+            record += INPUT.pack(t, s)
+        self.file.write(record)
+        match.step(throttle, steer, inputs)
+        self.ticks += 1
+
+    def close(self):
+        if self.file.closed: return
+        match = self.match
+        names = [bike.name for bike in match.bikes]
+        winner = -2 if match.winner == "draw" else names.index(match.winner) if match.winner in names else -1
+        self.file.seek(0)   #the prefix has a fixed size, so it is simply written over with the number of ticks and the winner
+        self.file.write(PREFIX.pack(MAGIC, VERSION, self.keyframe_every, self.ticks, winner, self.header_length))
+        self.file.close()
+
+# A recorded match, memory mapped
+class Replay:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.keyframe_every, self.ticks, winner, length = PREFIX.unpack_from(self.data, 0)
+        if magic != MAGIC: raise ValueError(f"{path} is not a match recording")
+        if version != VERSION: raise ValueError(f"{path} is a version {version} recording, this code reads version {VERSION}")
+        self.settings = json.loads(bytes(self.data[PREFIX.size:PREFIX.size + length]))
+        self.humans = self.settings["humans"]
+        self.start = PREFIX.size + length   #where block 0 starts
+        self.match = new_match(self.settings)
+        names = [bike.name for bike in self.match.bikes]
+        self.winner = "draw" if winner == -2 else names[winner] if winner >= 0 else None
+        self.keyframe = keyframe_size(self.match)
+        self.block = self.keyframe + self.keyframe_every * INPUT.size * len(self.humans)
+        if not self.ticks:
+            #the recording was never closed (the game was stopped in the middle of the match): count the ticks that made it to disk
+            per_tick = INPUT.size * len(self.humans)
+            full, rest = divmod(len(self.data) - self.start, self.block)
+            self.ticks = full * self.keyframe_every + (max(0, rest - self.keyframe) // per_tick if per_tick else 0)
+        self.seek(0)    #the match starts from the first keyframe (a new Match of a recording made without a seed would be different)
+
+    def close(self):
+        self.data.close()
+
+    def inputs(self, tick):
+        #the inputs of the human bikes on tick, as a dictionary of name -> (throttle, steer) like Match.step takes them
+        block, k = divmod(tick, self.keyframe_every)
+        offset = self.start + block * self.block + self.keyframe + k * INPUT.size * len(self.humans)
+        return {name: INPUT.unpack_from(self.data, offset + i * INPUT.size) for i, name in enumerate(self.humans)}
+
+    def seek(self, tick, match=None):
+        #puts match (the replay's own Match if None) into the state right before tick is simulated and returns it. only the
+        #keyframe before tick is read and at most keyframe_every-1 ticks are simulated, no matter how far into the match tick is
+        match = match or self.match
+        tick = max(0, min(tick, self.ticks))
+        block = min(tick // self.keyframe_every, max(0, (self.ticks - 1) // self.keyframe_every))
+        unpack_state(match, self.data, self.start + block * self.block)
+        while match.tick < tick and not match.over:
+            match.step(inputs=self.inputs(match.tick))
+        return match
+
+    def step(self, match=None):
+        #simulates the next recorded tick of match (the replay's own Match if None). returns False once the recording is over
+        match = match or self.match
+        if match.over or match.tick >= self.ticks: return False
+        match.step(inputs=self.inputs(match.tick))
+        return True
+
+    def run(self):
+        #plays the whole recording from the start (headless) and returns the winner
+        match = self.seek(0)
+        while self.step(match): pass
+        return match.winner
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tron.replay", description="Play a recorded Tron match headlessly.")
+    parser.add_argument("path")
+    parser.add_argument("--tick", type=int, help="show the state of the bikes right before this tick")
+    args = parser.parse_args(argv)
+    replay = Replay(args.path)
+    print(f"{args.path}: {replay.ticks} ticks, keyframe every {replay.keyframe_every}, bikes "
+          f"{', '.join(bike.name for bike in replay.match.bikes)}, recorded winner {replay.winner}")
+    if args.tick is not None:
+        match = replay.seek(args.tick)
+        for bike in match.bikes:
+            print(f"  {bike.name:<12} x {bike.x:8.3f}  z {bike.z:8.3f}  heading {bike.heading % 360:7.2f}  speed {bike.speed:6.2f}  "
+                  f"{'alive' if bike.alive else 'crashed (' + bike.cause + ')'}")
+    winner = replay.run()
+    print(f"replayed winner {winner} after {replay.match.tick} ticks" + ("" if winner == replay.winner else "  (DIFFERENT!)"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#rewinding a running match by a few seconds (the practice mode of game.py: R goes back and lets you try that bit again).
+#a Rewind keeps a ring of Match.snapshot()s of the last few seconds. a snapshot doesn't copy the trails, only a handful of numbers
+#per bike and the random state, and going back only takes out the trail pieces that were added since and puts back the ones
+#that were evicted since (the trails keep those in their TrailHistory), so both are cheap enough to do while the game runs:
+#tron.replay's pack_state()/unpack_state() copy the whole trails and rebuild every grid from them (7 to 50 ms for one unpack).
+#   rewind = Rewind(match)
+#   match.step(...); rewind.record()     #after every tick
+#   rewind.back(3 * TICK_RATE)           #the match is 3 seconds (or a little more) back in time
+from collections import deque
+
+from .sim import TICK_RATE
+
+class Rewind:
+    #seconds is how far back it can go and every is how many ticks apart the snapshots are (a rewind lands on a snapshot, so it
+    #can go up to every-1 ticks further back than asked). the match has to be at tick 0 or be stepped from a state it recorded
+    def __init__(self, match, seconds=10.0, every=6):
+        self.match = match
+        self.every = every
+        self.size = int(seconds * TICK_RATE / every) + 1    #how many snapshots are kept
+        self.snapshots = deque()    #oldest first, every one is (tick, over, winner, random state, bikes, stats), see Match.snapshot
+        match.keep_history()
+        self.record()
+
+    def record(self):
+        #takes a snapshot if the match is on a tick that gets one. call it after every tick of the match
+        match, snapshots = self.match, self.snapshots
+        if snapshots and match.tick < snapshots[-1][0]: snapshots.clear()  #the match was reset (or seeked) behind our back
+        if match.tick % self.every or (snapshots and snapshots[-1][0] == match.tick): return
+        snapshots.append(match.snapshot())
+        if len(snapshots) > self.size:
+            snapshots.popleft()
+            match.forget(snapshots[0])
+
+    def back(self, ticks):
+        #goes back to the newest snapshot at least ticks before the match's tick (or the oldest one if there is none that far
+        #back) and throws away the ones after it. returns how many ticks it went back
+        match, snapshots = self.match, self.snapshots
+        if not snapshots: return 0
+        target = match.tick - ticks
+        while len(snapshots) > 1 and snapshots[-1][0] > target: snapshots.pop()
+        tick = match.tick
+        match.restore(snapshots[-1])
+        return tick - match.tick
+
+    def clear(self):
+        #call it after match.reset() (the snapshots of the old match can't be restored in the new one), then record() again
+        self.snapshots.clear()
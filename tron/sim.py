@@ -0,0 +1,769 @@
+#the headless simulation core of the game: bikes, trails, collisions and who wins.
+#nothing in here imports ursina, so a match can run without a window (and much faster than real time). the ursina TronGame in
+#game.py is only a view on top of a Match: it reads the keyboard, calls Match.step() and then copies the positions onto its Entities.
+#positions are on the floor: x goes to the right and z goes forward, headings are in degrees like ursina's rotation_y
+#(heading 0 means moving towards +z, heading 90 means moving towards +x).
+import math
+import random
+import struct
+from array import array
+
+from .arena import SquareArena, make_arena
+from .geometry import OccupancyGrid, RunHash, SegmentBuffer, SpatialHash, TrailBroadphase, swept_circle_hit
+from .planner import Planner, ThinkBudget
+
+TICK_RATE = 60              #how many simulation ticks there are in one second
+DT = 1.0 / TICK_RATE        #the fixed time step of one tick (in seconds)
+ARENA_BOUNDS = 72.0         #the arena goes from -ARENA_BOUNDS to +ARENA_BOUNDS on both x and z
+BIKE_RADIUS = 0.30          #the radius of a bike when it is considered as a 2D circle for the collision checks
+SKIP_RECENT = 10            #how many of a trail's newest segments are ignored by the collision checks
+RUN_TOLERANCE = 0.02        #how far (in units) a coalesced run of a trail may be from the path the bike really drove
+
+#the fixed part of Trail.pack(): last_pos, if it is set, the first id and count of the pieces. and for a coalesced trail also the first
+#id and count of the runs, committed, the wedge and if it is set
+TRAIL_STATE = struct.Struct("<2dBqq")
+RUN_STATE = struct.Struct("<qqq6dB")
+
+PLAYER_START = (-14.0, 0.0, 0.0)    #(x, z, heading) where the player's bike starts
+AI_START = (14.0, 0.0, 180.0)       #(x, z, heading) where the ai bike starts
+
+# The pieces a trail evicted, kept so that it can go back to an older snapshot (see Trail.restore)
+class TrailHistory:
+    #a trail only ever adds pieces at its newest end and evicts them at its oldest end, and a piece never changes while it is in
+    #the ring (its id keeps counting up). so going back to a snapshot only needs the pieces that were evicted since, which are
+    #copied in here when they are evicted (16 bytes each, and the id of the run they were in). nothing is copied for a snapshot
+    def __init__(self):
+        self.first_id = 0           #the id of the oldest piece in here
+        self.data = array('f')      #ax, az, bx, bz of every piece, oldest first (the same float32 values the ring had)
+        self.runs = array('q')      #the run every piece was in (-1 for a trail without runs)
+
+    @property
+    def end_id(self):
+        #the id of the next piece the trail will evict
+        return self.first_id + len(self.runs)
+
+    def evicted(self, pid, ax, az, bx, bz, rid):
+        if pid != self.end_id: self.clear(pid)  #(a gap: the trail was cleared or unpacked, nothing from before goes with it)
+        self.data.extend((ax, az, bx, bz))
+        self.runs.append(rid)
+
+    def get(self, pid):
+        i = (pid - self.first_id) * 4
+        d = self.data
+        return d[i], d[i+1], d[i+2], d[i+3]
+
+    def forget(self, before):
+        #drops the pieces older than before (no snapshot that needs them is kept anymore). deleting from the front of an array
+        #moves everything after it, so it is only done once there are a few hundred of them to drop
+        n = min(before, self.end_id) - self.first_id
+        if n < 256: return
+        del self.data[:4*n]
+        del self.runs[:n]
+        self.first_id += n
+
+    def truncate(self, end):
+        #drops the pieces from end on (they are back in the trail)
+        n = max(0, end - self.first_id)
+        del self.data[4*n:]
+        del self.runs[n:]
+
+    def clear(self, first_id=0):
+        self.first_id = first_id
+        del self.data[:]
+        del self.runs[:]
+
+# The trail data of one bike (without anything to draw it)
+class Trail:
+    #a bike drops a short segment (a "piece") on every tick, so a long straight line is hundreds of pieces in a row. with coalesce on,
+    #the pieces that are old enough to be collision checked (all but the SKIP_RECENT newest) are also merged into "runs": the newest
+    #run grows as long as the next piece goes on in the same direction, so a straight line is one run. the collision checks and the
+    #trail mesh use the runs, the pieces stay the real trail: the trail still loses its oldest piece when a new one comes in (the
+    #oldest run gets shorter by one piece), the shared grids (watchers) get the pieces, and a run never strays more than
+    #about 2*tolerance from the pieces it was made of
+    def __init__(self, min_segment=0.16, max_segments=1000, coalesce=True, tolerance=RUN_TOLERANCE):
+        self.min_segment = min_segment      #the minimum distance the bike should travel before a trail segment is added
+        self.max_segments = max_segments    #the longest the trail can get before the oldest segments start disappearing
+        self.last_pos = None                #(x, z) where the last trail segment was left off at. None until the first step
+        self.segments = SegmentBuffer(max_segments) #a ring buffer to hold/contain the end points of each trail segment
+        self.tolerance = tolerance
+        if coalesce:
+            self.runs = SegmentBuffer(max_segments)     #the runs (never more of them than pieces), oldest first like the pieces
+            self.run_pieces = array('I', bytes(4 * max_segments))  #how many pieces each run is made of (slot = run id % max_segments)
+            self.committed = 0              #the pieces with an id below this one are in the runs already
+            #which way the newest run may still grow: (x, z) of its first point and the unit vectors of the wedge's right and left
+            #edges (a new end point has to be between them). None if there is no run yet
+            self.wedge = None
+            self.index = RunHash()          #spatial hash of the runs (filled with their pieces), for collides()
+        else:
+            self.runs = None
+            self.index = SpatialHash()      #spatial hash of the segments so that collides() only looks at the segments near the bike
+        #the match's shared grids this trail keeps up to date (its TrailBroadphase watcher, and the OccupancyGrid if a bike plans
+        #with it). each one has add() and remove() that get every segment's end points when it is added and when it is evicted
+        self.watchers = []
+        self.history = None     #a TrailHistory while the match keeps one (Match.keep_history), for restore()
+
+    @property
+    def newest_id(self):
+        #the id of the newest segment (-1 if the trail is empty)
+        return self.segments.first_id + len(self.segments) - 1
+
+    def add_segment(self, ax, az, bx, bz):
+        #adds the segment from (ax,az) to (bx,bz), unless it is shorter than min_segment
+        if math.hypot(bx-ax, bz-az) < self.min_segment: return
+        self.append_piece(ax, az, bx, bz)
+
+    def start_at(self, sid):
+        #makes an empty trail number its next piece sid (a copy of another trail that only gets that trail's pieces from sid on,
+        #like a network client joining in the middle of a match, has to use the same ids)
+        self.segments.first_id = sid
+        if self.runs is not None: self.committed = sid
+
+    def append_piece(self, ax, az, bx, bz):
+        #adds a piece as it is, without the min_segment check (for pieces that were already checked, e.g. ones sent by a server)
+        segs = self.segments
+        evicted = segs.append(ax, az, bx, bz)  #if the buffer was full, the oldest segment is overwritten and handed back
+        if evicted is not None:
+            if self.history is not None:    #(before the oldest run gets shorter, the history wants the run the piece was in)
+                self.history.evicted(segs.first_id - 1, *evicted, -1 if self.runs is None else self.runs.first_id)
+            if self.runs is None: self.index.remove_oldest(*evicted)   #so that we can take it out of the spatial hash too
+            else: self.shorten_oldest_run(evicted)
+            for w in self.watchers: w.remove(*evicted)
+        #the spatial hash gets the end points the way the buffer stored them (rounded to float32), the same values remove_oldest()
+        #gets back later. with the float64 ones a point right on a cell border could round into the next cell and not be found again
+        sid = segs.first_id + segs.count - 1    #(the newest id)
+        stored = segs.get(sid)
+        if self.runs is None: self.index.insert(sid, *stored)
+        else:
+            while self.committed <= sid - SKIP_RECENT:     #the piece that just got old enough for the collision checks
+                self.commit(self.committed)
+                self.committed += 1
+        for w in self.watchers: w.add(*stored)
+
+    def commit(self, pid):
+        #puts piece pid into the runs: it makes the newest run longer if it starts where that run ends and its end point is inside
+        #the run's wedge, otherwise it starts a new run.
+        #the wedge is what keeps a run straight: every piece end point p at distance d from the run's first point allows only the
+        #directions within asin(tolerance/d) of p's own direction, and the wedge is what all the points so far allow together. so
+        #the line from the first point to any new end point inside the wedge passes within tolerance of every point before it,
+        #and a slow curve stops fitting after a while instead of being merged into one long wrong line.
+        #(the angles are never worked out: "between the edges" and "tighter than the edge" are the signs of 2D cross products,
+        #and turning p's direction by asin(tolerance/d) only needs its sine tolerance/d and the cosine sqrt(1 - sine^2))
+        ax, az, bx, bz = self.segments.get(pid)
+        runs = self.runs
+        if self.wedge is not None:
+            rid = runs.first_id + runs.count - 1
+            d, i = runs.data, (rid % self.max_segments) * 4
+            if d[i+2] == ax and d[i+3] == az:   #(both are float32 values from the buffers, so a piece that goes on is exactly equal)
+                ox, oz, rx, rz, lx, lz = self.wedge
+                vx, vz = bx - ox, bz - oz
+                if vx*rx + vz*rz > 0 and rx*vz - rz*vx >= 0 and vx*lz - vz*lx >= 0:   #(ahead, and between the edges)
+                    length = math.hypot(vx, vz)
+                    sin = self.tolerance / length
+                    if sin > 1.0: sin = 1.0
+                    cos = math.sqrt(1.0 - sin*sin) / length
+                    sin /= length
+                    nrx, nrz = vx*cos + vz*sin, vz*cos - vx*sin     #v turned right and left, as unit vectors
+                    nlx, nlz = vx*cos - vz*sin, vz*cos + vx*sin
+                    if rx*nrz - rz*nrx > 0: rx, rz = nrx, nrz   #the new edges only count where they make the wedge narrower
+                    if nlx*lz - nlz*lx > 0: lx, lz = nlx, nlz
+                    self.wedge = (ox, oz, rx, rz, lx, lz)
+                    d[i+2], d[i+3] = bx, bz     #only the end of the run moves
+                    self.run_pieces[rid % self.max_segments] += 1
+                    self.index.add_piece(rid, ax, az, bx, bz)
+                    return
+        runs.append(ax, az, bx, bz)     #(never full: every run has at least one piece in the pieces' buffer)
+        rid = runs.first_id + runs.count - 1
+        self.run_pieces[rid % self.max_segments] = 1
+        self.index.add_piece(rid, ax, az, bx, bz)
+        self.wedge = (ax, az) + self.edges(bx - ax, bz - az)
+
+    def edges(self, vx, vz):
+        #the unit vectors of v turned right and left by asin(tolerance/|v|)
+        length = math.hypot(vx, vz)
+        vx, vz = vx / length, vz / length
+        s = min(1.0, self.tolerance / length)
+        c = math.sqrt(1.0 - s*s)
+        return vx*c + vz*s, vz*c - vx*s, vx*c - vz*s, vz*c + vx*s
+
+    def shorten_oldest_run(self, evicted):
+        #the oldest piece (evicted) left the trail: it was the first piece of the oldest run, so that run now starts where the piece
+        #ended, or disappears if it was its only piece
+        runs = self.runs
+        if not runs.count: return
+        ax, az, bx, bz = evicted
+        self.index.remove_piece(ax, az, bx, bz)
+        rid = runs.first_id
+        k = rid % self.max_segments
+        self.run_pieces[k] -= 1
+        if self.run_pieces[k]:
+            runs.data[k*4], runs.data[k*4+1] = bx, bz   #only the start of the run moves
+        else:
+            runs.pop_oldest()
+            if not runs.count: self.wedge = None
+
+    def step(self, x, z):
+        #called on every tick to update the trail based on the bike's new position (x, z)
+        if self.last_pos is None:   #only one point so far, no segment can be made yet
+            self.last_pos = (x, z)
+            return
+        lx, lz = self.last_pos
+        dx, dz = x-lx, z-lz             #how far (and in which direction) the bike moved since the last tick
+        dist = math.hypot(dx, dz)
+        if dist >= self.min_segment*2.5:
+            #a big jump (fast motion, lag or a sharp turn): split it into smaller segments for a smooth trail rather than one long one
+            steps = max(2, int(dist / self.min_segment))
+            for _ in range(steps):
+                nx, nz = lx + dx/steps, lz + dz/steps
+                self.add_segment(lx, lz, nx, nz)
+                lx, lz = nx, nz
+            self.last_pos = (lx, lz)
+        else:
+            self.add_segment(lx, lz, x, z)
+            self.last_pos = (x, z)
+
+    def clear(self, notify=True):
+        #notify=False is for when the watchers have just been emptied as a whole (a Match.reset), so they don't need every segment
+        if notify:
+            for segment in self.segments:
+                for w in self.watchers: w.remove(*segment)
+        self.segments.clear()
+        self.index.clear()
+        if self.history is not None: self.history.clear()
+        self.last_pos = None
+        if self.runs is not None:
+            self.runs.clear()
+            self.committed = 0
+            self.wedge = None
+
+    def packed_size(self):
+        size = TRAIL_STATE.size + 16 * self.max_segments
+        if self.runs is not None: size += RUN_STATE.size + 20 * self.max_segments
+        return size
+
+    def pack(self):
+        #the whole state of the trail as packed_size() bytes (for the keyframes of tron.replay): the raw rings plus a few numbers
+        last = self.last_pos or (0.0, 0.0)
+        parts = [TRAIL_STATE.pack(last[0], last[1], self.last_pos is not None, self.segments.first_id, len(self.segments)),
+                 self.segments.data.tobytes()]
+        if self.runs is not None:
+            parts.append(RUN_STATE.pack(self.runs.first_id, len(self.runs), self.committed, *(self.wedge or (0.0,) * 6),
+                                        self.wedge is not None))
+            parts += [self.runs.data.tobytes(), self.run_pieces.tobytes()]
+        return b"".join(parts)
+
+    def unpack(self, buffer, offset=0):
+        #puts a state made by pack() back (from anything that supports the buffer protocol) and returns the offset right after it.
+        #the spatial hash is rebuilt and the watchers get every piece, so they have to be empty (or cleared) before this
+        self.clear(notify=False)
+        lx, lz, has_last, first_id, count = TRAIL_STATE.unpack_from(buffer, offset)
+        offset += TRAIL_STATE.size
+        self.last_pos = (lx, lz) if has_last else None
+        size = 16 * self.max_segments
+        self.segments.data = array('f', bytes(buffer[offset:offset + size]))
+        offset += size
+        self.segments.first_id, self.segments.count = first_id, count
+        if self.runs is not None:
+            values = RUN_STATE.unpack_from(buffer, offset)
+            offset += RUN_STATE.size
+            self.runs.first_id, self.runs.count, self.committed = values[:3]
+            self.wedge = values[3:9] if values[9] else None
+            self.runs.data = array('f', bytes(buffer[offset:offset + size]))
+            offset += size
+            self.run_pieces = array('I', bytes(buffer[offset:offset + 4 * self.max_segments]))
+            offset += 4 * self.max_segments
+            #the pieces of every run, oldest first (the same order they were added in)
+            pid = first_id
+            for rid in range(self.runs.first_id, self.runs.first_id + len(self.runs)):
+                for _ in range(self.run_pieces[rid % self.max_segments]):
+                    self.index.add_piece(rid, *self.segments.get(pid))
+                    pid += 1
+        for sid in range(first_id, first_id + count):
+            stored = self.segments.get(sid)
+            if self.runs is None: self.index.insert(sid, *stored)
+            for w in self.watchers: w.add(*stored)
+        return offset
+
+    def snapshot(self):
+        #the state of the trail for restore(): only a handful of numbers, the pieces stay where they are. (the runs between the
+        #oldest and the newest one never change, and the oldest one only loses pieces, which the history keeps)
+        segs = self.segments
+        if self.runs is None: return self.last_pos, segs.first_id, segs.count
+        runs = self.runs
+        newest = self.run_pieces[(runs.first_id + len(runs) - 1) % self.max_segments] if len(runs) else 0
+        return self.last_pos, segs.first_id, segs.count, self.committed, self.wedge, runs.first_id, len(runs), newest
+
+    def restore(self, state):
+        #goes back to a snapshot() taken earlier: the pieces added since are taken out of the spatial hash and the watchers again
+        #(newest first) and the ones evicted since come back from the history (newest first too, each one older than all the rest),
+        #so it costs about as much as the pieces that changed since, not as much as the whole trail like unpack() does
+        segs, cap, history = self.segments, self.max_segments, self.history
+        first, count = state[1], state[2]
+        end = first + count
+        old_first, old_end = segs.first_id, segs.first_id + len(segs)
+        if first > old_first or end > old_end: raise ValueError("a trail can only go back to a snapshot from before")
+        back = min(old_first, end)      #the pieces from first to back come back from the history
+        if first < back and (history is None or first < history.first_id or back > history.end_id):
+            raise ValueError("the trail's history doesn't go back that far")
+        runs = self.runs
+        committed = end if runs is None else state[3]
+        if runs is None:
+            for sid in range(old_end - 1, max(end, old_first) - 1, -1): self.index.remove_newest(*segs.get(sid))
+        else:
+            for pid in range(self.committed - 1, max(committed, old_first) - 1, -1):
+                self.index.remove_newest_piece(*segs.get(pid))
+        for sid in range(max(end, old_first), old_end):
+            stored = segs.get(sid)
+            for w in self.watchers: w.remove(*stored)
+        #(an evicted piece goes back into its slot of the ring, where one of the pieces that were just taken out is)
+        d = segs.data
+        for pid in range(back - 1, first - 1, -1):
+            stored = history.get(pid)
+            i = (pid % cap) * 4
+            d[i:i+4] = array('f', stored)
+            if runs is None: self.index.insert_oldest(pid, *stored)
+            elif pid < committed: self.index.add_oldest_piece(history.runs[pid - history.first_id], *stored)
+            for w in self.watchers: w.add(*stored)
+        if runs is not None:
+            self.restore_runs(state, back)
+            self.committed, self.wedge = committed, state[4]
+        segs.first_id, segs.count = first, count
+        self.last_pos = state[0]
+        if history is not None: history.truncate(first)
+
+    def restore_runs(self, state, back):
+        #the runs of a snapshot: the ones from its oldest run up to the oldest run now lost pieces since (or are gone), the history
+        #tells how many. the runs after that are untouched, but the snapshot's newest one may have grown (the snapshot has its
+        #count). the end points of every run that changed are worked out again from its first and last piece
+        first, committed, run_first, run_count, newest_count = state[1], state[3], state[5], state[6], state[7]
+        runs, pieces, cap, history = self.runs, self.run_pieces, self.max_segments, self.history
+        newest = run_first + run_count - 1
+        lost = {}   #run id -> how many of its pieces were evicted since
+        for pid in range(first, min(back, committed)):
+            rid = history.runs[pid - history.first_id]
+            lost[rid] = lost.get(rid, 0) + 1
+        changed = []    #(run id, its first piece, its number of pieces)
+        pid = first
+        for rid in range(run_first, min(runs.first_id, newest) + 1):
+            n = newest_count if rid == newest else lost.get(rid, 0) + (pieces[rid % cap] if rid >= runs.first_id else 0)
+            changed.append((rid, pid, n))
+            pid += n
+        if newest > runs.first_id: changed.append((newest, committed - newest_count, newest_count))
+        d = runs.data
+        for rid, pid, n in changed:
+            k = rid % cap
+            pieces[k] = n
+            ax, az = self.segments.get(pid)[:2]
+            bx, bz = self.segments.get(pid + n - 1)[2:]
+            d[k*4:k*4+4] = array('f', (ax, az, bx, bz))
+        runs.first_id, runs.count = run_first, run_count
+
+    def collides(self, x, z, skip_recent=SKIP_RECENT, radius=BIKE_RADIUS):
+        #checks if a bike (a circle at (x, z)) hits the trail, except for the skip_recent newest segments
+        if len(self.segments)<=skip_recent: return False
+        checked = len(range(len(self.segments))[:-skip_recent])  #how many of the oldest segments are old enough to be checked
+        limit = self.segments.first_id + checked    #only segments with an id smaller than this are checked
+        if self.runs is not None:
+            #the runs hold exactly the pieces that are old enough, so they are all checked. the hash has the pieces, and a run can
+            #be up to 2*tolerance away from its pieces, so the cells are looked up with that much more radius
+            if skip_recent != SKIP_RECENT: raise ValueError("a coalesced trail can only skip SKIP_RECENT segments")
+            runs = self.runs
+            ids = self.index.query(x, z, radius + 2*self.tolerance)
+            return runs.hits_circle(ids, runs.first_id + len(runs), x, z, radius*radius)
+        #only the segments stored in the cells around the bike's circle can touch it, so only those are handed to the distance test
+        return self.segments.hits_circle(self.index.query(x, z, radius), limit, x, z, radius*radius)
+
+    def clearance(self, x, z, reach, skip_recent=SKIP_RECENT):
+        #the near miss version of collides(): how far (x, z) is from the trail (the same segments collides() checks), or None if
+        #it is further away than reach. tron.telemetry measures how close the bikes come to the trails with it
+        if len(self.segments)<=skip_recent: return None
+        if self.runs is not None:
+            if skip_recent != SKIP_RECENT: raise ValueError("a coalesced trail can only skip SKIP_RECENT segments")
+            runs = self.runs
+            d2 = runs.nearest(self.index.query(x, z, reach + 2*self.tolerance), runs.first_id + len(runs), x, z, reach*reach)
+        else:
+            limit = self.segments.first_id + len(self.segments) - skip_recent
+            d2 = self.segments.nearest(self.index.query(x, z, reach), limit, x, z, reach*reach)
+        return None if d2 is None else math.sqrt(d2)
+
+    def sweep(self, x0, z0, x1, z1, radius=BIKE_RADIUS, limit=None):
+        #the continuous version of collides(): a bike (a circle) moving from (x0, z0) to (x1, z1) in a straight line. returns the
+        #earliest time of impact t (0 at the start of the move, 1 at the end) with the trail, or None if it doesn't hit it.
+        #collides() only looks at where the bike ends up, so a bike that moves further than its own width in one tick (a low tick
+        #rate, or a slow frame) can jump straight over a segment. the sweep can't.
+        #limit leaves out the pieces with that id or newer (like skip_recent does, by default the SKIP_RECENT newest). a bike
+        #sweeping against its own trail has to leave out the pieces it laid during this very move too, or it would hit them at t=0
+        newest = self.newest_id
+        if limit is None: limit = newest + 1 - SKIP_RECENT
+        if limit <= self.segments.first_id: return None
+        dx, dz = x1 - x0, z1 - z0
+        #the cells under the whole move: a square around the middle of the move, big enough for both ends and the circle
+        mx, mz = (x0 + x1) / 2, (z0 + z1) / 2
+        reach = math.hypot(dx, dz) / 2 + radius
+        if self.runs is None:
+            return self.segments.first_hit(self.index.query(mx, mz, reach), limit, x0, z0, dx, dz, radius)
+        runs = self.runs
+        ids = self.index.query(mx, mz, reach + 2*self.tolerance)
+        if limit >= self.committed:
+            return runs.first_hit(ids, runs.first_id + len(runs), x0, z0, dx, dz, radius)
+        #the limit cuts into the runs: the runs made only of pieces from limit on are left out, and the run with piece limit in it
+        #is cut off where that piece starts
+        cut, pid, rid = runs.first_id + len(runs), self.committed, runs.first_id + len(runs) - 1
+        while rid >= runs.first_id and pid > limit:
+            pid -= self.run_pieces[rid % self.max_segments]
+            cut = rid
+            rid -= 1
+        best = runs.first_hit(ids, cut, x0, z0, dx, dz, radius)
+        if pid < limit and cut in ids:
+            ax, az = runs.get(cut)[:2]
+            bx, bz = self.segments.get(limit)[:2]
+            t = swept_circle_hit(ax, az, bx, bz, x0, z0, dx, dz, radius)
+            if t is not None and (best is None or t < best): best = t
+        return best
+
+# The state of one bike: where it is, where it is heading, how fast it goes and its trail
+class Bike:
+    def __init__(self, start, speed, turn_speed, max_speed=30.0):
+        self.name = ""                  #the bike's name in its Match ("player", "ai", ...), set by the Match
+        self.start = start              #(x, z, heading) the bike goes back to on reset()
+        self.start_speed = speed
+        self.speed = speed              #current speed of the bike
+        self.max_speed = max_speed      #maximum speed of the bike
+        self.turn_speed = turn_speed    #how fast the bike can turn (degrees per second)
+        self.x, self.z, self.heading = start
+        self.alive = True
+        self.cause = None               #why the bike died: "own_trail" or "rival_trail" (None while it is alive)
+        self.trail = Trail()
+
+    def forward(self):
+        #the unit vector (x, z) pointing in the direction the bike is heading (same as an ursina Entity's forward)
+        h = math.radians(self.heading)
+        return math.sin(h), math.cos(h)
+
+    def move(self, distance):
+        #moves the bike forward by distance and lets the trail follow it
+        fx, fz = self.forward()
+        self.x += fx * distance
+        self.z += fz * distance
+        self.trail.step(self.x, self.z)
+
+    def reset(self):
+        self.x, self.z, self.heading = self.start
+        self.speed = self.start_speed
+        self.alive = True
+        self.cause = None
+        self.trail.clear()
+
+    def die(self, cause=None):
+        self.alive = False
+        self.cause = cause
+
+class PlayerBike(Bike):
+    #the bike driven by the input stream: throttle is 1 (forward), 0 (neutral) or -1 (reverse) and steer is 1 (right), 0 or -1 (left)
+    def __init__(self, start=PLAYER_START):
+        super().__init__(start, speed=10.5, turn_speed=175.0)
+        self.accel = 1.3    #acceleration of the bike
+
+    def step(self, dt, throttle=0, steer=0):
+        if not self.alive: return
+        self.speed = min(self.max_speed, self.speed + self.accel * dt)
+        self.heading += steer * self.turn_speed * dt
+        self.move(throttle * self.speed * dt)
+
+class AIBike(Bike):
+    #the bike that has its own "brain": every think_interval seconds it picks a new speed and decides to go straight or turn,
+    #and it always turns if a sensor point `sensor` units in front of it is closer than wall_margin to the arena's walls (arena is
+    #the match's tron.arena shape, without one it is the square from -arena_bounds to +arena_bounds).
+    #all the random decisions come from the rng that is handed to it, so a match with a fixed seed always plays out the same way.
+    #the other arguments are the policy (the same names as in tron.batch, so the results of a sweep can be used in both):
+    #   think_min, think_max - the think timer is picked at random between these two (seconds)
+    #   p_straight           - the chance of going straight after thinking (turning left and right share the rest)
+    #   speed_jitter         - how much the speed can change every time the bike thinks
+    #   planner              - None for the random brain above, "flood" or "voronoi" to let a tron.planner.Planner pick the turns
+    #                          (the Match sets up self.brain for it, see Match.__init__)
+    #   brain                - a brain that thinks in a worker thread or process instead (the name of one in tron.brains.BRAINS,
+    #                          or a brain object, see tron.brains). it wins over planner
+    def __init__(self, rng, arena_bounds=ARENA_BOUNDS, start=AI_START, think_min=0.18, think_max=0.42, p_straight=0.7,
+                 sensor=7.0, wall_margin=5.0, speed_jitter=1.1, planner=None, brain=None, arena=None):
+        super().__init__(start, speed=11.0, turn_speed=170.0)
+        self.rng = rng
+        self.arena = arena or SquareArena(arena_bounds)
+        self.arena_bounds = self.arena.extent
+        self.think_min, self.think_max = think_min, think_max
+        self.p_straight = p_straight
+        self.sensor = sensor
+        self.wall_margin = wall_margin
+        self.speed_jitter = speed_jitter
+        self.planner = planner
+        self.worker_brain = brain
+        self.brain = None   #the Planner when planner is set (a tron.brains.AsyncBrain when brain is)
+        self.timer = 0.0
+        self.think_interval = rng.uniform(think_min, think_max)
+        self.turning = 0    #0 - go straight, 1 - turn to the right, -1 - turn to the left
+
+    def reset(self):
+        super().reset()
+        self.timer = 0.0
+        self.think_interval = self.rng.uniform(self.think_min, self.think_max)
+        self.turning = 0
+
+    def step(self, dt, throttle=0, steer=0):
+        #(throttle and steer are ignored, the ai drives itself. they are only here so that any bike can be stepped the same way)
+        if not self.alive: return
+        rng = self.rng
+        self.timer += dt
+        if self.brain and self.brain.danger(): self.timer = self.think_interval    #something is right ahead: think now
+        fx, fz = self.forward()
+        ax, az = self.x + fx*self.sensor, self.z + fz*self.sensor   #the sensor point ahead of the bike
+        near_wall = not self.arena.inside(ax, az, self.wall_margin)
+        if self.timer>=self.think_interval:
+            self.timer = 0.0
+            self.think_interval = rng.uniform(self.think_min, self.think_max)
+            self.speed = max(8.0, min(30.0, self.speed + rng.uniform(-self.speed_jitter, self.speed_jitter)))
+            if self.brain:
+                self.turning = self.brain.decide(self.think_interval)   #(the planner sees the walls on its grid too)
+            elif near_wall:
+                self.turning = rng.choice([-1,1])
+            else:
+                side = (1 - self.p_straight) / 2
+                self.turning = rng.choices([0,-1,1],[self.p_straight, side, side])[0]
+        if self.turning:
+            self.heading += self.turning * self.turn_speed * dt
+        self.move(self.speed * dt)
+
+def ring_starts(n, bounds=ARENA_BOUNDS):
+    #(x, z, heading) starts for n bikes spread evenly on a circle around the middle of the arena, all driving the same way round it
+    #(bounds is the radius of the biggest circle around the middle that fits in the arena, the arena's inner)
+    r = bounds * 0.55
+    starts = []
+    for k in range(n):
+        a = 2 * math.pi * k / n
+        starts.append((r * math.sin(a), r * math.cos(a), (math.degrees(a) + 90.0) % 360.0))
+    return starts
+
+# One whole match: the player's bike against the ai bike, or a whole roster of bikes against each other
+class Match:
+    #ai is a dict of AIBike policy arguments for the ai bike. if player_ai is given (also a dict, {} for the default policy) the
+    #player's bike is driven by an AIBike with that policy too and the input handed to step() is ignored (ai against ai)
+    #plan_nodes and plan_seconds are the ThinkBudget of every tick for the bikes with a planner (see tron.planner)
+    #roster replaces the two bikes above with any number of bikes (at least 2). it is a list of dicts, one per bike:
+    #   {"name": "player", "human": True}                   a bike driven by the input handed to step()
+    #   {"name": "red", "policy": {"planner": "flood"}}     an ai bike with those AIBike policy arguments
+    #each one can also have a "start": (x, z, heading), otherwise the bikes are spread out with ring_starts()
+    #ccd (continuous collision detection) sweeps every bike's circle along its whole move of the tick instead of only testing where
+    #it ends up (see Trail.sweep), so nothing is jumped over even with a big dt. with it off, a dt bigger than about 1/50 can let a
+    #bike at full speed (30 units/s) pass through a trail
+    #pool is the tron.brains.BrainPool the bikes with a brain think in. without one the match uses tron.brains.default_pool() (one
+    #thread shared by every such match of the process, and it waits for every answer, so that the match still only depends on its seed)
+    #arena is the shape of the arena (a tron.arena shape or its spec dict). without one it is the square from -bounds to +bounds,
+    #with one bounds is ignored and becomes the arena's extent (the half size of the square it fits in)
+    def __init__(self, seed=None, bounds=ARENA_BOUNDS, dt=DT, ai=None, player_ai=None, plan_nodes=2400, plan_seconds=None,
+                 roster=None, ccd=True, pool=None, arena=None):
+        self.arena = SquareArena(bounds) if arena is None else make_arena(arena)
+        self.bounds = bounds = self.arena.extent
+        self.dt = dt
+        self.ccd = ccd
+        self.seed = seed
+        self.rng = random.Random(seed)  #every random decision in the match comes from here (not from the global random module)
+        if roster is None:
+            player = {"name": "player", "start": PLAYER_START}
+            player.update({"human": True} if player_ai is None else {"policy": player_ai})
+            roster = [player, {"name": "ai", "start": AI_START, "policy": ai or {}}]
+        if len(roster) < 2: raise ValueError("a match needs at least 2 bikes")
+        self.roster = roster    #kept so that the same match can be set up again (tron.replay stores it in its files)
+        self.plan_nodes, self.plan_seconds = plan_nodes, plan_seconds
+        starts = ring_starts(len(roster), self.arena.inner)
+        self.bikes = []         #every bike of the match, in the order of the roster (they are stepped in this order too)
+        self.by_name = {}
+        for spec, start in zip(roster, starts):
+            start = spec.get("start", start)
+            if spec.get("human"):
+                bike = PlayerBike(start)
+            else:
+                bike = AIBike(self.rng, start=start, arena=self.arena, **spec.get("policy", {}))
+            bike.name = spec["name"]
+            if bike.name in self.by_name: raise ValueError(f"two bikes are called {bike.name!r}")
+            self.bikes.append(bike)
+            self.by_name[bike.name] = bike
+        self.tick = 0           #how many ticks have been simulated since the last reset
+        self.over = False
+        self.winner = None      #the name of the last bike left ("player" or "ai" in a normal match), or "draw" once the match is over
+        self.profiler = None    #a tron.profiler.FrameProfiler while the frame times are being measured (None the rest of the time)
+                                #(step() marks its phases "bookkeeping", "bikes" and "collisions", the profiler has to have them)
+        self.telemetry = None   #a tron.telemetry.Telemetry that gets every tick while the match's statistics are recorded (or None)
+        #the broadphase of the collision checks: every trail tells it where its segments are, under the bike's number in self.bikes
+        self.broadphase = TrailBroadphase()
+        for k, bike in enumerate(self.bikes): bike.trail.watchers.append(self.broadphase.watcher(k))
+        #the occupancy grid and the think budget only exist if one of the bikes plans with them (a brain in a worker sees a copy of
+        #the grid, and its fallback plans on it)
+        self.occupancy = None
+        self.think_budget = None
+        self.pool = pool
+        self.remote = []        #the tron.brains.AsyncBrain of every bike with a brain, the match hands them their answers
+        planners = [bike for bike in self.bikes if getattr(bike, "planner", None) or getattr(bike, "worker_brain", None)]
+        if planners:
+            self.occupancy = OccupancyGrid(bounds, arena=self.arena)
+            self.think_budget = ThinkBudget(plan_nodes, plan_seconds)
+            for bike in self.bikes: bike.trail.watchers.append(self.occupancy)   #every trail is an obstacle, not only the planner's own
+            for bike in planners:
+                if bike.worker_brain is not None:
+                    from .brains import AsyncBrain, default_pool    #(only imported when needed, it pulls in the worker pools)
+                    if self.pool is None: self.pool = default_pool()
+                    bike.brain = AsyncBrain(bike.worker_brain, self, bike, self.pool)
+                    self.remote.append(bike.brain)
+                    continue
+                rivals = [other for other in self.bikes if other is not bike]
+                bike.brain = Planner(self.occupancy, bike, rivals, self.think_budget, mode=bike.planner)
+
+    @property
+    def player(self):
+        #the bike called "player" (None if there is none)
+        return self.by_name.get("player")
+
+    @property
+    def ai(self):
+        return self.by_name.get("ai")
+
+    def reset(self, seed=None):
+        #starts a new match. with a seed the random decisions are restarted from that seed, otherwise they just carry on
+        if seed is not None:
+            self.seed = seed
+            self.rng.seed(seed)
+        #the shared grids are emptied in one go instead of taking every segment of every trail out of them one by one
+        self.broadphase.clear()
+        if self.occupancy: self.occupancy.clear()
+        for bike in self.bikes:
+            bike.trail.clear(notify=False)
+            bike.reset()
+        for brain in self.remote: brain.cancel()    #(the questions of the old match are of no use anymore)
+        self.tick = 0
+        self.over = False
+        self.winner = None
+
+    def keep_history(self):
+        #lets every trail keep the pieces it evicts from now on (see TrailHistory), so that restore() can go back to a snapshot()
+        for bike in self.bikes:
+            if bike.trail.history is None: bike.trail.history = TrailHistory()
+
+    def snapshot(self):
+        #the whole state of the match, like tron.replay's pack_state() but without copying the trails (see Trail.snapshot), so it
+        #costs the same however long they are. restore() can go back to it while the trails keep their history (keep_history())
+        #and the match isn't reset. tron.rewind keeps a ring of them. the statistics of the telemetry (if there is one) come along
+        bikes = []
+        for bike in self.bikes:
+            ai = (bike.timer, bike.think_interval, bike.turning) if isinstance(bike, AIBike) else None
+            bikes.append((bike.x, bike.z, bike.heading, bike.speed, bike.alive, bike.cause, ai, bike.trail.snapshot()))
+        stats = self.telemetry.snapshot(self) if self.telemetry else None
+        return self.tick, self.over, self.winner, self.rng.getstate(), tuple(bikes), stats
+
+    def restore(self, snapshot):
+        #puts the match back into the state of a snapshot() taken earlier in it. the trails take out (or put back) the pieces that
+        #changed since, in the shared grids too
+        self.tick, self.over, self.winner, rng, bikes, stats = snapshot
+        self.rng.setstate(rng)
+        for brain in self.remote: brain.cancel()
+        for bike, state in zip(self.bikes, bikes):
+            bike.x, bike.z, bike.heading, bike.speed, bike.alive, bike.cause, ai, trail = state
+            if ai: bike.timer, bike.think_interval, bike.turning = ai
+            bike.trail.restore(trail)
+        if self.telemetry: self.telemetry.restore(self, stats)
+
+    def forget(self, snapshot):
+        #the trails' histories drop what only snapshots older than this one needed (they won't be restored anymore)
+        for bike, state in zip(self.bikes, snapshot[4]):
+            if bike.trail.history is not None: bike.trail.history.forget(state[7][1])
+
+    def clamp(self, bike):
+        #keeps the bike's x and z inside the arena's walls
+        bike.x, bike.z = self.arena.clamp(bike.x, bike.z)
+
+    def check_collisions(self, moves=None):
+        #a bike dies when it runs into its own trail or into another bike's trail. the broadphase tells which trails have segments
+        #near the bike, and only those are checked (its own trail first, then the others in roster order). the broadphase has the
+        #pieces and a run can be up to 2*RUN_TOLERANCE away from them, so it is asked with that much more radius.
+        #moves is what step() hands over for the swept checks: for every bike (x, z) where the tick started and the id its trail's
+        #newest piece would need to be checked at the start of the tick (the pieces laid during the tick are left out)
+        if moves: return self.sweep_collisions(moves)
+        bikes = self.bikes
+        for k, bike in enumerate(bikes):
+            if not bike.alive: continue
+            near = self.broadphase.query(bike.x, bike.z, BIKE_RADIUS + 2*RUN_TOLERANCE)
+            if not near: continue
+            if k in near and bike.trail.collides(bike.x, bike.z):
+                bike.die("own_trail")
+                continue
+            for owner in sorted(near):
+                if owner != k and bikes[owner].trail.collides(bike.x, bike.z):
+                    bike.die("rival_trail")
+                    break
+
+    def clearance(self, bike, reach):
+        #how close the middle of bike is to the nearest trail of another bike, or None if there is none within reach. (its own trail
+        #is left out: the first piece collides() checks is always right behind it, so it would always be the nearest)
+        near = self.broadphase.query(bike.x, bike.z, reach + 2*RUN_TOLERANCE)
+        best = None
+        for owner in near:
+            if self.bikes[owner] is bike: continue
+            d = self.bikes[owner].trail.clearance(bike.x, bike.z, reach)
+            if d is not None and (best is None or d < best): best = d
+        return best
+
+    def sweep_collisions(self, moves):
+        #the ccd version of check_collisions(): every bike's circle is swept from where it was at the start of the tick to where it
+        #is now, against its own trail (without the pieces it laid this tick) and the others, and the earliest hit decides the cause
+        bikes = self.bikes
+        for k, bike in enumerate(bikes):
+            if not bike.alive: continue
+            (x0, z0), own_limit = moves[k]
+            dx, dz = bike.x - x0, bike.z - z0
+            near = self.broadphase.query(x0 + dx/2, z0 + dz/2, math.hypot(dx, dz)/2 + BIKE_RADIUS + 2*RUN_TOLERANCE)
+            if not near: continue
+            best, cause = None, None
+            for owner in sorted(near, key=lambda o: (o != k, o)):   #(its own trail first, so it wins a tie like above)
+                if owner == k: t = bike.trail.sweep(x0, z0, bike.x, bike.z, limit=own_limit)
+                else: t = bikes[owner].trail.sweep(x0, z0, bike.x, bike.z)
+                if t is not None and (best is None or t < best):
+                    best, cause = t, "own_trail" if owner == k else "rival_trail"
+            if cause: bike.die(cause)
+
+    def end_game(self):
+        #works out who won once at most one bike is left
+        if self.over: return
+        alive = [bike for bike in self.bikes if bike.alive]
+        if len(alive) > 1: return
+        self.over = True
+        self.winner = alive[0].name if alive else "draw"    #(a draw when the last bikes all crash on the same tick)
+
+    def step(self, throttle=0, steer=0, inputs=None):
+        #advances the match by one fixed tick. the human bikes get (throttle, steer), or their own pair from inputs (a dictionary of
+        #bike name -> (throttle, steer)) if they are in it. the ai bikes ignore both
+        if self.over: return
+        dt = self.dt
+        prof = self.profiler
+        if prof: prof.mark("bookkeeping")   #what the caller did since its last mark (game.py: its views, recorder and rewind)
+        if self.think_budget: self.think_budget.start_tick()
+        for brain in self.remote: brain.apply(self.tick)    #the answers of the brains in the workers that came in since the last tick
+        moves = [((bike.x, bike.z), bike.trail.newest_id + 1 - SKIP_RECENT) for bike in self.bikes] if self.ccd else None
+        for bike in self.bikes:
+            if inputs and bike.name in inputs:
+                bike.step(dt, *inputs[bike.name])
+            else:
+                bike.step(dt, throttle, steer)
+            self.clamp(bike)
+        if prof: prof.mark("bikes")
+        self.check_collisions(moves)
+        self.end_game()
+        if prof: prof.mark("collisions")
+        self.tick += 1
+        if self.telemetry:
+            self.telemetry.tick(self)
+            if prof: prof.mark("bookkeeping")
+
+    def run(self, inputs=(), max_ticks=TICK_RATE*600):
+        #runs the match until it is over or max_ticks have gone by. inputs is an iterable of (throttle, steer) pairs, one per tick.
+        #once it runs out the player keeps its last input. returns the winner (None if nobody has crashed yet)
+        last = (0, 0)
+        it = iter(inputs)
+        while not self.over and self.tick < max_ticks:
+            last = next(it, last)
+            self.step(*last)
+        return self.winner
@@ -0,0 +1,299 @@
+#match and frame statistics of real sessions, written to files in the background (for looking at how matches actually go: who
+#wins, how long they take, how fast the bikes drive, how close they come to the other trails, and the slow frames).
+#   telemetry = Telemetry("telemetry")      #a folder, the files go in there
+#   match.telemetry = telemetry             #the match hands it every tick (Match.step), None switches it off again
+#   telemetry.frame(dt)                     #game.py hands it every frame time (only the spikes are kept)
+#   telemetry.end(match)                    #a match that stops before it is over (its summary is written right away)
+#   match.restore(snapshot)                 #a match that goes back (tron.rewind) takes its statistics back too (see restore)
+#   telemetry.close()                       #writes what is left and stops the writer
+#nothing is written on the game's thread. what it records goes into Tables: rows of numbers in flat arrays that are made once at
+#the start, and a full one is handed to the writer thread, which turns it into a line of the file and hands the array back to be
+#filled again. if the writer ever falls so far behind that no array is free, the rows are dropped (and counted) instead of waiting.
+#the game's thread only does a little work per tick: every `every` ticks a sample of every bike (its position, speed, and how close
+#the nearest trail of another bike is, see Match.clearance) and once per match its summary. self.busy adds up the time all of that
+#took (bench.py measures match.step with it too).
+#the files are line-delimited json ("ndjson", one object per line), and a file that reaches max_bytes is closed and the next one
+#started (only the newest keep of them are kept):
+#   {"table": "samples", "columns": ["match", "tick", ...], "rows": 512, "data": [[...], [...], ...]}   a batch, one list per column
+#   {"table": "matches", "match": 3, "winner": "ai", "ticks": 1520, ...}                                   a match's summary
+import json
+import math
+import os
+import queue
+import threading
+import time
+from array import array
+
+SAMPLE_COLUMNS = ("match", "tick", "bike", "x", "z", "speed", "clearance")  #clearance is -1 when no trail is within NEAR_MISS
+SPIKE_COLUMNS = ("match", "tick", "frame_ms")
+NEAR_MISS = 3.0     #how far from a bike the trails are looked for (a trail further away than that isn't a near miss)
+
+# Rows of numbers, written into arrays that were made up front
+class Table:
+    #columns are the names of the columns, the first ints of them are whole numbers (the rest are rounded to 3 decimals in the file).
+    #every array holds rows rows, and there are buffers of them: one being filled and the others waiting for (or in) the writer
+    def __init__(self, name, columns, ints=0, rows=512, buffers=4):
+        self.name = name
+        self.columns = tuple(columns)
+        self.ints = ints
+        self.width = len(self.columns)
+        self.rows = rows
+        self.free = queue.SimpleQueue()     #the arrays the writer handed back
+        for _ in range(buffers - 1): self.free.put(array('d', bytes(8 * self.width * rows)))
+        self.buffer = array('d', bytes(8 * self.width * rows))  #the array being filled (None while none was free)
+        self.count = 0          #how many rows of it are filled
+        self.dropped = 0        #how many rows had to be dropped
+        self.out = None         #the writer's queue (set by Telemetry)
+
+    def row(self):
+        #the array and the position in it of a new row: write the row's columns at position, position+1... returns (None, 0) when the
+        #row has to be dropped
+        if self.count == self.rows: self.send()
+        buffer = self.buffer
+        if buffer is None:
+            try:
+                buffer = self.buffer = self.free.get_nowait()
+            except queue.Empty:
+                self.dropped += 1
+                return None, 0
+        position = self.count * self.width
+        self.count += 1
+        return buffer, position
+
+    def send(self):
+        #hands the rows filled so far to the writer
+        if not self.count: return
+        self.out.put((self, self.buffer, self.count))
+        self.buffer = None
+        self.count = 0
+
+    def batch(self, buffer, count):
+        #the json object of count rows of buffer (on the writer's thread)
+        w = self.width
+        data = [buffer[c:count*w:w].tolist() for c in range(w)]
+        for c in range(self.ints): data[c] = [int(v) for v in data[c]]
+        for c in range(self.ints, w): data[c] = [round(v, 3) for v in data[c]]
+        return {"table": self.name, "columns": self.columns, "rows": count, "data": data}
+
+# The statistics of one match while it is going on
+class MatchStats:
+    #one item per bike in every list: the distance it drove, its top speed, the sum of its sampled speeds, how many samples it had,
+    #its closest miss, where it was when last sampled and if it was already sampled dead. frames and spikes are the telemetry's
+    #counts when the match started (its summary has the frames since then), tick is the match's tick at its last sample
+    def __init__(self, number, match, telemetry):
+        n = len(match.bikes)
+        self.number = number
+        self.distance, self.top_speed, self.speed_sum = [0.0] * n, [0.0] * n, [0.0] * n
+        self.sampled, self.closest, self.dead = [0] * n, [math.inf] * n, [False] * n
+        self.last = [(bike.x, bike.z) for bike in match.bikes]
+        self.tick = match.tick
+        self.frames, self.spikes = telemetry.frames, telemetry.spike_count
+        self.worst = 0.0
+        self.started = telemetry.clock()
+
+# The statistics of matches and frames, and the thread that writes them
+class Telemetry:
+    #folder is where the files go, every is how many ticks apart the bike samples are, spike is the frame time (seconds) from which
+    #a frame counts as a spike. max_bytes and keep are the rotation of the files (see the top).
+    #any number of matches can hand it their ticks at the same time (every one gets its own MatchStats)
+    def __init__(self, folder, every=4, spike=1/30, max_bytes=8_000_000, keep=10, clock=time.perf_counter):
+        self.folder = folder
+        self.every = every
+        self.spike = spike
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.clock = clock
+        self.queue = queue.SimpleQueue()    #what the game's thread hands to the writer: (table, array, rows), a dict, or None to stop
+        self.samples = Table("samples", SAMPLE_COLUMNS, ints=3)
+        self.spikes = Table("spikes", SPIKE_COLUMNS, ints=2, rows=64)
+        self.tables = (self.samples, self.spikes)
+        for table in self.tables: table.out = self.queue
+        self.matches = 0        #how many matches were started (the match numbers of the rows count up)
+        self.current = {}       #match -> the MatchStats of every match that is going on
+        self.restarted = {}     #match -> the number of a match that went back to before its first sample (it keeps its number)
+        self.latest = None      #the MatchStats of the match that had the last tick (the frames are filed under it) and its tick
+        self.tick_now = 0
+        self.frames, self.spike_count = 0, 0    #every frame() so far, and how many of them were spikes
+        self.busy = 0.0         #the seconds tick() and frame() took on the game's thread, all together
+        self.calls = 0          #how many tick() and frame() calls that was
+        #the writer's side
+        self.file = None
+        self.file_bytes = 0
+        self.files = []         #the files that are kept, oldest first
+        self.rotations = 0      #how many files were started
+        self.written = 0        #how many lines were written
+        os.makedirs(folder, exist_ok=True)
+        self.writer = threading.Thread(target=self.write_loop, name="telemetry", daemon=True)
+        self.writer.start()
+
+    def tick(self, match):
+        #called by Match.step() after every tick
+        t = match.tick
+        stats = self.current.get(match)
+        self.latest, self.tick_now = stats, t
+        if t % self.every and not match.over: return
+        start = self.clock()
+        if stats is None or t <= stats.tick:    #(a new match, or the match was reset: a restore() goes back with its statistics)
+            number = self.restarted.pop(match, None)
+            if number is None:
+                self.matches += 1
+                number = self.matches
+            stats = self.current[match] = self.latest = MatchStats(number, match, self)
+        stats.tick = t
+        self.sample(match, stats)
+        if match.over: self.summary(match, stats)
+        self.busy += self.clock() - start
+        self.calls += 1
+
+    def sample(self, match, stats):
+        #a row of samples per bike (a dead one gets one more, where it crashed), and its statistics
+        m, t = stats.number, match.tick
+        table = self.samples
+        for k, bike in enumerate(match.bikes):
+            if stats.dead[k]: continue
+            if not bike.alive: stats.dead[k] = True
+            x, z = bike.x, bike.z
+            lx, lz = stats.last[k]
+            stats.distance[k] += math.hypot(x - lx, z - lz)
+            stats.last[k] = (x, z)
+            speed = bike.speed if bike.alive else 0.0
+            if speed > stats.top_speed[k]: stats.top_speed[k] = speed
+            stats.speed_sum[k] += speed
+            stats.sampled[k] += 1
+            near = match.clearance(bike, NEAR_MISS) if bike.alive else None
+            if near is not None and near < stats.closest[k]: stats.closest[k] = near
+            buffer, p = table.row()
+            if buffer is None: continue
+            buffer[p], buffer[p+1], buffer[p+2], buffer[p+3], buffer[p+4], buffer[p+5] = m, t, k, x, z, speed
+            buffer[p+6] = -1.0 if near is None else near
+
+    def summary(self, match, stats):
+        #the match is over: its rows go to the writer and its summary after them
+        del self.current[match]
+        if self.latest is stats: self.latest = None
+        bikes = []
+        for k, bike in enumerate(match.bikes):
+            bikes.append({"name": bike.name, "cause": bike.cause, "distance": round(stats.distance[k], 2),
+                          "top_speed": round(stats.top_speed[k], 2),
+                          "mean_speed": round(stats.speed_sum[k] / max(1, stats.sampled[k]), 2),
+                          "closest_miss": None if stats.closest[k] == math.inf else round(stats.closest[k], 3)})
+        for table in self.tables: table.send()
+        self.queue.put({"table": "matches", "match": stats.number, "time": time.time(), "seed": match.seed, "winner": match.winner,
+                        "ticks": match.tick, "seconds": round(match.tick * match.dt, 3),
+                        "wall_seconds": round(self.clock() - stats.started, 3), "arena": match.arena.spec, "bikes": bikes,
+                        "frames": self.frames - stats.frames, "spikes": self.spike_count - stats.spikes,
+                        "worst_frame_ms": round(stats.worst * 1e3, 2)})
+
+    def snapshot(self, match):
+        #the statistics of match so far, for restore() (Match.snapshot() takes them along). None if it has none
+        stats = self.current.get(match)
+        if stats is None: return None
+        return stats.number, stats.tick, [list(v) for v in (stats.distance, stats.top_speed, stats.speed_sum, stats.sampled,
+                                                            stats.closest, stats.dead, stats.last)]
+
+    def restore(self, match, state):
+        #match went back to a snapshot() (Match.restore calls this): its statistics go back to what they were then, so the ticks that
+        #are played again aren't counted twice. (their sample rows that were written already stay in the files, with the ticks played
+        #again after them.) a match that was over goes on under its number and gets another summary when it is over again, the
+        #last one counts. None (no statistics at the snapshot) starts them again at the next sample, under the same number
+        stats = self.current.get(match)
+        if state is None:
+            if stats is not None:
+                del self.current[match]
+                if self.latest is stats: self.latest = None
+                self.restarted[match] = stats.number
+            return
+        number, tick, values = state
+        if stats is None or stats.number != number: stats = self.current[match] = MatchStats(number, match, self)
+        stats.tick = tick
+        (stats.distance, stats.top_speed, stats.speed_sum, stats.sampled, stats.closest, stats.dead,
+         stats.last) = [list(v) for v in values]    #(a copy, the same snapshot can be restored again)
+        self.latest = stats
+
+    def end(self, match):
+        #for a match that stops without being over (a host's max_ticks, a match that is thrown away): writes its summary now (its
+        #winner is None) and forgets it. a match that is over already had its summary
+        self.restarted.pop(match, None)
+        stats = self.current.get(match)
+        if stats is not None: self.summary(match, stats)
+
+    def frame(self, dt):
+        #called by the game every frame with its frame time (seconds). only the frames of spike or more get a row, filed under the
+        #match that had the last tick (match 0 if there is none going on)
+        self.frames += 1
+        stats = self.latest
+        if stats and dt > stats.worst: stats.worst = dt
+        if dt < self.spike: return
+        start = self.clock()
+        self.spike_count += 1
+        buffer, p = self.spikes.row()
+        if buffer is not None: buffer[p], buffer[p+1], buffer[p+2] = stats.number if stats else 0, self.tick_now, dt * 1e3
+        self.busy += self.clock() - start
+        self.calls += 1
+
+    def flush(self):
+        #hands every row recorded so far to the writer (it writes them soon after, not right away)
+        for table in self.tables: table.send()
+
+    def close(self):
+        #writes everything that is left (and the summaries of the matches that aren't over yet, their winner is None) and waits for
+        #the writer to finish
+        if not self.writer.is_alive(): return
+        for match, stats in list(self.current.items()): self.summary(match, stats)
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+
+    def stats(self):
+        #how the telemetry itself is doing: its time on the game's thread, the dropped rows, what was written
+        return {"busy_ms": self.busy * 1e3, "mean_us": self.busy / max(1, self.calls) * 1e6, "calls": self.calls,
+                "dropped": sum(table.dropped for table in self.tables), "lines": self.written, "files": list(self.files)}
+
+    # The writer thread
+    def write_loop(self):
+        #takes everything that is waiting and writes it as one batch of lines (one write and one flush per batch)
+        while True:
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for item in items:
+                if item is None:
+                    stop = True
+                elif isinstance(item, dict):
+                    lines.append(json.dumps(item, separators=(",", ":")))
+                else:
+                    table, buffer, count = item
+                    lines.append(json.dumps(table.batch(buffer, count), separators=(",", ":")))
+                    table.free.put(buffer)      #(the game's thread can fill it again)
+            if lines: self.write("\n".join(lines) + "\n")
+            if stop: break
+        if self.file: self.file.close()
+        self.file = None
+
+    def write(self, text):
+        data = text.encode()
+        if self.file is None or self.file_bytes + len(data) > self.max_bytes and self.file_bytes: self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.file_bytes += len(data)
+        self.written += text.count("\n")
+
+    def rotate(self):
+        #closes the file and starts the next one, and deletes the oldest ones beyond keep
+        if self.file: self.file.close()
+        path = os.path.join(self.folder, time.strftime("telemetry_%Y%m%d_%H%M%S") + f"_{self.rotations:03d}.ndjson")
+        self.file = open(path, "wb")
+        self.file_bytes = 0
+        self.rotations += 1
+        self.files.append(path)
+        while len(self.files) > self.keep:
+            old = self.files.pop(0)
+            try:
+                os.remove(old)
+            except OSError:
+                pass
@@ -0,0 +1,166 @@
+#runs a whole tournament of headless ai against ai matches on every cpu core and streams the results to disk.
+#usage (from the folder that has the tron package in it):
+#   python -m tron.tournament --games 200 --out results.jsonl
+#       round robin between the built in ENTRANTS (every pair plays --games matches, half of them on each side of the arena)
+#   python -m tron.tournament --entrants bots.json --games 100
+#       round robin between your own entrants: a json object of {"name": {policy arguments of AIBike}}
+#   python -m tron.tournament --sweep sensor=5,7,9 --sweep p_straight=0.6,0.7,0.8 --games 100
+#       parameter sweep: every combination of the values plays --games matches against the default ai
+#
+#every match gets its own seed worked out from --seed and the match's number, so any single match can be played again on its own
+#with Match(seed=..., player_ai=..., ai=...) and it turns out exactly the same, no matter how many workers ran the tournament.
+#the workers only send a short tuple back for every match. the main process writes each one as a json line to --out as soon as it
+#arrives and rewrites the standings to --summary every --flush matches, so a long tournament can be watched (or stopped) halfway.
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+from .sim import TICK_RATE, Match
+
+#the entrants of the default round robin: a few variations of the stock ai policy
+ENTRANTS = {
+    "default": {},
+    "calm": {"think_min": 0.3, "think_max": 0.6, "p_straight": 0.8},
+    "twitchy": {"think_min": 0.1, "think_max": 0.25, "p_straight": 0.55},
+    "cautious": {"sensor": 10.0, "wall_margin": 8.0},
+    "flood": {"planner": "flood"},
+    "voronoi": {"planner": "voronoi"},
+}
+
+FIELDS = ("match", "seed", "a", "b", "winner", "ticks", "cause_a", "cause_b")   #what is in one result record (in this order)
+
+def match_seed(base_seed, index):
+    #the seed of match number index. (a large odd multiplier spreads the seeds of neighbouring matches apart, the & keeps it 64 bit)
+    return (base_seed * 0x9E3779B97F4A7C15 + index) & 0xFFFFFFFFFFFFFFFF
+
+def play(job):
+    #plays one match in a worker process. job is (index, seed, name_a, policy_a, name_b, policy_b, max_ticks)
+    #bike "a" drives on the player's side of the arena and "b" on the ai's side. returns a compact tuple in the order of FIELDS
+    index, seed, name_a, policy_a, name_b, policy_b, max_ticks = job
+    match = Match(seed=seed, player_ai=policy_a, ai=policy_b)
+    winner = match.run(max_ticks=max_ticks)
+    if winner == "player": winner = name_a
+    elif winner == "ai": winner = name_b
+    #(winner stays "draw" if both crashed on the same tick, or None if nobody crashed before max_ticks)
+    return (index, seed, name_a, name_b, winner, match.tick, match.player.cause, match.ai.cause)
+
+def round_robin(entrants, games):
+    #every pair of entrants plays games matches, and they swap sides every match so the start positions are fair
+    for name_a, name_b in itertools.combinations(entrants, 2):
+        for g in range(games):
+            yield (name_a, name_b) if g % 2 == 0 else (name_b, name_a)
+
+def parse_sweep(specs):
+    #turns ["sensor=5,7", "p_straight=0.6,0.8"] into entrants for every combination: {"sensor=5,p_straight=0.6": {...}, ...}
+    axes = []
+    for spec in specs:
+        key, _, values = spec.partition("=")
+        if not values: raise SystemExit(f"--sweep needs name=value,value,... (got {spec!r})")
+        axes.append([(key.strip(), float(v)) for v in values.split(",")])
+    entrants = {}
+    for combo in itertools.product(*axes):
+        entrants[",".join(f"{k}={v:g}" for k, v in combo)] = dict(combo)
+    return entrants
+
+def sweep(entrants, games):
+    #every entrant of the sweep plays games matches against the stock ai, half of them on each side
+    for name in entrants:
+        for g in range(games):
+            yield (name, "baseline") if g % 2 == 0 else ("baseline", name)
+
+class Standings:
+    #the running totals of the tournament, updated with every result that arrives
+    def __init__(self, names):
+        self.matches = 0
+        self.ticks = 0
+        self.unfinished = 0     #matches that hit max_ticks without anybody crashing
+        self.table = {name: {"played": 0, "wins": 0, "losses": 0, "draws": 0, "own_trail": 0, "rival_trail": 0} for name in names}
+
+    def add(self, record):
+        _, _, a, b, winner, ticks, cause_a, cause_b = record
+        self.matches += 1
+        self.ticks += ticks
+        if winner is None: self.unfinished += 1
+        for name, cause in ((a, cause_a), (b, cause_b)):
+            row = self.table[name]
+            row["played"] += 1
+            if winner == "draw": row["draws"] += 1
+            elif winner == name: row["wins"] += 1
+            elif winner is not None: row["losses"] += 1
+            if cause: row[cause] += 1
+
+    def summary(self, elapsed):
+        rows = {}
+        for name, row in self.table.items():
+            played = row["played"] or 1
+            rows[name] = dict(row, win_rate=round(row["wins"] / played, 4))
+        return {
+            "matches": self.matches,
+            "unfinished": self.unfinished,
+            "mean_ticks": round(self.ticks / max(1, self.matches), 1),
+            "elapsed": round(elapsed, 2),
+            "matches_per_second": round(self.matches / max(elapsed, 1e-9), 1),
+            "standings": dict(sorted(rows.items(), key=lambda item: -item[1]["win_rate"])),
+        }
+
+def write_summary(path, summary):
+    #writes to a temporary file first and then swaps it in, so whoever is reading the summary never sees half of it
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp, path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tron.tournament", description="Run headless ai against ai Tron matches on every core.")
+    parser.add_argument("--entrants", help="json file of {name: {AIBike policy arguments}} for the round robin")
+    parser.add_argument("--sweep", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="sweep an AIBike policy argument against the default ai (can be given more than once)")
+    parser.add_argument("--games", type=int, default=100, help="matches per pairing (default 100)")
+    parser.add_argument("--seed", type=int, default=0, help="base seed of the tournament (default 0)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: all cores)")
+    parser.add_argument("--max-ticks", type=int, default=TICK_RATE*600, help="a match is called off after this many ticks")
+    parser.add_argument("--out", default="tournament.jsonl", help="file the result of every match is streamed to")
+    parser.add_argument("--summary", default=None, help="file the standings are written to (default: OUT with .summary.json)")
+    parser.add_argument("--flush", type=int, default=200, help="rewrite the summary every this many matches")
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        entrants = parse_sweep(args.sweep)
+        entrants["baseline"] = {}
+        pairings = sweep([name for name in entrants if name != "baseline"], args.games)
+    else:
+        if args.entrants:
+            with open(args.entrants) as f: entrants = json.load(f)
+        else:
+            entrants = ENTRANTS
+        if len(entrants) < 2: raise SystemExit("a round robin needs at least two entrants")
+        pairings = round_robin(list(entrants), args.games)
+    summary_path = args.summary or os.path.splitext(args.out)[0] + ".summary.json"
+
+    #the jobs are made lazily, so even a tournament of millions of matches does not have to be held in memory at once
+    jobs = ((i, match_seed(args.seed, i), a, entrants[a], b, entrants[b], args.max_ticks) for i, (a, b) in enumerate(pairings))
+    standings = Standings(entrants)
+    start = time.perf_counter()
+    with open(args.out, "w") as out, multiprocessing.Pool(args.workers) as pool:
+        #imap_unordered hands back each result as soon as it is done. handing the jobs out in chunks keeps the workers busy
+        #without sending a message back and forth for every single (short) match
+        for record in pool.imap_unordered(play, jobs, chunksize=16):
+            out.write(json.dumps(dict(zip(FIELDS, record))) + "\n")
+            standings.add(record)
+            if standings.matches % args.flush == 0:
+                out.flush()
+                write_summary(summary_path, standings.summary(time.perf_counter() - start))
+    summary = standings.summary(time.perf_counter() - start)
+    write_summary(summary_path, summary)
+
+    print(f"{summary['matches']} matches in {summary['elapsed']}s ({summary['matches_per_second']} matches/s, "
+          f"mean {summary['mean_ticks']} ticks) with {args.workers} workers")
+    for name, row in summary["standings"].items():
+        print(f"  {name:<28} win rate {row['win_rate']:.3f}  ({row['wins']}W {row['losses']}L {row['draws']}D of {row['played']})")
+    return summary
+
+if __name__ == "__main__":
+    main()